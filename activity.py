@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, insert, literal, null, or_, select
+from sqlalchemy.orm import joinedload
+from models import db, ActivityEvent, ForumPost, ForumReply, Photo, PhotoTag, Video, Location
+from pagination import keyset_paginate
+from cache import invalidate_fragments
+
+SUMMARY_LENGTH = 200
+
+
+def record_event(event_type, actor_id, subject_id=None, parent_id=None, target_user_id=None, summary=None):
+    """Add a feed event to the current transaction; cached feed pages are dropped once it commits"""
+    db.session.add(ActivityEvent(
+        event_type=event_type,
+        actor_id=actor_id,
+        target_user_id=target_user_id,
+        subject_id=subject_id,
+        parent_id=parent_id,
+        summary=(summary or '')[:SUMMARY_LENGTH] or None
+    ))
+    invalidate_fragments(db.session, 'activity')
+
+
+def remove_events(*criteria):
+    """Delete the feed events matching any of `criteria` (for content that is being deleted)"""
+    ActivityEvent.query.filter(or_(*criteria)).delete(synchronize_session=False)
+    invalidate_fragments(db.session, 'activity')
+
+
+def photo_event_criteria(photo_ids):
+    """Events about these photos: the uploads and the tags on them"""
+    return (
+        (ActivityEvent.event_type == 'photo') & ActivityEvent.subject_id.in_(photo_ids),
+        (ActivityEvent.event_type == 'tag') & ActivityEvent.parent_id.in_(photo_ids),
+    )
+
+
+def record_location_events(rows):
+    """Feed events for buffered position updates, at most one per member per ACTIVITY_LOCATION_INTERVAL"""
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['ACTIVITY_LOCATION_INTERVAL'])
+    recent = {actor_id for actor_id, in db.session.query(ActivityEvent.actor_id).filter(
+        ActivityEvent.actor_id.in_([row['user_id'] for row in rows]),
+        ActivityEvent.created_at >= cutoff,
+        ActivityEvent.event_type == 'location'
+    ).distinct()}
+    events = [{
+        'event_type': 'location',
+        'actor_id': row['user_id'],
+        'summary': (row.get('address') or '')[:SUMMARY_LENGTH] or None,
+        'created_at': row['updated_at'],
+    } for row in rows if row['user_id'] not in recent]
+    if events:
+        db.session.execute(insert(ActivityEvent), events)
+        invalidate_fragments(db.session, 'activity')
+    return len(events)
+
+
+def feed_page(cursor=None, per_page=30):
+    """One page of the feed, newest first: a single range read of the (created_at, id) index.
+
+    Actor and tagged member come from the same query through joins, so a page
+    costs one statement however many kinds of events it holds.
+    """
+    return keyset_paginate(
+        ActivityEvent.query.options(joinedload(ActivityEvent.actor), joinedload(ActivityEvent.target_user)),
+        (ActivityEvent.created_at, ActivityEvent.id),
+        cursor=cursor,
+        per_page=per_page
+    )
+
+
+def rebuild_activity(connection):
+    """Recreate the feed from the existing posts, replies, photos, videos, tags and locations"""
+    events = ActivityEvent.__table__
+    posts, replies, photos, videos, tags, locations = (
+        model.__table__ for model in (ForumPost, ForumReply, Photo, Video, PhotoTag, Location)
+    )
+
+    def summary(column):
+        return func.substr(column, 1, SUMMARY_LENGTH)
+
+    sources = [
+        select(literal('post'), posts.c.user_id, null(), posts.c.id, null(),
+               summary(posts.c.title), posts.c.created_at),
+        select(literal('reply'), replies.c.user_id, null(), replies.c.id, replies.c.post_id,
+               summary(posts.c.title), replies.c.created_at).join(posts, posts.c.id == replies.c.post_id),
+        select(literal('photo'), photos.c.user_id, null(), photos.c.id, null(),
+               summary(photos.c.caption), photos.c.uploaded_at),
+        select(literal('video'), videos.c.user_id, null(), videos.c.id, null(),
+               summary(videos.c.title), videos.c.uploaded_at),
+        # Who placed a tag was never stored; credit existing tags to the photo owner
+        select(literal('tag'), photos.c.user_id, tags.c.tagged_user_id, tags.c.id, tags.c.photo_id,
+               null(), tags.c.created_at).join(photos, photos.c.id == tags.c.photo_id),
+        select(literal('location'), locations.c.user_id, null(), null(), null(),
+               summary(locations.c.address), locations.c.updated_at),
+    ]
+    connection.execute(delete(events))
+    columns = ['event_type', 'actor_id', 'target_user_id', 'subject_id', 'parent_id', 'summary', 'created_at']
+    for source in sources:
+        connection.execute(insert(events).from_select(columns, source))
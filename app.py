@@ -1,53 +1,99 @@
+import math
 import os
+import click
 import cloudinary
 import cloudinary.api
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, render_template, redirect, url_for, flash, request, jsonify
+from markupsafe import Markup
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_wtf.csrf import CSRFProtect
-from config import Config
-from models import db, User, Photo, PhotoTag, Video, ForumPost, ForumReply, Message, Location
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
+from config import Config, engine_options
+from models import (db, User, Photo, PhotoTag, Video, ForumPost, ForumReply, Message, MediaDeletion,
+                    ActivityEvent)
 from forms import (RegistrationForm, LoginForm, ProfileForm, PhotoUploadForm, 
-                   VideoForm, ForumPostForm, ForumReplyForm, MessageForm, LocationForm)
-from utils import save_uploaded_file, extract_youtube_id, get_youtube_embed_url
-
-app = Flask(__name__)
-app.config.from_object(Config)
-
-# Initialize extensions
-db.init_app(app)
-csrf = CSRFProtect(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+                   VideoForm, ForumPostForm, ForumReplyForm, MessageForm, LocationForm,
+                   PeopleSearchForm, SiteSearchForm, SCHOOL_CHOICES)
+from utils import extract_youtube_id, get_youtube_embed_url
+from media import (spool_upload, claim_photo_spool, recover_uploads, enqueue_photo_upload, enqueue_profile_photo_upload, queue_media_deletion,
+                   schedule_media_deletions, process_media_deletions, upload_queue, deletion_queue)
+from pagination import keyset_paginate, encode_cursor
+from media_urls import media_url, media_img_attrs, url_cache_stats
+from directory import search_people, autocomplete_users
+from activity import record_event, remove_events, photo_event_criteria, feed_page
+from forum import SORT_COLUMNS, post_page, reply_page, reply_cursor, record_reply, refresh_reply_stats
+from hobbies import parse_hobbies, sync_user_hobbies, popular_hobbies, similar_members
+from locations import map_points, location_buffer
+from cache import (load_cached_user, invalidate_user, user_cache, fragment_cache, invalidate_fragments,
+                   MEMBER_FRAGMENTS)
+from instrumentation import init_instrumentation
+from dbpool import pool_stats
+from video_metadata import schedule_metadata_refresh, metadata_queue
+from replicas import init_replicas, use_primary
+from realtime import event_hub, publish_event, sse_stream, user_channel, post_channel
+from ratelimit import init_rate_limits
+import search
+from inbox import inbox_threads, conversation_messages, mark_conversation_read, increment_unread, decrement_unread
+
+bp = Blueprint('main', __name__, cli_group=None)
+
+csrf = CSRFProtect()
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
 login_manager.login_message = 'Bu sayfaya erişmek için giriş yapmalısınız.'
 
-# Initialize Cloudinary
-cloudinary.config(
-    cloud_name=app.config['CLOUDINARY_CLOUD_NAME'],
-    api_key=app.config['CLOUDINARY_API_KEY'],
-    api_secret=app.config['CLOUDINARY_API_SECRET']
-)
-
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
-
-# Create database tables on startup (for production deployment)
-with app.app_context():
-    db.create_all()
+    # Slim cached identity instead of the full row on every request
+    return load_cached_user(int(user_id))
+
+@bp.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Apply pending schema migrations (run once per deploy, not per worker)"""
+    from migrations import upgrade, current_version
+    applied = upgrade()
+    for version, description in applied:
+        print(f"Applied migration {version}: {description}")
+    print(f"Database schema is at version {current_version()}")
+
+@bp.cli.command('media-deletions')
+@click.option('--all', 'include_exhausted', is_flag=True, help='Also retry rows that used up their attempts')
+def media_deletions_command(include_exhausted):
+    """Drain the media deletion outbox (e.g. from cron, or after an outage)"""
+    deleted = process_media_deletions(current_app._get_current_object(), include_exhausted=include_exhausted)
+    print(f"Deleted {deleted} media assets")
+
+@bp.cli.command('media-recover')
+@click.option('--older-than', default=30, show_default=True, help='Minutes a photo may stay pending')
+def media_recover_command(older_than):
+    """Requeue or fail photo uploads lost in a worker restart, and clear old spool files"""
+    requeued, failed, removed = recover_uploads(current_app._get_current_object(), older_than=older_than * 60)
+    # The queues' threads belong to this process; let them finish before it exits
+    upload_queue.join()
+    deletion_queue.join()
+    print(f"Requeued {requeued} uploads, marked {failed} failed, removed {removed} spool files")
 
 # Routes
 
-@app.route('/')
+@bp.route('/')
 def index():
     """Homepage"""
-    recent_posts = ForumPost.query.order_by(ForumPost.created_at.desc()).limit(5).all()
+    recent_posts = None
+    if current_user.is_authenticated:
+        recent_posts = fragment_cache.get_or_render('forum', 'recent', lambda: render_template(
+            'fragments/recent_posts.html',
+            recent_posts=ForumPost.query.options(joinedload(ForumPost.author))
+            .order_by(ForumPost.created_at.desc()).limit(5).all()
+        ))
     return render_template('index.html', recent_posts=recent_posts)
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     """User registration"""
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
     form = RegistrationForm()
     if form.validate_on_submit():
@@ -64,31 +110,32 @@ def register():
         )
         user.set_password(form.password.data)
         
-        # Handle profile photo upload with Cloudinary
+        # Spool the profile photo; it is uploaded to Cloudinary in the background
+        spool_path = None
         if form.profile_photo.data:
-            photo_file = form.profile_photo.data
-            # Assuming save_uploaded_file is updated to handle Cloudinary upload
-            # and returns the public_id
-            public_id = save_uploaded_file(photo_file, folder="profile_photos")
-            if public_id:
-                user.profile_photo = public_id
-            else:
+            spool_path = spool_upload(form.profile_photo.data)
+            if not spool_path:
                 flash('Geçersiz dosya formatı veya yükleme hatası.', 'danger')
                 return render_template('register.html', form=form) # Stay on register page
         
         db.session.add(user)
+        db.session.flush()
+        sync_user_hobbies(user.id, user.hobbies)
         db.session.commit()
         
+        if spool_path and not enqueue_profile_photo_upload(user.id, spool_path):
+            flash('Profil fotoğrafı şu anda işlenemiyor, daha sonra tekrar yükleyebilirsiniz.', 'warning')
+        
         flash('Kayıt başarılı! Şimdi giriş yapabilirsiniz.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     
     return render_template('register.html', form=form)
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     """User login"""
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
     form = LoginForm()
     if form.validate_on_submit():
@@ -97,120 +144,221 @@ def login():
             login_user(user, remember=form.remember_me.data)
             next_page = request.args.get('next')
             flash(f'Hoş geldiniz, {user.first_name}!', 'success')
-            return redirect(next_page) if next_page else redirect(url_for('index'))
+            return redirect(next_page) if next_page else redirect(url_for('.index'))
         else:
             flash('Kullanıcı adı veya şifre hatalı.', 'danger')
     
     return render_template('login.html', form=form)
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     """User logout"""
     logout_user()
     flash('Başarıyla çıkış yaptınız.', 'info')
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
-@app.route('/profile/<int:user_id>')
+@bp.route('/profile/<int:user_id>')
 @login_required
 def profile(user_id):
     """View user profile"""
     user = User.query.get_or_404(user_id)
     photos = Photo.query.filter_by(user_id=user_id).order_by(Photo.uploaded_at.desc()).all()
-    videos = Video.query.filter_by(user_id=user_id).order_by(Video.uploaded_at.desc()).all()
-    return render_template('profile.html', user=user, photos=photos, videos=videos)
+    videos = Video.query.filter_by(user_id=user_id).order_by(Video.uploaded_at.desc()).limit(5).all()
+    similar = similar_members(user_id, limit=current_app.config['SIMILAR_MEMBERS_LIMIT'])
+    return render_template('profile.html', user=user, photos=photos, videos=videos, similar=similar)
 
-@app.route('/profile/edit', methods=['GET', 'POST'])
+@bp.route('/profile/edit', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
     """Edit user profile"""
+    # current_user is a cached projection; edit the full row
+    user = db.session.get(User, current_user.id)
     form = ProfileForm()
     
     if form.validate_on_submit():
-        current_user.first_name = form.first_name.data
-        current_user.last_name = form.last_name.data
-        current_user.gender = form.gender.data
-        current_user.birth_place = form.birth_place.data
-        current_user.school = form.school.data
-        current_user.hobbies = form.hobbies.data
-        current_user.about = form.about.data
-        current_user.current_location = form.current_location.data
-        current_user.current_activity = form.current_activity.data
+        user.first_name = form.first_name.data
+        user.last_name = form.last_name.data
+        user.gender = form.gender.data
+        user.birth_place = form.birth_place.data
+        user.school = form.school.data
+        user.hobbies = form.hobbies.data
+        user.about = form.about.data
+        status = (form.current_location.data, form.current_activity.data)
+        if status != (user.current_location, user.current_activity) and any(status):
+            record_event('status', user.id, summary=' - '.join(part for part in status if part))
+        user.current_location = form.current_location.data
+        user.current_activity = form.current_activity.data
+        sync_user_hobbies(user.id, user.hobbies)
         
-        # Handle profile photo
+        invalidate_user(db.session, user.id)
+        invalidate_fragments(db.session, *MEMBER_FRAGMENTS)
+        db.session.commit()
+        
+        # Handle profile photo (uploaded in the background, shown once ready)
         if form.profile_photo.data:
-            try:
-                public_id = save_uploaded_file(form.profile_photo.data, folder="profile_photos")
-                if public_id:
-                    current_user.profile_photo = public_id
-                else:
-                    flash('Profil fotoğrafı kaydedilemedi. Lütfen dosya formatını kontrol edin.', 'warning')
-            except Exception as e:
-                print(f"Profile Photo Upload Error: {str(e)}")
-                flash(f'Profil fotoğrafı yüklenirken hata oluştu: {str(e)}', 'danger')
+            spool_path = spool_upload(form.profile_photo.data)
+            if not spool_path:
+                flash('Profil fotoğrafı kaydedilemedi. Lütfen dosya formatını kontrol edin.', 'warning')
+            elif enqueue_profile_photo_upload(current_user.id, spool_path):
+                flash('Profil fotoğrafınız işleniyor, birazdan görünecek.', 'info')
+            else:
+                flash('Sunucu şu anda meşgul, profil fotoğrafı yüklenemedi. Lütfen tekrar deneyin.', 'warning')
         
-        db.session.commit()
         flash('Profiliniz güncellendi!', 'success')
-        return redirect(url_for('profile', user_id=current_user.id))
+        return redirect(url_for('.profile', user_id=current_user.id))
     
     elif request.method == 'GET':
         # Pre-fill form with current data
-        form.first_name.data = current_user.first_name
-        form.last_name.data = current_user.last_name
-        form.gender.data = current_user.gender
-        form.birth_place.data = current_user.birth_place
-        form.school.data = current_user.school
-        form.hobbies.data = current_user.hobbies if current_user.hobbies else ''
-        form.about.data = current_user.about
-        form.current_location.data = current_user.current_location
-        form.current_activity.data = current_user.current_activity
+        form.first_name.data = user.first_name
+        form.last_name.data = user.last_name
+        form.gender.data = user.gender
+        form.birth_place.data = user.birth_place
+        form.school.data = user.school
+        form.hobbies.data = user.hobbies if user.hobbies else ''
+        form.about.data = user.about
+        form.current_location.data = user.current_location
+        form.current_activity.data = user.current_activity
     
     return render_template('edit_profile.html', form=form)
 
-@app.route('/people')
+@bp.route('/people')
 @login_required
 def people():
-    """List all users"""
-    users = User.query.all()
-    return render_template('people.html', users=users)
+    """Member directory with search and filters"""
+    form = PeopleSearchForm(request.args)
+    form.hobby.choices = _hobby_choices(form.hobby.data)
+    page = _people_page(form)
+    return render_template('people.html', form=form, users=page.items, next_cursor=page.next_cursor,
+                           filters=_people_filters(form), school_labels=dict(SCHOOL_CHOICES))
+
+@bp.route('/api/people')
+@login_required
+def people_api():
+    """Directory page as JSON for infinite scroll"""
+    form = PeopleSearchForm(request.args)
+    page = _people_page(form)
+    school_labels = dict(SCHOOL_CHOICES)
+    return jsonify({
+        'users': [{
+            'id': user.id,
+            'username': user.username,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'school': school_labels.get(user.school, user.school),
+            'photo_url': cloudinary_url_filter(user.profile_photo, 'thumbnail'),
+            'profile_url': url_for('.profile', user_id=user.id)
+        } for user in page.items],
+        'next_cursor': page.next_cursor
+    })
+
+@bp.route('/api/users/autocomplete')
+@login_required
+def users_autocomplete():
+    """Name/username prefix matches for the tagging and recipient pickers"""
+    limit = min(request.args.get('limit', current_app.config['AUTOCOMPLETE_LIMIT'], type=int), 50)
+    exclude_id = current_user.id if request.args.get('exclude_self') else None
+    users = autocomplete_users(request.args.get('q', ''), limit=max(limit, 1), exclude_id=exclude_id)
+    return jsonify({
+        'users': [{
+            'id': user.id,
+            'username': user.username,
+            'name': f'{user.first_name} {user.last_name}',
+            'photo_url': cloudinary_url_filter(user.profile_photo, 'thumbnail') if user.profile_photo else None
+        } for user in users]
+    })
+
+def _people_filters(form):
+    """Active search/filter values, to carry over into pagination links"""
+    return {name: value for name, value in (
+        ('q', form.q.data),
+        ('school', form.school.data),
+        ('birth_place', form.birth_place.data),
+        ('gender', form.gender.data),
+        ('hobby', form.hobby.data)
+    ) if value}
+
+def _hobby_choices(selected):
+    """Popular hobby tags with their member counts, keeping a selected tag that is not among them"""
+    hobbies = popular_hobbies(current_app.config['HOBBY_FILTER_LIMIT'])
+    choices = [('', 'Tüm hobiler')] + [(hobby.slug, f'{hobby.name} ({hobby.user_count})') for hobby in hobbies]
+    if selected and selected not in {hobby.slug for hobby in hobbies}:
+        choices.append((selected, selected))
+    return choices
+
+def _people_page(form):
+    return search_people(
+        cursor=request.args.get('cursor'),
+        per_page=current_app.config['PEOPLE_PER_PAGE'],
+        **_people_filters(form)
+    )
 
-@app.route('/photos')
+@bp.route('/photos')
 @login_required
 def photos():
-    """Photo gallery"""
-    all_photos = Photo.query.order_by(Photo.uploaded_at.desc()).all()
-    return render_template('photos.html', photos=all_photos)
+    """Photo gallery, newest first, one keyset page at a time"""
+    cursor = request.args.get('cursor')
+    if cursor:
+        gallery = _render_photos_page(cursor)
+    else:
+        # Most views are of the newest photos; older pages are cheap index range reads
+        gallery = fragment_cache.get_or_render('photos', 'first', lambda: _render_photos_page(None))
+    return render_template('photos.html', gallery=gallery)
+
+def _render_photos_page(cursor):
+    page = keyset_paginate(
+        Photo.query.options(joinedload(Photo.user)),
+        (Photo.uploaded_at, Photo.id),
+        cursor=cursor,
+        per_page=current_app.config['PHOTOS_PER_PAGE']
+    )
+    total = db.session.query(func.count(Photo.id)).scalar()
+    return Markup(render_template('fragments/photo_gallery.html', photos=page.items, total=total,
+                                  next_cursor=page.next_cursor, is_first_page=not cursor))
 
-@app.route('/photos/upload', methods=['GET', 'POST'])
+@bp.route('/photos/upload', methods=['GET', 'POST'])
 @login_required
 def upload_photo():
     """Upload photo"""
     form = PhotoUploadForm()
     
     if form.validate_on_submit():
-        try:
-            public_id = save_uploaded_file(form.photo.data, folder="photos")
-            if public_id:
-                photo = Photo(
-                    user_id=current_user.id,
-                    filename=public_id,
-                    caption=form.caption.data
-                )
-                
-                db.session.add(photo)
-                db.session.commit()
-                
-                flash('Fotoğraf başarıyla yüklendi!', 'success')
-                return redirect(url_for('photo_detail', photo_id=photo.id))
-            else:
-                flash('Dosya kaydedilemedi. Lütfen dosya formatını kontrol edin.', 'danger')
-        except Exception as e:
-            print(f"Upload Error: {str(e)}")
-            flash(f'Fotoğraf yüklenirken bir hata oluştu: {str(e)}', 'danger')
+        spool_path = spool_upload(form.photo.data)
+        if spool_path:
+            # The row exists at once; a background worker uploads the file
+            # and fills in filename/thumbnail
+            photo = Photo(
+                user_id=current_user.id,
+                filename='',
+                caption=form.caption.data,
+                status='pending'
+            )
+            
+            db.session.add(photo)
+            db.session.flush()
+            spool_path = claim_photo_spool(spool_path, photo.id)
+            search.index_documents([search.photo_document(photo)])
+            record_event('photo', current_user.id, photo.id, summary=photo.caption)
+            invalidate_fragments(db.session, 'photos')
+            db.session.commit()
+            
+            if enqueue_photo_upload(photo.id, spool_path):
+                flash('Fotoğraf yüklendi, işleniyor...', 'success')
+                return redirect(url_for('.photo_detail', photo_id=photo.id))
+            
+            # Queue full: undo instead of leaving a photo that never finishes
+            search.remove_documents('photo', [photo.id])
+            remove_events(*photo_event_criteria([photo.id]))
+            invalidate_fragments(db.session, 'photos')
+            db.session.delete(photo)
+            db.session.commit()
+            flash('Sunucu şu anda meşgul, lütfen biraz sonra tekrar deneyin.', 'warning')
+        else:
+            flash('Dosya kaydedilemedi. Lütfen dosya formatını kontrol edin.', 'danger')
     
     return render_template('upload_photo.html', form=form)
 
-@app.route('/photos/<int:photo_id>/delete', methods=['POST'])
+@bp.route('/photos/<int:photo_id>/delete', methods=['POST'])
 @login_required
 def delete_photo(photo_id):
     """Delete photo"""
@@ -219,34 +367,37 @@ def delete_photo(photo_id):
     # Check permission
     if photo.user_id != current_user.id:
         flash('Bu işlem için yetkiniz yok.', 'danger')
-        return redirect(url_for('photo_detail', photo_id=photo_id))
+        return redirect(url_for('.photo_detail', photo_id=photo_id))
     
     try:
-        # Delete from Cloudinary
-        if photo.filename:
-            import cloudinary.uploader
-            cloudinary.uploader.destroy(photo.filename)
-            
-        # Delete from database
+        # Delete from database; the Cloudinary assets go through the deletion
+        # outbox once this commits
+        queue_media_deletion([photo.filename, photo.thumbnail])
+        search.remove_documents('photo', [photo.id])
+        remove_events(*photo_event_criteria([photo.id]))
+        invalidate_fragments(db.session, 'photos')
         db.session.delete(photo)
         db.session.commit()
+        schedule_media_deletions()
         
         flash('Fotoğraf başarıyla silindi.', 'success')
-        return redirect(url_for('photos'))
+        return redirect(url_for('.photos'))
     except Exception as e:
         print(f"Delete Error: {str(e)}")
         flash('Fotoğraf silinirken bir hata oluştu.', 'danger')
-        return redirect(url_for('photo_detail', photo_id=photo_id))
+        return redirect(url_for('.photo_detail', photo_id=photo_id))
 
-@app.route('/photos/<int:photo_id>')
+@bp.route('/photos/<int:photo_id>')
 @login_required
 def photo_detail(photo_id):
     """Photo detail with tagging"""
-    photo = Photo.query.get_or_404(photo_id)
-    users = User.query.all()
-    return render_template('photo_detail.html', photo=photo, users=users)
+    photo = Photo.query.options(
+        joinedload(Photo.user),
+        selectinload(Photo.tags).joinedload(PhotoTag.tagged_user)
+    ).filter_by(id=photo_id).first_or_404()
+    return render_template('photo_detail.html', photo=photo)
 
-@app.route('/photos/<int:photo_id>/tag', methods=['POST'])
+@bp.route('/photos/<int:photo_id>/tag', methods=['POST'])
 @login_required
 def tag_photo(photo_id):
     """Add tag to photo"""
@@ -261,11 +412,19 @@ def tag_photo(photo_id):
     )
     
     db.session.add(tag)
+    db.session.flush()
+    record_event('tag', current_user.id, tag.id, parent_id=photo_id, target_user_id=tag.tagged_user_id)
+    if tag.tagged_user_id != current_user.id:
+        publish_event(db.session, user_channel(tag.tagged_user_id), 'tag', {
+            'photo_id': photo_id,
+            'by': f'{current_user.first_name} {current_user.last_name}',
+            'url': url_for('.photo_detail', photo_id=photo_id)
+        })
     db.session.commit()
     
     return jsonify({'success': True, 'tag_id': tag.id})
 
-@app.route('/photos/<int:photo_id>/tag/<int:tag_id>', methods=['DELETE'])
+@bp.route('/photos/<int:photo_id>/tag/<int:tag_id>', methods=['DELETE'])
 @login_required
 def delete_tag(photo_id, tag_id):
     tag = PhotoTag.query.get_or_404(tag_id)
@@ -277,18 +436,46 @@ def delete_tag(photo_id, tag_id):
     if current_user.id != photo.user_id and current_user.id != tag.tagged_user_id:
         return jsonify({'success': False, 'message': 'Permission denied'}), 403
         
+    remove_events((ActivityEvent.event_type == 'tag') & (ActivityEvent.subject_id == tag.id))
     db.session.delete(tag)
     db.session.commit()
     return jsonify({'success': True})
 
-@app.route('/videos')
+@bp.route('/videos')
 @login_required
 def videos():
-    """Video gallery"""
-    all_videos = Video.query.order_by(Video.uploaded_at.desc()).all()
-    return render_template('videos.html', videos=all_videos)
+    """Video gallery, newest first, one keyset page at a time"""
+    cursor = request.args.get('cursor')
+    if cursor:
+        # Cursors are per item (permalinks); caching them would crowd out the first page
+        gallery = _render_videos_page(cursor)
+    else:
+        gallery = fragment_cache.get_or_render('videos', 'first', lambda: _render_videos_page(None))
+    return render_template('videos.html', gallery=gallery)
+
+def _render_videos_page(cursor):
+    page = keyset_paginate(
+        Video.query.options(joinedload(Video.user)),
+        (Video.uploaded_at, Video.id),
+        cursor=cursor,
+        per_page=current_app.config['VIDEOS_PER_PAGE']
+    )
+    # Only videos someone is looking at get their YouTube metadata refreshed
+    schedule_metadata_refresh(page.items)
+    total = db.session.query(func.count(Video.id)).scalar()
+    return Markup(render_template('fragments/video_gallery.html', videos=page.items, total=total,
+                                  next_cursor=page.next_cursor, is_first_page=not cursor))
 
-@app.route('/videos/add', methods=['GET', 'POST'])
+@bp.route('/videos/<int:video_id>')
+@login_required
+def video_permalink(video_id):
+    """Open the gallery at the page that starts with this video"""
+    video = Video.query.get_or_404(video_id)
+    # The cursor sorts just above the video, so the page starts with it
+    cursor = encode_cursor((video.uploaded_at, video.id + 1))
+    return redirect(url_for('.videos', cursor=cursor, _anchor=f'video-{video.id}'))
+
+@bp.route('/videos/add', methods=['GET', 'POST'])
 @login_required
 def add_video():
     """Add YouTube video"""
@@ -305,23 +492,40 @@ def add_video():
                 description=form.description.data
             )
             db.session.add(video)
+            db.session.flush()
+            search.index_documents([search.video_document(video)])
+            record_event('video', current_user.id, video.id, summary=video.title)
+            invalidate_fragments(db.session, 'videos')
             db.session.commit()
+            schedule_metadata_refresh([video])
             
             flash('Video eklendi!', 'success')
-            return redirect(url_for('videos'))
+            return redirect(url_for('.videos'))
         else:
             flash('Geçersiz YouTube URL.', 'danger')
     
     return render_template('add_video.html', form=form)
 
-@app.route('/forum')
+@bp.route('/forum')
 @login_required
 def forum():
-    """Forum posts"""
-    posts = ForumPost.query.order_by(ForumPost.created_at.desc()).all()
-    return render_template('forum.html', posts=posts)
+    """Forum posts, newest first, one keyset page at a time"""
+    cursor = request.args.get('cursor')
+    sort = request.args.get('sort') if request.args.get('sort') in SORT_COLUMNS else 'new'
+    if cursor:
+        # Deeper pages are cheap index range reads and their cursors are endless
+        post_list = _render_forum_page(sort, cursor)
+    else:
+        post_list = fragment_cache.get_or_render('forum', f'first:{sort}', lambda: _render_forum_page(sort, None))
+    return render_template('forum.html', post_list=post_list, sort=sort)
+
+def _render_forum_page(sort, cursor):
+    # Reply counts and last activity are read from the denormalized columns
+    page = post_page(sort, cursor=cursor, per_page=current_app.config['FORUM_POSTS_PER_PAGE'])
+    return Markup(render_template('fragments/forum_posts.html', posts=page.items, sort=sort,
+                                  next_cursor=page.next_cursor, is_first_page=not cursor))
 
-@app.route('/forum/post', methods=['GET', 'POST'])
+@bp.route('/forum/post', methods=['GET', 'POST'])
 @login_required
 def create_post():
     """Create forum post"""
@@ -334,18 +538,22 @@ def create_post():
             content=form.content.data
         )
         db.session.add(post)
+        db.session.flush()
+        search.index_documents([search.post_document(post)])
+        record_event('post', current_user.id, post.id, summary=post.title)
+        invalidate_fragments(db.session, 'forum')
         db.session.commit()
         
         flash('Mesajınız gönderildi!', 'success')
-        return redirect(url_for('forum'))
+        return redirect(url_for('.forum'))
     
     return render_template('create_post.html', form=form)
 
-@app.route('/forum/<int:post_id>', methods=['GET', 'POST'])
+@bp.route('/forum/<int:post_id>', methods=['GET', 'POST'])
 @login_required
 def view_post(post_id):
-    """View forum post and replies"""
-    post = ForumPost.query.get_or_404(post_id)
+    """View forum post and one page of its replies"""
+    post = ForumPost.query.options(joinedload(ForumPost.author)).filter_by(id=post_id).first_or_404()
     form = ForumReplyForm()
     
     if form.validate_on_submit():
@@ -355,30 +563,95 @@ def view_post(post_id):
             content=form.content.data
         )
         db.session.add(reply)
+        db.session.flush()
+        record_reply(post_id, reply.created_at)
+        record_event('reply', current_user.id, reply.id, parent_id=post_id, summary=post.title)
+        search.index_documents([search.reply_document(reply, post.title)])
+        invalidate_fragments(db.session, 'forum')
+        author = f'{current_user.first_name} {current_user.last_name}'
+        url = url_for('.reply_permalink', reply_id=reply.id)
+        publish_event(db.session, post_channel(post_id), 'reply', {
+            'id': reply.id, 'post_id': post_id, 'author_id': current_user.id, 'author': author, 'url': url
+        })
+        if post.user_id != current_user.id:
+            publish_event(db.session, user_channel(post.user_id), 'post_reply', {
+                'post_id': post_id, 'title': post.title[:100], 'author': author, 'url': url
+            })
         db.session.commit()
         
         flash('Yanıtınız eklendi!', 'success')
-        return redirect(url_for('view_post', post_id=post_id))
+        return redirect(url_for('.view_post', post_id=post_id, cursor=reply_cursor(reply),
+                                _anchor=f'reply-{reply.id}'))
     
-    return render_template('view_post.html', post=post, form=form)
+    cursor = request.args.get('cursor')
+    replies = reply_page(post_id, cursor=cursor, per_page=current_app.config['FORUM_REPLIES_PER_PAGE'])
+    return render_template('view_post.html', post=post, form=form, replies=replies.items,
+                           next_cursor=replies.next_cursor, is_first_page=not cursor)
 
-@app.route('/messages')
+@bp.route('/forum/reply/<int:reply_id>')
+@login_required
+def reply_permalink(reply_id):
+    """Open a thread at the reply page that starts with this reply"""
+    reply = ForumReply.query.get_or_404(reply_id)
+    return redirect(url_for('.view_post', post_id=reply.post_id, cursor=reply_cursor(reply),
+                            _anchor=f'reply-{reply.id}'))
+
+@bp.route('/search')
+@login_required
+def site_search():
+    """Full-text search over forum posts, replies, videos and photo captions"""
+    form = SiteSearchForm(request.args)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['SEARCH_RESULTS_PER_PAGE']
+    
+    results = []
+    if form.q.data:
+        # Fetch one extra hit to know whether a next page exists
+        results = search.search(form.q.data, doc_type=form.type.data or None,
+                                limit=per_page + 1, offset=(page - 1) * per_page)
+    has_next = len(results) > per_page
+    
+    return render_template('search.html', form=form, results=results[:per_page],
+                           page=page, has_next=has_next)
+
+@bp.route('/messages')
 @login_required
 def messages():
-    """User messages"""
-    received = Message.query.filter_by(recipient_id=current_user.id).order_by(Message.created_at.desc()).all()
-    sent = Message.query.filter_by(sender_id=current_user.id).order_by(Message.created_at.desc()).all()
-    return render_template('messages.html', received=received, sent=sent)
+    """Inbox grouped into conversations, most recently active first"""
+    threads = inbox_threads(
+        current_user.id,
+        cursor=request.args.get('cursor'),
+        per_page=current_app.config['MESSAGE_THREADS_PER_PAGE']
+    )
+    return render_template('messages.html', threads=threads.items, next_cursor=threads.next_cursor,
+                           is_first_page=not request.args.get('cursor'))
 
-@app.route('/messages/send', methods=['GET', 'POST'])
+@bp.route('/messages/with/<int:user_id>')
+@login_required
+@use_primary
+def conversation(user_id):
+    """All messages exchanged with one member"""
+    counterpart = User.query.get_or_404(user_id)
+    page = conversation_messages(
+        current_user.id, user_id,
+        cursor=request.args.get('cursor'),
+        per_page=current_app.config['CONVERSATION_MESSAGES_PER_PAGE']
+    )
+    
+    # Opening the conversation reads everything they sent
+    if mark_conversation_read(current_user.id, user_id):
+        db.session.commit()
+    
+    return render_template('conversation.html', counterpart=counterpart, messages=page.items,
+                           next_cursor=page.next_cursor)
+
+@bp.route('/messages/send', methods=['GET', 'POST'])
 @login_required
 def send_message():
     """Send private message"""
     form = MessageForm()
-    
-    # Populate recipient choices
-    users = User.query.filter(User.id != current_user.id).all()
-    form.recipient.choices = [(u.id, f"{u.first_name} {u.last_name} (@{u.username})") for u in users]
+    if request.method == 'GET':
+        form.recipient.data = request.args.get('recipient', type=int)
     
     if form.validate_on_submit():
         message = Message(
@@ -388,124 +661,188 @@ def send_message():
             content=form.content.data
         )
         db.session.add(message)
+        increment_unread(message.recipient_id)
+        publish_event(db.session, user_channel(message.recipient_id), 'new_message', {
+            'sender_id': current_user.id,
+            'sender': f'{current_user.first_name} {current_user.last_name}',
+            'subject': (message.subject or '')[:100],
+            'url': url_for('.conversation', user_id=current_user.id)
+        })
         db.session.commit()
         
         flash('Mesajınız gönderildi!', 'success')
-        return redirect(url_for('messages'))
+        return redirect(url_for('.conversation', user_id=message.recipient_id))
     
-    return render_template('send_message.html', form=form)
+    # Name of the already chosen recipient (reply links, failed submissions)
+    recipient = db.session.get(User, form.recipient.data) if form.recipient.data else None
+    return render_template('send_message.html', form=form, recipient=recipient)
 
-@app.route('/messages/<int:message_id>')
+@bp.route('/messages/<int:message_id>')
 @login_required
+@use_primary
 def view_message(message_id):
     """View message"""
-    message = Message.query.get_or_404(message_id)
+    message = Message.query.options(
+        joinedload(Message.sender), joinedload(Message.recipient)
+    ).filter_by(id=message_id).first_or_404()
     
     # Check if user is sender or recipient
     if message.sender_id != current_user.id and message.recipient_id != current_user.id:
         flash('Bu mesajı görüntüleme yetkiniz yok.', 'danger')
-        return redirect(url_for('messages'))
+        return redirect(url_for('.messages'))
     
     # Mark as read if recipient
     if message.recipient_id == current_user.id and not message.is_read:
         message.is_read = True
+        decrement_unread(current_user.id)
         db.session.commit()
     
     return render_template('view_message.html', message=message)
 
-@app.route('/activity')
+@bp.route('/activity')
 @login_required
 def activity():
-    """Who, Where, What - Activity tracking"""
-    users = User.query.filter(
-        (User.current_location.isnot(None)) | (User.current_activity.isnot(None))
-    ).all()
-    return render_template('activity.html', users=users)
+    """Activity feed: posts, replies, photos, videos, tags, locations and status updates"""
+    cursor = request.args.get('cursor')
+    if cursor:
+        feed = _render_activity_page(cursor)
+    else:
+        # The first page mentions the viewer ("seni etiketledi"), so it is cached per member
+        feed = fragment_cache.get_or_render('activity', f'first:{current_user.id}',
+                                            lambda: _render_activity_page(None))
+    return render_template('activity.html', feed=feed)
 
-@app.route('/map')
+def _render_activity_page(cursor):
+    page = feed_page(cursor, per_page=current_app.config['ACTIVITY_PER_PAGE'])
+    return render_template('fragments/activity_feed.html', events=page.items,
+                           next_cursor=page.next_cursor, is_first_page=not cursor)
+
+@bp.route('/events')
+@login_required
+def event_stream():
+    """Server-Sent Events: the member's own notices, plus new replies in ?post=<id>"""
+    config = current_app.config
+    if event_hub.stream_count() >= config['EVENTS_MAX_STREAMS']:
+        # Worker busy with open streams; the page works without them. EventSource
+        # cannot read Retry-After, but it waits as long as `retry:` asks
+        retry = config['EVENTS_BUSY_RETRY']
+        return Response(f'retry: {retry * 1000}\n\n', mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'Retry-After': str(retry)})
+    channels = [user_channel(current_user.id)]
+    post_id = request.args.get('post', type=int)
+    if post_id:
+        channels.append(post_channel(post_id))
+    
+    # The stream runs after the request context is gone: no database access from here on
+    subscription = event_hub.subscribe(channels)
+    response = Response(sse_stream(subscription, heartbeat=config['EVENTS_HEARTBEAT'],
+                                   duration=config['EVENTS_STREAM_TIMEOUT']),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(lambda: event_hub.unsubscribe(subscription))
+    return response
+
+@bp.route('/map')
 @login_required
 def map_view():
-    """Map with user locations"""
-    all_locations = Location.query.all()
-    locations_data = []
-    
-    for loc in all_locations:
-        locations_data.append({
-            'latitude': loc.latitude,
-            'longitude': loc.longitude,
-            'user': {
-                'first_name': loc.user.first_name,
-                'last_name': loc.user.last_name
-            }
-        })
-        
-    return render_template('map.html', locations=locations_data)
+    """Map with user locations (points are fetched per viewport from /map/points)"""
+    return render_template('map.html')
 
-@app.route('/map/update', methods=['POST'])
+@bp.route('/map/points')
+@login_required
+def map_points_api():
+    """Locations inside ?bbox=west,south,east,north, clustered below MAP_CLUSTER_MAX_ZOOM"""
+    try:
+        west, south, east, north = bbox = [float(value) for value in request.args.get('bbox', '').split(',')]
+    except ValueError:
+        return jsonify({'error': 'bbox must be west,south,east,north'}), 400
+    # float() also accepts 'nan' and 'inf', which cannot be geohashed
+    if not all(math.isfinite(value) for value in bbox):
+        return jsonify({'error': 'bbox must be west,south,east,north'}), 400
+    zoom = min(max(request.args.get('zoom', 6, type=int), 0), 22)
+    return jsonify(map_points(
+        west, south, east, north, zoom,
+        cluster_max_zoom=current_app.config['MAP_CLUSTER_MAX_ZOOM'],
+        limit=current_app.config['MAP_MAX_POINTS']
+    ))
+
+@bp.route('/map/update', methods=['POST'])
 @login_required
 def update_location():
-    """Update user location"""
-    data = request.get_json()
-    
-    location = Location.query.filter_by(user_id=current_user.id).first()
-    if location:
-        location.latitude = data['latitude']
-        location.longitude = data['longitude']
-        location.address = data.get('address', '')
-    else:
-        location = Location(
-            user_id=current_user.id,
-            latitude=data['latitude'],
-            longitude=data['longitude'],
-            address=data.get('address', '')
-        )
-        db.session.add(location)
-    
-    db.session.commit()
-    return jsonify({'success': True})
+    """Update user location (buffered; written to the database in bulk)"""
+    data = request.get_json(silent=True) or {}
+    try:
+        latitude = float(data['latitude'])
+        longitude = float(data['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Geçersiz konum.'}), 400
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return jsonify({'success': False, 'message': 'Geçersiz konum.'}), 400
+    
+    status = location_buffer.offer(current_user.id, latitude, longitude, (data.get('address') or '')[:255])
+    if current_app.config['TASKS_EAGER']:
+        location_buffer.flush()
+    return jsonify({'success': True, 'status': status})
 
 # Template filters
-@app.template_filter('hobby_display')
+@bp.app_template_filter('hobby_display')
 def hobby_display(hobbies_str):
-    """Display comma-separated hobbies"""
-    if not hobbies_str:
-        return ''
-    return hobbies_str
+    """Hobby tags, each linking to the members who share it"""
+    return Markup(', ').join(
+        Markup('<a href="{}">{}</a>').format(url_for('.people', hobby=slug), name)
+        for slug, name in parse_hobbies(hobbies_str).items()
+    )
 
-@app.template_filter('cloudinary_url')
+@bp.app_template_filter('duration')
+def duration_filter(seconds):
+    """Format a video length as M:SS or H:MM:SS"""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f'{hours}:{minutes:02d}:{seconds:02d}'
+    return f'{minutes}:{seconds:02d}'
+
+@bp.app_template_filter('cloudinary_url')
 def cloudinary_url_filter(public_id, transformation=None):
-    """Generate Cloudinary URL from public_id"""
-    if not public_id:
-        return None
-    
-    import cloudinary.utils
-    
-    # Default transformation for thumbnails
-    if transformation == 'thumbnail':
-        return cloudinary.utils.cloudinary_url(
-            public_id,
-            width=150,
-            height=150,
-            crop='fill',
-            quality='auto'
-        )[0]
-    elif transformation == 'profile':
-        return cloudinary.utils.cloudinary_url(
-            public_id,
-            width=400,
-            height=400,
-            crop='fill',
-            quality='auto'
-        )[0]
-    else:
-        return cloudinary.utils.cloudinary_url(public_id)[0]
+    """Generate Cloudinary URL from public_id using a named preset"""
+    return media_url(public_id, transformation)
+
+@bp.app_template_filter('cloudinary_img')
+def cloudinary_img_filter(public_id, transformation=None):
+    """src/srcset/sizes attributes for a responsive <img>"""
+    return media_img_attrs(public_id, transformation)
 
 # --- ADMIN ROUTES (Temporary) ---
-@app.route('/admin/delete-user/<username>')
+def _is_admin_request():
+    # Use SECRET_KEY as admin password for simplicity
+    return request.args.get('key') == current_app.config['SECRET_KEY']
+
+@bp.route('/admin/stats')
+def admin_stats():
+    """Runtime cache, queue and connection pool metrics (Protected by key)"""
+    if not _is_admin_request():
+        return "Unauthorized", 403
+    limiter = current_app.extensions.get('rate_limiter')
+    return jsonify({
+        'cloudinary_url_cache': url_cache_stats(),
+        'upload_queue': upload_queue.stats(),
+        'deletion_queue': deletion_queue.stats(),
+        'video_metadata_queue': metadata_queue.stats(),
+        'pending_media_deletions': MediaDeletion.query.count(),
+        'location_buffer': location_buffer.stats(),
+        'user_cache': user_cache.stats(),
+        'fragment_cache': fragment_cache.stats(),
+        'event_hub': event_hub.stats(),
+        'rate_limiter': limiter.stats() if limiter else None,
+        'db_pool': pool_stats(db.engine),
+        'replica_pools': [pool_stats(engine) for engine in current_app.extensions['replica_engines']]
+    })
+
+@bp.route('/admin/delete-user/<username>')
+@use_primary
 def admin_delete_user(username):
     """Delete a user by username (Protected by key)"""
-    key = request.args.get('key')
-    if key != app.config['SECRET_KEY']: # Use SECRET_KEY as admin password for simplicity
+    if not _is_admin_request():
         return "Unauthorized", 403
     
     user = User.query.filter_by(username=username).first()
@@ -513,29 +850,70 @@ def admin_delete_user(username):
         return f"User {username} not found", 404
     
     try:
-        # 1. Delete Cloudinary images (Profile photo)
-        if user.profile_photo:
-            import cloudinary.uploader
-            cloudinary.uploader.destroy(user.profile_photo)
-            
-        # 2. Delete User Photos from Cloudinary
-        for photo in user.photos:
-            if photo.filename:
-                cloudinary.uploader.destroy(photo.filename)
+        # 1-2. Queue the profile photo and every photo asset in the deletion
+        # outbox; they are removed from Cloudinary in bulk after the commit
+        photo_assets = db.session.query(Photo.filename, Photo.thumbnail).filter_by(user_id=user.id).all()
+        queue_media_deletion([user.profile_photo] + [public_id for row in photo_assets for public_id in row])
         
         # 3. Delete associated data manually (if not handled by cascade)
-        # Delete messages sent/received by user
+        # Delete messages sent/received by user, first taking the unread ones
+        # they sent out of their recipients' counters
+        unread_by_recipient = db.session.query(Message.recipient_id, func.count(Message.id)).filter(
+            Message.sender_id == user.id,
+            Message.recipient_id != user.id,
+            Message.is_read == db.false()
+        ).group_by(Message.recipient_id).all()
+        for recipient_id, count in unread_by_recipient:
+            decrement_unread(recipient_id, count)
         Message.query.filter((Message.sender_id == user.id) | (Message.recipient_id == user.id)).delete()
         
+        # Take the user out of the hobby tags and their counts
+        sync_user_hobbies(user.id, None)
+        
+        # Drop feed events by or about the user, and about content going with them
+        user_photo_id_list = [photo_id for photo_id, in db.session.query(Photo.id).filter_by(user_id=user.id)]
+        user_post_ids = db.session.query(ForumPost.id).filter_by(user_id=user.id).scalar_subquery()
+        remove_events(
+            ActivityEvent.actor_id == user.id,
+            ActivityEvent.target_user_id == user.id,
+            (ActivityEvent.event_type == 'reply') & ActivityEvent.parent_id.in_(user_post_ids),
+            *photo_event_criteria(user_photo_id_list)
+        )
+        
         # Delete photo tags where user is tagged
         PhotoTag.query.filter_by(tagged_user_id=user.id).delete()
         
-        # Delete forum replies by user
+        # Drop the user's content from the search index; replies on their
+        # posts go with the posts (cascade), whoever wrote them
+        post_ids = [post_id for post_id, in db.session.query(ForumPost.id).filter_by(user_id=user.id)]
+        reply_ids = db.session.query(ForumReply.id).filter(
+            (ForumReply.user_id == user.id) | ForumReply.post_id.in_(post_ids)
+        )
+        search.remove_documents('reply', [reply_id for reply_id, in reply_ids])
+        search.remove_documents('post', post_ids)
+        search.remove_documents('video', [video_id for video_id, in db.session.query(Video.id).filter_by(user_id=user.id)])
+        search.remove_documents('photo', [photo_id for photo_id, in db.session.query(Photo.id).filter_by(user_id=user.id)])
+        
+        # Delete forum replies by user, then recount the other threads they replied to
+        replied_post_ids = [post_id for post_id, in db.session.query(ForumReply.post_id).filter(
+            ForumReply.user_id == user.id, ForumReply.post_id.notin_(post_ids)
+        ).distinct()]
         ForumReply.query.filter_by(user_id=user.id).delete()
+        refresh_reply_stats(replied_post_ids)
         
-        # 4. Delete User (Cascade will handle photos, videos, posts, location)
+        # Delete photos (and tags on them) in bulk rather than through the
+        # ORM cascade, which would load every photo and its tags
+        user_photo_ids = db.session.query(Photo.id).filter_by(user_id=user.id).scalar_subquery()
+        PhotoTag.query.filter(PhotoTag.photo_id.in_(user_photo_ids)).delete(synchronize_session=False)
+        Photo.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        
+        # 4. Delete User (Cascade will handle videos, posts, location)
+        location_buffer.forget(user.id)
+        invalidate_user(db.session, user.id)
+        invalidate_fragments(db.session, *MEMBER_FRAGMENTS)
         db.session.delete(user)
         db.session.commit()
+        schedule_media_deletions()
         
         return f"User {username} and all associated data deleted successfully."
         
@@ -543,7 +921,37 @@ def admin_delete_user(username):
         db.session.rollback()
         return f"Error deleting user: {str(e)}", 500
 
+def create_app(config_class=Config):
+    """Application factory: configure extensions and register the routes.
+
+    Nothing here touches the database, so workers start fast; the schema is
+    managed by `flask db-upgrade` (see migrations.py).
+    """
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    if app.config['PROXY_FIX_X_FOR']:
+        # Client IPs (rate limits) from the proxies' X-Forwarded-For
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+    
+    # Initialize extensions
+    db.init_app(app)
+    init_replicas(app, db, engine_options)
+    csrf.init_app(app)
+    init_instrumentation(app)
+    login_manager.init_app(app)
+    init_rate_limits(app)
+    
+    # Initialize Cloudinary (credentials only, no network access)
+    if app.config['CLOUDINARY_CLOUD_NAME']:
+        cloudinary.config(
+            cloud_name=app.config['CLOUDINARY_CLOUD_NAME'],
+            api_key=app.config['CLOUDINARY_API_KEY'],
+            api_secret=app.config['CLOUDINARY_API_SECRET']
+        )
+    
+    app.register_blueprint(bp)
+    return app
+
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-    app.run(debug=True)
+    # Development server; apply migrations first with `flask --app app db-upgrade`
+    create_app().run(debug=True)
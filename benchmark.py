@@ -0,0 +1,255 @@
+"""Benchmark every page against a seeded database and report latency, queries and memory.
+
+Usage:
+    python benchmark.py                                         # temporary SQLite file, test client
+    python benchmark.py --database-url postgresql://localhost/sabis_bench
+    python benchmark.py --scale 10 --skew 1.2 --requests 50
+    python benchmark.py --json after.json --compare before.json # compare two commits
+
+    # Against gunicorn: seed once, start the server on the same database, then drive it
+    python benchmark.py --database-url postgresql://localhost/sabis_bench --seed-only
+    DATABASE_URL=postgresql://localhost/sabis_bench MEDIA_BACKEND=local VIDEO_METADATA_BACKEND=stub CLOUDINARY_CLOUD_NAME=demo gunicorn wsgi:app &
+    python benchmark.py --url http://127.0.0.1:8000 --database-url postgresql://localhost/sabis_bench --no-seed
+
+The target database must be empty unless --no-seed is given: it is migrated
+and seeded with synthetic data (see seed.py), scaled by --scale. Media goes
+to the local backend and background tasks run inline, so Cloudinary is never
+called; video metadata comes from the offline stub. Each route is requested --requests times after --warmup untimed
+requests, as a seeded member. Reported per route: p50/p95/p99 latency,
+queries per request and, with the test client, the peak memory allocated
+while serving one request (tracemalloc, measured in a separate untimed pass).
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='Database to seed and use (default: temporary SQLite file)')
+    parser.add_argument('--url', help='Benchmark a running server at this base URL instead of the test client')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply the default seed sizes')
+    parser.add_argument('--skew', type=float, default=1.0, help='Zipf exponent of the seeded activity (0 = uniform)')
+    parser.add_argument('--requests', type=int, default=20, help='Timed requests per route')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per route first')
+    parser.add_argument('--routes', help='Comma-separated labels to run (default: all)')
+    parser.add_argument('--no-seed', action='store_true', help='Use the database as it is')
+    parser.add_argument('--seed-only', action='store_true', help='Seed the database and exit')
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--compare', help='Results file of an earlier run to compare against')
+    return parser.parse_args()
+
+
+# Requests that write; (label, method, URL, form or JSON body). They run after the reads.
+WRITE_ROUTES = [
+    ('create_post', 'POST', '/forum/post', {'title': 'Benchmark', 'content': 'Benchmark post content'}),
+    ('post_reply', 'POST', '/forum/{post_id}', {'content': 'Benchmark reply'}),
+    ('message_send', 'POST', '/messages/send', {'recipient': '{other_user_id}', 'subject': 'Benchmark',
+                                                 'content': 'Benchmark message'}),
+    ('update_location', 'JSON', '/map/update', {'latitude': 41.0, 'longitude': 29.0}),
+]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def summarize(label, durations, queries, peak_memory=None):
+    return {
+        'route': label,
+        'p50_ms': percentile(durations, 0.50) * 1000,
+        'p95_ms': percentile(durations, 0.95) * 1000,
+        'p99_ms': percentile(durations, 0.99) * 1000,
+        'queries': statistics.mean(queries) if queries else None,
+        'peak_kb': peak_memory / 1024 if peak_memory is not None else None,
+    }
+
+
+def fill(template, ids):
+    if isinstance(template, str):
+        return template.format(**ids)
+    return {key: fill(value, ids) for key, value in template.items()} if isinstance(template, dict) else template
+
+
+class TestClientDriver:
+    """Requests through Flask's test client, counting queries in-process"""
+
+    def __init__(self, app, user_id):
+        from instrumentation import track_queries
+        self.track_queries = track_queries
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+
+    def request(self, method, url, body=None):
+        """Returns (status, seconds, query count)"""
+        with self.track_queries() as stats:
+            started = time.perf_counter()
+            if method == 'GET':
+                response = self.client.get(url)
+            elif method == 'JSON':
+                response = self.client.post(url, json=body)
+            else:
+                response = self.client.post(url, data=body)
+            elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, stats.count
+
+    def peak_memory(self, method, url, body=None):
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            self.request(method, url, body)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Report redirects instead of following them, like the test client"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPDriver:
+    """Requests against a running server; query counts come from X-Query-Count"""
+
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect
+        )
+
+        page = self.opener.open(self.base_url + '/login').read().decode()
+        self.csrf_token = re.search(r'name="csrf-token" content="([^"]+)"', page).group(1)
+        status, _, _ = self.request('POST', '/login', {'username': username, 'password': password})
+        if status >= 400:
+            sys.exit(f'Login as {username} failed with status {status}')
+
+    def request(self, method, url, body=None):
+        headers = {'X-CSRFToken': self.csrf_token}
+        data = None
+        if method == 'JSON':
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif method == 'POST':
+            data = urllib.parse.urlencode({**body, 'csrf_token': self.csrf_token}).encode()
+        request = urllib.request.Request(self.base_url + url, data=data, headers=headers)
+        started = time.perf_counter()
+        try:
+            response = self.opener.open(request)
+            response.read()
+        except urllib.error.HTTPError as error:
+            response = error
+        elapsed = time.perf_counter() - started
+        count = response.headers.get('X-Query-Count')
+        return response.status, elapsed, int(count) if count is not None else None
+
+    def peak_memory(self, method, url, body=None):
+        return None
+
+
+def run_route(driver, label, method, url, body, args):
+    for _ in range(args.warmup):
+        driver.request(method, url, body)
+    durations, queries, statuses = [], [], set()
+    for _ in range(args.requests):
+        status, elapsed, count = driver.request(method, url, body)
+        statuses.add(status)
+        durations.append(elapsed)
+        if count is not None:
+            queries.append(count)
+    result = summarize(label, durations, queries, driver.peak_memory(method, url, body))
+    result['status'] = sorted(statuses)
+    return result
+
+
+def print_results(results, baseline=None):
+    baseline = {row['route']: row for row in (baseline or [])}
+    print(f'\n{"route":<22}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"peak KB":>10}  status')
+    for row in results:
+        queries = f'{row["queries"]:.1f}' if row['queries'] is not None else '-'
+        peak = f'{row["peak_kb"]:.0f}' if row['peak_kb'] is not None else '-'
+        print(f'{row["route"]:<22}{row["p50_ms"]:>9.2f}{row["p95_ms"]:>9.2f}{row["p99_ms"]:>9.2f}'
+              f'{queries:>9}{peak:>10}  {",".join(map(str, row["status"]))}')
+        before = baseline.get(row['route'])
+        if before:
+            change = (row['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+            query_change = ''
+            if row['queries'] is not None and before.get('queries') is not None:
+                query_change = f', queries {before["queries"]:.1f} -> {row["queries"]:.1f}'
+            print(f'{"":<22}p50 {change:+.0f}% vs baseline{query_change}')
+
+
+def main():
+    args = parse_args()
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    os.environ['DATABASE_URL'] = database_url
+    # Never touch Cloudinary: store media locally, run upload/delete tasks inline
+    os.environ['MEDIA_BACKEND'] = 'local'
+    os.environ['TASKS_EAGER'] = '1'
+    os.environ['VIDEO_METADATA_BACKEND'] = 'stub'
+    # One simulated member posts far faster than the write limits allow
+    os.environ['RATE_LIMIT_ENABLED'] = '0'
+    os.environ.setdefault('CLOUDINARY_CLOUD_NAME', 'demo')
+
+    from app import create_app
+    from models import db, User
+    from migrations import upgrade
+    from seed import DEFAULT_SIZES, seed_database
+    from explain_queries import ROUTES, route_ids
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = args.url is not None
+
+    with app.app_context():
+        if not args.no_seed:
+            upgrade()
+            sizes = {name: max(1, int(size * args.scale)) for name, size in DEFAULT_SIZES.items()}
+            started = time.perf_counter()
+            seed_database(sizes, skew=args.skew)
+            print(f'Seeded {sizes} in {time.perf_counter() - started:.1f}s')
+        if args.seed_only:
+            return
+        ids = route_ids(user_id=1)
+        ids['other_user_id'] = db.session.query(User.id).filter(User.id != 1).order_by(User.id).limit(1).scalar()
+
+    if args.url:
+        driver = HTTPDriver(args.url, 'user1', 'password')
+    else:
+        driver = TestClientDriver(app, user_id=1)
+
+    selected = set(args.routes.split(',')) if args.routes else None
+    plan = [(label, 'GET', url, None) for label, url in ROUTES] + WRITE_ROUTES
+    results = []
+    for label, method, url, body in plan:
+        if selected and label not in selected:
+            continue
+        results.append(run_route(driver, label, method, fill(url, ids), fill(body, ids), args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'database': database_url.split('://')[0], 'scale': args.scale, 'skew': args.skew,
+                       'requests': args.requests, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from config import Config
+from models import db, User
+from replicas import primary_reads
+
+
+class TTLCache:
+    """Thread-safe in-process LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Cached value, or None when missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class LocalSharedBackend:
+    """In-process stand-in for a shared cache server (development and tests).
+
+    Stores JSON text like the Redis backend, so values go through the same
+    serialization they would in production.
+    """
+
+    def __init__(self):
+        self._cache = TTLCache(maxsize=100000, ttl=3600)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value, ttl):
+        self._cache.set(key, value, ttl=ttl)
+
+    def delete(self, key):
+        self._cache.delete(key)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._cache.get(key) or 0) + 1
+            self._cache.set(key, str(value))
+            return value
+
+
+class RedisBackend:
+    """Shared cache in Redis (needs the optional `redis` package)"""
+
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(key)
+        return value.decode() if value is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.set(key, value, ex=max(int(ttl), 1))
+
+    def delete(self, key):
+        self._client.delete(key)
+
+    def incr(self, key):
+        return self._client.incr(key)
+
+
+def make_shared_backend(name, url=None):
+    """Shared backend selected by CACHE_SHARED_BACKEND ('', 'local' or 'redis')"""
+    if not name:
+        return None
+    if name == 'local':
+        return LocalSharedBackend()
+    if name == 'redis':
+        return RedisBackend(url)
+    raise ValueError(f'Unknown cache backend: {name}')
+
+
+class TieredCache:
+    """In-process TTL/LRU cache in front of an optional shared backend.
+
+    Values must be JSON-serializable. A miss in the local layer falls through
+    to the shared backend (when configured), so a new worker starts warm.
+    `delete` clears both layers in this process; other processes drop their
+    local copy when its (short) local TTL runs out. A `local_ttl` of 0 turns
+    the local layer off, for values every process must see invalidated.
+    """
+
+    def __init__(self, namespace, maxsize=1024, local_ttl=30.0, shared=None, shared_ttl=300.0):
+        self.namespace = namespace
+        self.local = TTLCache(maxsize=maxsize, ttl=local_ttl)
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self.shared_hits = 0
+
+    def _key(self, key):
+        return f'{self.namespace}:{key}'
+
+    def get(self, key):
+        value = self.local.get(key) if self.local.ttl > 0 else None
+        if value is not None or self.shared is None:
+            return value
+        try:
+            raw = self.shared.get(self._key(key))
+        except Exception:
+            # A shared cache outage only costs the database round trip
+            return None
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self.shared_hits += 1
+        if self.local.ttl > 0:
+            self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        if self.local.ttl > 0:
+            self.local.set(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(self._key(key), json.dumps(value), self.shared_ttl)
+            except Exception:
+                pass
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            try:
+                self.shared.delete(self._key(key))
+            except Exception:
+                pass
+
+    def stats(self):
+        return dict(self.local.stats(), shared=type(self.shared).__name__ if self.shared else None,
+                    shared_hits=self.shared_hits)
+
+
+# --- Identity cache for Flask-Login's user_loader ---
+
+# Columns the navbar and ownership checks read from current_user
+CACHED_USER_COLUMNS = ('id', 'username', 'first_name', 'last_name')
+
+
+class CachedUser(UserMixin):
+    """Slim, detached stand-in for the logged-in User.
+
+    Carries only CACHED_USER_COLUMNS; code that needs the full row (or wants
+    to modify it) loads it with `db.session.get(User, current_user.id)`.
+    """
+
+    def __init__(self, values):
+        for column in CACHED_USER_COLUMNS:
+            setattr(self, column, values[column])
+        self._unread_messages = None
+
+    @property
+    def unread_messages(self):
+        """Read once per request when a page shows it; it changes too often to cache"""
+        if self._unread_messages is None:
+            self._unread_messages = db.session.query(User.unread_messages) \
+                .filter(User.id == self.id).scalar() or 0
+        return self._unread_messages
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+
+_shared_backend = make_shared_backend(Config.CACHE_SHARED_BACKEND, Config.CACHE_REDIS_URL)
+
+user_cache = TieredCache(
+    'user',
+    maxsize=Config.USER_CACHE_SIZE,
+    # Per-process copies outlive another worker's invalidation; see USER_CACHE_LOCAL_TTL
+    local_ttl=Config.USER_CACHE_LOCAL_TTL,
+    shared=_shared_backend,
+    shared_ttl=Config.CACHE_SHARED_TTL
+)
+
+
+def load_cached_user(user_id):
+    """CachedUser for a session's user id, from the cache or one slim query"""
+    values = user_cache.get(user_id)
+    if values is None:
+        row = db.session.query(*(getattr(User, column) for column in CACHED_USER_COLUMNS)) \
+            .filter(User.id == user_id).first()
+        if row is None:
+            return None
+        values = dict(row._mapping)
+        user_cache.set(user_id, values)
+    return CachedUser(values)
+
+
+def invalidate_user(session, user_id):
+    """Drop a member's cached identity once `session` commits"""
+    on_commit(session, user_cache.delete, user_id)
+
+
+# --- Rendered fragments shared by every member ---
+
+class FragmentCache:
+    """Rendered HTML fragments grouped in namespaces ('forum', 'photos', ...).
+
+    Each namespace has a version number that is part of every key, so
+    bumping it invalidates all of the namespace's fragments at once, in every
+    process when the version lives in the shared backend. Fragments must not
+    depend on who is looking at them.
+    """
+
+    def __init__(self, cache, shared=None):
+        self.cache = cache
+        self.shared = shared
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def version(self, namespace):
+        if self.shared is not None:
+            try:
+                return int(self.shared.get(f'fragver:{namespace}') or 0)
+            except Exception:
+                pass
+        return self._versions.get(namespace, 0)
+
+    def bump(self, *namespaces):
+        for namespace in namespaces:
+            with self._lock:
+                self._versions[namespace] = self._versions.get(namespace, 0) + 1
+            if self.shared is not None:
+                try:
+                    self.shared.incr(f'fragver:{namespace}')
+                except Exception:
+                    pass
+
+    def get_or_render(self, namespace, key, render):
+        """Cached fragment, or `render()`'s output (cached for the next request).
+
+        Misses render from the primary: a lagging replica read right after the
+        bump would be cached under the new version for the whole TTL.
+        """
+        cache_key = f'{namespace}:{self.version(namespace)}:{key}'
+        html = self.cache.get(cache_key)
+        if html is None:
+            with primary_reads():
+                html = str(render())
+            self.cache.set(cache_key, html)
+        return Markup(html)
+
+    def stats(self):
+        return dict(self.cache.stats(), versions={
+            namespace: self.version(namespace) for namespace in sorted(self._versions)
+        })
+
+
+fragment_cache = FragmentCache(
+    TieredCache(
+        'fragment',
+        maxsize=Config.FRAGMENT_CACHE_SIZE,
+        # Without a shared backend, version bumps stay in the writing process
+        local_ttl=Config.FRAGMENT_CACHE_TTL if _shared_backend is not None else Config.FRAGMENT_CACHE_UNSHARED_TTL,
+        shared=_shared_backend,
+        shared_ttl=Config.FRAGMENT_CACHE_TTL
+    ),
+    shared=_shared_backend
+)
+
+# Every listing a member's name appears in
+MEMBER_FRAGMENTS = ('forum', 'photos', 'videos', 'activity')
+
+
+def invalidate_fragments(session, *namespaces):
+    """Bump the fragment namespaces once `session` commits"""
+    on_commit(session, fragment_cache.bump, *namespaces)
+
+
+# --- Invalidation hooks ---
+
+def on_commit(session, callback, *args):
+    """Run `callback(*args)` after `session` commits; dropped on rollback.
+
+    Invalidating only after the commit keeps a concurrent request from
+    re-caching the old data between the invalidation and the write.
+    """
+    session.info.setdefault('after_commit', {})[(callback, args)] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_commit_callbacks(session):
+    for callback, args in session.info.pop('after_commit', {}):
+        callback(*args)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_commit_callbacks(session):
+    session.info.pop('after_commit', None)
@@ -1,9 +1,66 @@
 import os
 from dotenv import load_dotenv
+from dbpool import TimedQueuePool
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, '.env'))
 
+
+def _env_flag(name, default=''):
+    return (os.environ.get(name) or default).lower() in ('1', 'true', 'yes')
+
+
+def database_uri(url):
+    """Normalize DATABASE_URL; PostgreSQL URLs without a driver use psycopg 3"""
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    if url.startswith('postgresql://'):
+        url = 'postgresql+psycopg://' + url[len('postgresql://'):]
+    return url
+
+
+def engine_options(uri):
+    """SQLALCHEMY_ENGINE_OPTIONS from the DB_* environment variables.
+
+    Every gunicorn worker process has its own pool, so DB_POOL_SIZE is per
+    process: by default one connection per request thread plus one per
+    background upload worker. Workers x (pool size + overflow) must stay
+    below the server's max_connections (or PgBouncer's pool).
+    """
+    if not uri.startswith('postgresql'):
+        return {}
+    threads = int(os.environ.get('GUNICORN_THREADS') or 4)
+    upload_workers = int(os.environ.get('UPLOAD_WORKERS') or 2)
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE') or threads + upload_workers),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or 2),
+        # Seconds a request waits for a free connection before failing
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT') or 10),
+        # Recycle before server/proxy idle timeouts close connections under us
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE') or 1800),
+        'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', '1'),
+    }
+    connect_args = {
+        'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT') or 5),
+        'application_name': os.environ.get('DB_APPLICATION_NAME') or 'sabis',
+    }
+    if _env_flag('DB_PGBOUNCER'):
+        # Transaction pooling: server connections change between transactions,
+        # so no server-side prepared statements and no session settings
+        # (set statement_timeout etc. on the database role instead)
+        connect_args['prepare_threshold'] = None
+    else:
+        statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS') or 30000)
+        idle_timeout = int(os.environ.get('DB_IDLE_IN_TRANSACTION_TIMEOUT_MS') or 60000)
+        connect_args['options'] = (f'-c statement_timeout={statement_timeout} '
+                                   f'-c idle_in_transaction_session_timeout={idle_timeout}')
+        if os.environ.get('DB_PREPARE_THRESHOLD'):
+            connect_args['prepare_threshold'] = int(os.environ['DB_PREPARE_THRESHOLD'])
+    options['connect_args'] = connect_args
+    return options
+
+
 class Config:
     """Flask application configuration"""
     
@@ -11,21 +68,167 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     
     # Database configuration
-    # Database configuration
-    database_url = os.environ.get('DATABASE_URL')
-    if database_url and database_url.startswith("postgres://"):
-        database_url = database_url.replace("postgres://", "postgresql://", 1)
-        
-    SQLALCHEMY_DATABASE_URI = database_url or \
-        'postgresql://abdulkadiralan@localhost/sabis_db'
+    SQLALCHEMY_DATABASE_URI = database_uri(os.environ.get('DATABASE_URL') or
+                                           'postgresql://abdulkadiralan@localhost/sabis_db')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Read replicas (comma-separated URLs) for GET requests; after a write the
+    # browser reads from the primary for REPLICA_STICKY_SECONDS
+    DATABASE_REPLICA_URLS = [database_uri(url.strip())
+                             for url in (os.environ.get('DATABASE_REPLICA_URLS') or '').split(',') if url.strip()]
+    REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS') or 10)
     
     # Upload configuration
     UPLOAD_FOLDER = os.path.join(basedir, os.environ.get('UPLOAD_FOLDER') or 'static/uploads')
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH') or 16 * 1024 * 1024)  # 16MB max
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
     
-    # Thumbnail settings
+    # Background media uploads: requests spool files here and return at once
+    UPLOAD_SPOOL_FOLDER = os.path.join(basedir, os.environ.get('UPLOAD_SPOOL_FOLDER') or 'instance/upload_spool')
+    UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS') or 2)
+    UPLOAD_QUEUE_SIZE = int(os.environ.get('UPLOAD_QUEUE_SIZE') or 100)
+    UPLOAD_MAX_RETRIES = int(os.environ.get('UPLOAD_MAX_RETRIES') or 3)
+    UPLOAD_RETRY_DELAY = float(os.environ.get('UPLOAD_RETRY_DELAY') or 2)
+    # Media deletions: outbox drained in batches of 100 ids, several batches at once
+    MEDIA_DELETE_CONCURRENCY = int(os.environ.get('MEDIA_DELETE_CONCURRENCY') or 4)
+    MEDIA_DELETE_MAX_ATTEMPTS = int(os.environ.get('MEDIA_DELETE_MAX_ATTEMPTS') or 5)
+    # Rows a drainer claimed stay off limits this long, even if it dies mid-drain
+    MEDIA_DELETE_CLAIM_SECONDS = int(os.environ.get('MEDIA_DELETE_CLAIM_SECONDS') or 300)
+    # Cached identity of logged-in members (see cache.py); a shared backend
+    # ('local' stand-in or 'redis') lets workers share warm entries
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 10000)
+    USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL') or 30)
+    CACHE_SHARED_BACKEND = os.environ.get('CACHE_SHARED_BACKEND') or ''
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL') or 'redis://localhost:6379/0'
+    CACHE_SHARED_TTL = float(os.environ.get('CACHE_SHARED_TTL') or 300)
+    # Seconds a worker keeps a member in its own memory. Deleting or renaming
+    # a member invalidates only the shared layer and the writing worker, so
+    # with several workers the others may see the old identity this long;
+    # the unread count is never cached (see CachedUser)
+    USER_CACHE_LOCAL_TTL = float(os.environ.get('USER_CACHE_LOCAL_TTL') or (
+        USER_CACHE_TTL if os.environ.get('WEB_CONCURRENCY') == '1' else 5))
+    # Rendered listings (recent posts, forum pages, galleries); writes
+    # invalidate them explicitly, the TTL only bounds memory use. That only
+    # holds with CACHE_SHARED_BACKEND=redis: otherwise every worker process
+    # keeps its own invalidation state, a write reaches only the worker that
+    # handled it, and the others may serve the old listing for
+    # FRAGMENT_CACHE_UNSHARED_TTL seconds (the full TTL when WEB_CONCURRENCY=1)
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE') or 512)
+    FRAGMENT_CACHE_TTL = float(os.environ.get('FRAGMENT_CACHE_TTL') or 300)
+    FRAGMENT_CACHE_UNSHARED_TTL = float(os.environ.get('FRAGMENT_CACHE_UNSHARED_TTL') or (
+        FRAGMENT_CACHE_TTL if os.environ.get('WEB_CONCURRENCY') == '1' else 5))
+    # Per-request SQL statistics (X-Query-Count / Server-Timing headers, N+1
+    # warnings); SQL_QUERY_BUDGET=0 disables the budget, SQL_BUDGET_STRICT
+    # turns an overrun into an error (for tests)
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', '1').lower() in ('1', 'true', 'yes')
+    SQL_QUERY_BUDGET = int(os.environ.get('SQL_QUERY_BUDGET') or 0)
+    SQL_BUDGET_STRICT = os.environ.get('SQL_BUDGET_STRICT', '').lower() in ('1', 'true', 'yes')
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD') or 5)
+    # Run background tasks inline (tests, one-off scripts)
+    TASKS_EAGER = os.environ.get('TASKS_EAGER', '').lower() in ('1', 'true', 'yes')
+    # 'cloudinary', or 'local' to store media under UPLOAD_FOLDER without network access
+    MEDIA_BACKEND = os.environ.get('MEDIA_BACKEND') or \
+        ('cloudinary' if os.environ.get('CLOUDINARY_CLOUD_NAME') else 'local')
+    
+    # Pagination
+    FORUM_POSTS_PER_PAGE = int(os.environ.get('FORUM_POSTS_PER_PAGE') or 20)
+    FORUM_REPLIES_PER_PAGE = int(os.environ.get('FORUM_REPLIES_PER_PAGE') or 50)
+    ACTIVITY_PER_PAGE = int(os.environ.get('ACTIVITY_PER_PAGE') or 30)
+    MESSAGE_THREADS_PER_PAGE = int(os.environ.get('MESSAGE_THREADS_PER_PAGE') or 20)
+    PEOPLE_PER_PAGE = int(os.environ.get('PEOPLE_PER_PAGE') or 24)
+    CONVERSATION_MESSAGES_PER_PAGE = int(os.environ.get('CONVERSATION_MESSAGES_PER_PAGE') or 30)
+    SEARCH_RESULTS_PER_PAGE = int(os.environ.get('SEARCH_RESULTS_PER_PAGE') or 20)
+    AUTOCOMPLETE_LIMIT = int(os.environ.get('AUTOCOMPLETE_LIMIT') or 10)
+    VIDEOS_PER_PAGE = int(os.environ.get('VIDEOS_PER_PAGE') or 12)
+    PHOTOS_PER_PAGE = int(os.environ.get('PHOTOS_PER_PAGE') or 24)
+    # Hobby tags offered in the people filter, and "similar members" on profiles
+    HOBBY_FILTER_LIMIT = int(os.environ.get('HOBBY_FILTER_LIMIT') or 50)
+    SIMILAR_MEMBERS_LIMIT = int(os.environ.get('SIMILAR_MEMBERS_LIMIT') or 6)
+    
+    # YouTube metadata for /videos, fetched in the background and cached on
+    # the videos table: 'youtube' (oEmbed; durations need YOUTUBE_API_KEY for
+    # the Data API) or 'stub' for deterministic offline metadata in tests
+    VIDEO_METADATA_BACKEND = os.environ.get('VIDEO_METADATA_BACKEND') or 'youtube'
+    YOUTUBE_OEMBED_URL = os.environ.get('YOUTUBE_OEMBED_URL') or 'https://www.youtube.com/oembed'
+    YOUTUBE_API_KEY = os.environ.get('YOUTUBE_API_KEY') or ''
+    VIDEO_METADATA_TTL = float(os.environ.get('VIDEO_METADATA_TTL') or 7 * 24 * 3600)
+    VIDEO_METADATA_BATCH_SIZE = int(os.environ.get('VIDEO_METADATA_BATCH_SIZE') or 50)
+    VIDEO_METADATA_TIMEOUT = float(os.environ.get('VIDEO_METADATA_TIMEOUT') or 5)
+    
+    # Map: individual members from this zoom level on, grid clusters below it
+    MAP_CLUSTER_MAX_ZOOM = int(os.environ.get('MAP_CLUSTER_MAX_ZOOM') or 15)
+    MAP_MAX_POINTS = int(os.environ.get('MAP_MAX_POINTS') or 500)
+    # Location updates are buffered per process and written in bulk every
+    # LOCATION_FLUSH_INTERVAL_MS or LOCATION_FLUSH_SIZE members; updates within
+    # LOCATION_MIN_INTERVAL seconds or LOCATION_MIN_DISTANCE metres are dropped
+    LOCATION_FLUSH_INTERVAL_MS = int(os.environ.get('LOCATION_FLUSH_INTERVAL_MS') or 1000)
+    LOCATION_FLUSH_SIZE = int(os.environ.get('LOCATION_FLUSH_SIZE') or 500)
+    LOCATION_MIN_INTERVAL = float(os.environ.get('LOCATION_MIN_INTERVAL') or 5)
+    LOCATION_MIN_DISTANCE = float(os.environ.get('LOCATION_MIN_DISTANCE') or 25)
+    # At most one "location updated" feed event per member in this many seconds
+    ACTIVITY_LOCATION_INTERVAL = int(os.environ.get('ACTIVITY_LOCATION_INTERVAL') or 900)
+    
+    # Live notices over Server-Sent Events (/events): new messages, tags and
+    # forum replies. An open stream holds a thread on gthread workers, so
+    # EVENTS_MAX_STREAMS per process defaults to half of GUNICORN_THREADS
+    # there; gevent workers hold streams cheaply. For the same reason only
+    # pages with live content (an open forum thread) connect, unless
+    # EVENTS_ON_EVERY_PAGE, the default with gevent, adds the stream to every
+    # page for the navbar notices. A busy worker answers with a stream that
+    # only asks the browser to come back in EVENTS_BUSY_RETRY seconds.
+    # EVENTS_BROKER ('local' stand-in or 'redis') fans events out to every
+    # worker process; empty keeps them in the process that published them
+    EVENTS_BROKER = os.environ.get('EVENTS_BROKER') or ''
+    EVENTS_REDIS_URL = os.environ.get('EVENTS_REDIS_URL') or os.environ.get('CACHE_REDIS_URL') or \
+        'redis://localhost:6379/0'
+    EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS') or (
+        1000 if os.environ.get('GUNICORN_WORKER_CLASS') == 'gevent'
+        else max(int(os.environ.get('GUNICORN_THREADS') or 4) // 2, 1)))
+    EVENTS_ON_EVERY_PAGE = os.environ.get(
+        'EVENTS_ON_EVERY_PAGE', '1' if os.environ.get('GUNICORN_WORKER_CLASS') == 'gevent' else '0'
+    ).lower() in ('1', 'true', 'yes')
+    EVENTS_BUSY_RETRY = int(os.environ.get('EVENTS_BUSY_RETRY') or 60)
+    EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE') or 100)
+    EVENTS_HEARTBEAT = float(os.environ.get('EVENTS_HEARTBEAT') or 15)
+    EVENTS_STREAM_TIMEOUT = float(os.environ.get('EVENTS_STREAM_TIMEOUT') or 300)
+    
+    # Token-bucket rate limits on write endpoints, by endpoint: `rate` requests
+    # per `per` seconds with bursts of up to `burst`, counted per member
+    # ('user'; the client IP when logged out), per client IP ('ip') and/or
+    # per login name tried from a client IP ('ip_username'). An endpoint may
+    # list several policies. 'memory' keeps buckets per process (each worker
+    # allows the full rate); 'redis' shares them
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND') or 'memory'
+    RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL') or os.environ.get('CACHE_REDIS_URL') or \
+        'redis://localhost:6379/0'
+    RATE_LIMIT_MAX_BUCKETS = int(os.environ.get('RATE_LIMIT_MAX_BUCKETS') or 100000)
+    RATE_LIMITS = {
+        # Password hashing is deliberately slow: cap attempts per IP, and
+        # guesses at one account per IP, so nobody can lock a member out
+        'main.login': [
+            {'rate': 30, 'per': 60, 'burst': 30, 'keys': ('ip',)},
+            {'rate': 10, 'per': 60, 'burst': 10, 'keys': ('ip_username',)},
+        ],
+        'main.register': {'rate': 5, 'per': 3600, 'burst': 3, 'keys': ('ip',)},
+        'main.create_post': {'rate': 10, 'per': 600, 'burst': 5},
+        'main.view_post': {'rate': 30, 'per': 600, 'burst': 10},
+        'main.send_message': {'rate': 30, 'per': 600, 'burst': 10},
+        'main.tag_photo': {'rate': 60, 'per': 60, 'burst': 20},
+        'main.update_location': {'rate': 30, 'per': 60, 'burst': 10},
+        'main.upload_photo': {'rate': 20, 'per': 3600, 'burst': 5},
+        'main.add_video': {'rate': 20, 'per': 3600, 'burst': 5},
+    }
+    # Proxies in front of the app that set X-Forwarded-For (1 on Render or
+    # behind nginx); without it every client shares the proxy's IP
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR') or 0)
+    
+    # Full-text search: 'auto' picks PostgreSQL tsvector or SQLite FTS5 from the
+    # database URL; 'memory' keeps an in-process index (development only)
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND') or 'auto'
+    
+    # Image processing before upload: long side cap and gallery thumbnail size
+    IMAGE_MAX_SIZE = int(os.environ.get('IMAGE_MAX_SIZE') or 800)
     THUMBNAIL_SIZE = (150, 150)
     
     # Cloudinary configuration
@@ -33,6 +236,25 @@ class Config:
     CLOUDINARY_API_KEY = os.environ.get('CLOUDINARY_API_KEY')
     CLOUDINARY_API_SECRET = os.environ.get('CLOUDINARY_API_SECRET')
     
+    # Named delivery transformations used by the cloudinary_url / cloudinary_img
+    # template filters; 'sizes' is the <img sizes> hint for the srcset variants
+    CLOUDINARY_PRESETS = {
+        'original': {
+            'options': {'crop': 'limit', 'quality': 'auto', 'fetch_format': 'auto'},
+            'sizes': '(max-width: 800px) 100vw, 800px',
+        },
+        'thumbnail': {
+            'options': {'width': 150, 'height': 150, 'crop': 'fill', 'quality': 'auto', 'fetch_format': 'auto'},
+            'sizes': '150px',
+        },
+        'profile': {
+            'options': {'width': 400, 'height': 400, 'crop': 'fill', 'quality': 'auto', 'fetch_format': 'auto'},
+            'sizes': '(max-width: 400px) 100vw, 400px',
+        },
+    }
+    CLOUDINARY_SRCSET_WIDTHS = (150, 400, 800)
+    CLOUDINARY_URL_CACHE_SIZE = int(os.environ.get('CLOUDINARY_URL_CACHE_SIZE') or 4096)
+    
     # Session configuration
     SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
     SESSION_COOKIE_HTTPONLY = True
@@ -0,0 +1,52 @@
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a free connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.peak_checkedout = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            with self._metrics_lock:
+                self.timeouts += 1
+            raise
+        waited = time.perf_counter() - started
+        with self._metrics_lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            self.peak_checkedout = max(self.peak_checkedout, self.checkedout())
+        return record
+
+
+def pool_stats(engine):
+    """Occupancy of an engine's pool, plus wait times when it is a TimedQueuePool"""
+    pool = engine.pool
+    stats = {'class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(size=pool.size(), checked_out=pool.checkedout(), idle=pool.checkedin(),
+                     overflow=pool.overflow(), max_overflow=pool._max_overflow, timeout=pool.timeout())
+    if isinstance(pool, TimedQueuePool):
+        with pool._metrics_lock:
+            stats.update(
+                checkouts=pool.checkouts,
+                peak_checked_out=pool.peak_checkedout,
+                timeouts=pool.timeouts,
+                wait_avg_ms=round(pool.wait_total / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+                wait_max_ms=round(pool.wait_max * 1000, 3)
+            )
+    return stats
@@ -0,0 +1,60 @@
+from sqlalchemy import or_
+from sqlalchemy.orm import load_only
+from models import User, Hobby, user_hobbies
+from pagination import keyset_paginate
+from utils import fold_turkish
+
+# Columns a profile card needs; `about`, `hobbies` and the password hash stay in the database
+CARD_COLUMNS = (User.id, User.username, User.first_name, User.last_name, User.school, User.profile_photo)
+
+
+def search_people(q=None, school=None, birth_place=None, gender=None, hobby=None, cursor=None, per_page=24):
+    """One page of the member directory in name order, filtered and searched.
+
+    Each word of `q` must appear in the folded name/username key, which the
+    trigram index answers on PostgreSQL; the filters are plain equality
+    predicates on indexed columns. `hobby` is a tag slug, looked up in the
+    hobby tag index (see hobbies.py).
+    """
+    query = User.query.options(load_only(*CARD_COLUMNS))
+
+    for word in fold_turkish(q or '').split():
+        query = query.filter(User.search_key.contains(word, autoescape=True))
+    if school:
+        query = query.filter(User.school == school)
+    if birth_place:
+        query = query.filter(User.birth_place == birth_place)
+    if gender:
+        query = query.filter(User.gender == gender)
+    if hobby:
+        query = query.join(user_hobbies, user_hobbies.c.user_id == User.id) \
+            .join(Hobby, Hobby.id == user_hobbies.c.hobby_id).filter(Hobby.slug == hobby)
+
+    return keyset_paginate(
+        query,
+        (User.first_name, User.last_name, User.id),
+        cursor=cursor,
+        per_page=per_page,
+        descending=False
+    )
+
+
+def autocomplete_users(term, limit=10, exclude_id=None):
+    """Members whose first name, last name or username starts with each typed word.
+
+    Both LIKE patterns are answered by the trigram index on PostgreSQL, so the
+    cost depends on the number of matches rather than on the member count.
+    """
+    words = fold_turkish(term or '').split()
+    if not words:
+        return []
+
+    query = User.query.options(load_only(*CARD_COLUMNS))
+    for word in words:
+        query = query.filter(or_(
+            User.search_key.startswith(word, autoescape=True),
+            User.search_key.contains(' ' + word, autoescape=True)
+        ))
+    if exclude_id is not None:
+        query = query.filter(User.id != exclude_id)
+    return query.order_by(User.first_name, User.last_name, User.id).limit(limit).all()
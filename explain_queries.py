@@ -0,0 +1,177 @@
+"""Print the query plan of every SELECT each page runs against a seeded database.
+
+Usage:
+    python explain_queries.py                                   # temporary SQLite file
+    python explain_queries.py --database-url postgresql://localhost/sabis_explain
+    python explain_queries.py --fail-on-scan                    # exit 1 on full scans
+    python explain_queries.py --query-budget 5                  # exit 1 above 5 queries a page
+
+The target database must be empty: it is migrated and seeded with synthetic
+data first. Each route is requested through Flask's test client as a seeded
+member, every SELECT it issues is captured and explained with the same
+parameters. Full table scans and repeated same-shape queries (N+1 lazy loads)
+are reported so index and eager-loading regressions show up in CI.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='Empty database to seed (default: temporary SQLite file)')
+    parser.add_argument('--users', type=int, default=200, help='Number of synthetic members')
+    parser.add_argument('--fail-on-scan', action='store_true', help='Exit with status 1 if any query scans a whole table')
+    parser.add_argument('--query-budget', type=int, help='Exit with status 1 if any page runs more queries than this')
+    parser.add_argument('--verbose', action='store_true', help='Print the full plan of every query')
+    return parser.parse_args()
+
+
+# (endpoint label, URL); placeholders are filled from the seeded data
+ROUTES = [
+    ('index', '/'),
+    ('forum', '/forum'),
+    ('forum_active', '/forum?sort=active'),
+    ('view_post', '/forum/{post_id}'),
+    ('people', '/people'),
+    ('people_by_hobby', '/people?hobby=spor'),
+    ('profile', '/profile/{user_id}'),
+    ('photos', '/photos'),
+    ('photo_detail', '/photos/{photo_id}'),
+    ('videos', '/videos'),
+    ('messages', '/messages'),
+    ('view_message', '/messages/{message_id}'),
+    ('send_message', '/messages/send'),
+    ('activity', '/activity'),
+    ('map_view', '/map'),
+    ('map_points', '/map/points?bbox=26,36,45,42&zoom=6'),
+    ('map_points_detail', '/map/points?bbox=30,38,30.5,38.3&zoom=16'),
+    ('site_search', '/search?q=kampus'),
+    ('users_autocomplete', '/api/users/autocomplete?q=ay'),
+]
+
+
+def route_ids(user_id):
+    """Pick existing rows the logged-in member is allowed to see"""
+    from models import Photo, ForumPost, Message
+    message = Message.query.filter_by(recipient_id=user_id).first()
+    return {
+        'user_id': user_id,
+        'post_id': ForumPost.query.order_by(ForumPost.id).first().id,
+        'photo_id': Photo.query.order_by(Photo.id).first().id,
+        'message_id': message.id if message else 0,
+    }
+
+
+def explain_statement(connection, statement, parameters):
+    """Return the plan lines of one captured statement"""
+    if connection.dialect.name == 'postgresql':
+        rows = connection.exec_driver_sql('EXPLAIN ' + statement, parameters).all()
+        return [row[0] for row in rows]
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan):
+    """Plan lines that read an entire table"""
+    scans = []
+    for line in plan:
+        stripped = line.strip().lstrip('->').strip()
+        if stripped.startswith('Seq Scan'):
+            scans.append(stripped)
+        elif stripped.startswith('SCAN ') and ' USING ' not in stripped and ' VIRTUAL TABLE INDEX ' not in stripped:
+            # FTS5 lookups show up as virtual table scans driven by the full-text index
+            if stripped.startswith('SCAN anon_'):
+                # A subquery's (already filtered) result, not a table
+                continue
+            scans.append(stripped)
+    return scans
+
+
+def main():
+    args = parse_args()
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'explain.db')
+    os.environ['DATABASE_URL'] = database_url
+    # URLs are only built, never fetched, so any cloud name will do
+    os.environ.setdefault('CLOUDINARY_CLOUD_NAME', 'demo')
+    # Video metadata from the offline stub, fetched inline
+    os.environ.setdefault('VIDEO_METADATA_BACKEND', 'stub')
+    os.environ.setdefault('TASKS_EAGER', '1')
+
+    from sqlalchemy import event
+    from app import create_app
+    from instrumentation import track_queries
+    from models import db
+    from migrations import upgrade
+    from seed import seed_database
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    with app.app_context():
+        upgrade()
+        seed_database({'users': args.users})
+        ids = route_ids(user_id=1)
+        engine = db.engine
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            captured.append((statement, parameters))
+
+    # Requests run outside the seeding app context so each one gets a fresh
+    # session, exactly like production (no identity map carried over)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+
+    flagged = 0
+    over_budget = []
+    repeated_threshold = app.config['SQL_N_PLUS_ONE_THRESHOLD']
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        with engine.connect() as connection:
+            if connection.dialect.name == 'postgresql':
+                # Make the planner prefer any usable index, so tiny seeded
+                # tables still show whether an index exists for the query
+                connection.exec_driver_sql('SET enable_seqscan = off')
+
+            for label, url in ROUTES:
+                url = url.format(**ids)
+                captured.clear()
+                with track_queries() as stats:
+                    response = client.get(url)
+                statements = list(captured)
+                print(f'\n== {label} ({url}) -> {response.status_code}, {stats.count} queries')
+                for shape, count in stats.repeated(repeated_threshold):
+                    print(f'  N+1  {count} x {shape[:100]}')
+                if args.query_budget is not None and stats.count > args.query_budget:
+                    over_budget.append(label)
+
+                seen = set()
+                for statement, parameters in statements:
+                    if statement in seen:
+                        continue
+                    seen.add(statement)
+                    plan = explain_statement(connection, statement, parameters)
+                    scans = full_scans(plan)
+                    flagged += bool(scans)
+                    first_line = ' '.join(statement.split())[:110]
+                    print(f'  {"SCAN" if scans else "ok  "} {first_line}')
+                    for line in (plan if args.verbose else scans):
+                        print(f'         {line}')
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+    print(f'\n{flagged} queries with full table scans')
+    if over_budget:
+        print(f'Over the query budget of {args.query_budget}: {", ".join(over_budget)}')
+    if (args.fail_on_scan and flagged) or over_budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,34 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
-from wtforms import StringField, PasswordField, TextAreaField, SelectField, RadioField, SelectMultipleField, SubmitField, BooleanField
+from wtforms import StringField, IntegerField, PasswordField, TextAreaField, SelectField, RadioField, SelectMultipleField, SubmitField, BooleanField
+from wtforms.widgets import HiddenInput
 from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError, Optional
-from models import User
+from flask_login import current_user
+from models import db, User
+
+# Choices shared by the registration, profile and people search forms
+GENDER_CHOICES = [('male', 'Erkek'), ('female', 'Kadın'), ('other', 'Diğer')]
+
+BIRTH_PLACE_CHOICES = [
+    ('', 'Seçiniz...'),
+    ('istanbul', 'İstanbul'),
+    ('ankara', 'Ankara'),
+    ('izmir', 'İzmir'),
+    ('bursa', 'Bursa'),
+    ('antalya', 'Antalya'),
+    ('adana', 'Adana'),
+    ('other', 'Diğer')
+]
+
+SCHOOL_CHOICES = [
+    ('', 'Seçiniz...'),
+    ('bogazici', 'Boğaziçi Üniversitesi'),
+    ('metu', 'ODTÜ'),
+    ('itu', 'İTÜ'),
+    ('hacettepe', 'Hacettepe Üniversitesi'),
+    ('bilkent', 'Bilkent Üniversitesi'),
+    ('other', 'Diğer')
+]
 
 class RegistrationForm(FlaskForm):
     """User registration form with all required form elements"""
@@ -25,33 +51,16 @@ class RegistrationForm(FlaskForm):
     
     # Radiobutton - Gender
     gender = RadioField('Cinsiyet', 
-                       choices=[('male', 'Erkek'), ('female', 'Kadın'), ('other', 'Diğer')],
+                       choices=GENDER_CHOICES,
                        validators=[DataRequired()])
     
     # Combobox/Select - Birth Place
     birth_place = SelectField('Doğum Yeri',
-                             choices=[
-                                 ('', 'Seçiniz...'),
-                                 ('istanbul', 'İstanbul'),
-                                 ('ankara', 'Ankara'),
-                                 ('izmir', 'İzmir'),
-                                 ('bursa', 'Bursa'),
-                                 ('antalya', 'Antalya'),
-                                 ('adana', 'Adana'),
-                                 ('other', 'Diğer')
-                             ])
+                             choices=BIRTH_PLACE_CHOICES)
     
     # Combobox/Select - School
     school = SelectField('Okul',
-                        choices=[
-                            ('', 'Seçiniz...'),
-                            ('bogazici', 'Boğaziçi Üniversitesi'),
-                            ('metu', 'ODTÜ'),
-                            ('itu', 'İTÜ'),
-                            ('hacettepe', 'Hacettepe Üniversitesi'),
-                            ('bilkent', 'Bilkent Üniversitesi'),
-                            ('other', 'Diğer')
-                        ])
+                        choices=SCHOOL_CHOICES)
     
     # Text input - Hobbies (comma-separated tags)
     hobbies = StringField('Hobiler',
@@ -81,6 +90,48 @@ class RegistrationForm(FlaskForm):
             raise ValidationError('Bu e-posta adresi zaten kayıtlı.')
 
 
+class PeopleSearchForm(FlaskForm):
+    """People directory search and filters (submitted with GET)"""
+    
+    class Meta:
+        csrf = False
+    
+    q = StringField('Ara', 
+                   validators=[Optional(), Length(max=100)],
+                   render_kw={'placeholder': 'İsim veya kullanıcı adı...'})
+    school = SelectField('Okul', 
+                        choices=[('', 'Tüm okullar')] + SCHOOL_CHOICES[1:],
+                        validators=[Optional()])
+    birth_place = SelectField('Doğum Yeri', 
+                             choices=[('', 'Tüm şehirler')] + BIRTH_PLACE_CHOICES[1:],
+                             validators=[Optional()])
+    gender = SelectField('Cinsiyet', 
+                        choices=[('', 'Tümü')] + GENDER_CHOICES,
+                        validators=[Optional()])
+    # Choices are the popular hobby tags, filled in by the view
+    hobby = SelectField('Hobi', 
+                       choices=[('', 'Tüm hobiler')],
+                       validators=[Optional()],
+                       validate_choice=False)
+    submit = SubmitField('Ara')
+
+
+class SiteSearchForm(FlaskForm):
+    """Full-text search over forum, video and photo content (submitted with GET)"""
+    
+    class Meta:
+        csrf = False
+    
+    q = StringField('Ara', 
+                   validators=[Optional(), Length(max=200)],
+                   render_kw={'placeholder': 'Forum, video veya fotoğraf ara...'})
+    type = SelectField('Tür', 
+                      choices=[('', 'Tümü'), ('post', 'Forum Konuları'), ('reply', 'Forum Yanıtları'),
+                               ('video', 'Videolar'), ('photo', 'Fotoğraflar')],
+                      validators=[Optional()])
+    submit = SubmitField('Ara')
+
+
 class LoginForm(FlaskForm):
     """User login form"""
     
@@ -100,28 +151,11 @@ class ProfileForm(FlaskForm):
     last_name = StringField('Soyad', 
                            validators=[DataRequired(), Length(max=50)])
     gender = RadioField('Cinsiyet', 
-                       choices=[('male', 'Erkek'), ('female', 'Kadın'), ('other', 'Diğer')])
+                       choices=GENDER_CHOICES)
     birth_place = SelectField('Doğum Yeri',
-                             choices=[
-                                 ('', 'Seçiniz...'),
-                                 ('istanbul', 'İstanbul'),
-                                 ('ankara', 'Ankara'),
-                                 ('izmir', 'İzmir'),
-                                 ('bursa', 'Bursa'),
-                                 ('antalya', 'Antalya'),
-                                 ('adana', 'Adana'),
-                                 ('other', 'Diğer')
-                             ])
+                             choices=BIRTH_PLACE_CHOICES)
     school = SelectField('Okul',
-                        choices=[
-                            ('', 'Seçiniz...'),
-                            ('bogazici', 'Boğaziçi Üniversitesi'),
-                            ('metu', 'ODTÜ'),
-                            ('itu', 'İTÜ'),
-                            ('hacettepe', 'Hacettepe Üniversitesi'),
-                            ('bilkent', 'Bilkent Üniversitesi'),
-                            ('other', 'Diğer')
-                        ])
+                        choices=SCHOOL_CHOICES)
     hobbies = StringField('Hobiler',
                          validators=[Length(max=500)],
                          render_kw={'placeholder': 'Örn: Kitap okuma, Spor, Müzik, Seyahat...'})
@@ -182,14 +216,20 @@ class ForumReplyForm(FlaskForm):
 class MessageForm(FlaskForm):
     """Private message form"""
     
-    recipient = SelectField('Alıcı', 
-                           coerce=int, 
-                           validators=[DataRequired()])
+    # Picked through the user autocomplete; only the id is submitted
+    recipient = IntegerField('Alıcı', 
+                            widget=HiddenInput(),
+                            validators=[DataRequired(message='Lütfen bir alıcı seçin.')])
     subject = StringField('Konu', 
                          validators=[Length(max=200)])
     content = TextAreaField('Mesaj', 
                            validators=[DataRequired(), Length(min=1)])
     submit = SubmitField('Gönder')
+    
+    def validate_recipient(self, recipient):
+        """Check the recipient exists with a single primary-key lookup"""
+        if recipient.data == current_user.id or db.session.get(User, recipient.data) is None:
+            raise ValidationError('Geçersiz alıcı.')
 
 
 class LocationForm(FlaskForm):
@@ -0,0 +1,66 @@
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import joinedload
+from models import db, ForumPost, ForumReply
+from pagination import encode_cursor, keyset_paginate
+
+# Forum list orders, each backed by an index: newest threads, or the
+# threads with the latest replies ("bumped") first
+SORT_COLUMNS = {
+    'new': (ForumPost.created_at, ForumPost.id),
+    'active': (ForumPost.last_activity_at, ForumPost.id),
+}
+
+
+def post_page(sort='new', cursor=None, per_page=20):
+    """One page of forum threads in the given order, with their authors"""
+    return keyset_paginate(
+        ForumPost.query.options(joinedload(ForumPost.author)),
+        SORT_COLUMNS.get(sort, SORT_COLUMNS['new']),
+        cursor=cursor,
+        per_page=per_page
+    )
+
+
+def reply_page(post_id, cursor=None, per_page=50):
+    """One page of a thread's replies, oldest first, with their authors loaded in the same query"""
+    return keyset_paginate(
+        ForumReply.query.options(joinedload(ForumReply.author)).filter(ForumReply.post_id == post_id),
+        (ForumReply.created_at, ForumReply.id),
+        cursor=cursor,
+        per_page=per_page,
+        descending=False
+    )
+
+
+def reply_cursor(reply):
+    """Cursor of the reply page that starts with `reply`"""
+    return encode_cursor((reply.created_at, reply.id - 1))
+
+
+def record_reply(post_id, replied_at):
+    """Count a new reply in its thread's summary, inside the current transaction"""
+    ForumPost.query.filter_by(id=post_id).update({
+        ForumPost.reply_count: ForumPost.reply_count + 1,
+        ForumPost.last_reply_at: replied_at,
+        ForumPost.last_activity_at: replied_at,
+        # A reply is not an edit of the post
+        ForumPost.updated_at: ForumPost.updated_at,
+    }, synchronize_session=False)
+
+
+def refresh_reply_stats(post_ids=None, connection=None):
+    """Recompute the reply summary of these posts (all posts when None) from their replies"""
+    posts, replies = ForumPost.__table__, ForumReply.__table__
+    count = select(func.count(replies.c.id)).where(replies.c.post_id == posts.c.id).scalar_subquery()
+    last_reply = select(func.max(replies.c.created_at)).where(replies.c.post_id == posts.c.id).scalar_subquery()
+    statement = update(posts).values(
+        reply_count=count,
+        last_reply_at=last_reply,
+        last_activity_at=func.coalesce(last_reply, posts.c.created_at),
+        updated_at=posts.c.updated_at
+    )
+    if post_ids is not None:
+        if not post_ids:
+            return
+        statement = statement.where(posts.c.id.in_(list(post_ids)))
+    (connection or db.session).execute(statement)
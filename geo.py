@@ -0,0 +1,73 @@
+# Integer geohash: longitude and latitude quantized to BITS bits each and
+# interleaved (longitude first, as in base32 geohashes). A cell at level L is
+# the geohash's top 2*L bits, so every cell is one contiguous integer range and
+# a plain B-tree index answers "points inside these cells" with range scans.
+# 2 * 26 bits fit a BIGINT and resolve to well under a metre.
+BITS = 26
+
+# Cap on the number of cells used to cover a bounding box (one range each, before merging)
+MAX_COVER_CELLS = 64
+
+
+def _spread(value):
+    """Insert a zero bit above every bit of `value`"""
+    result = 0
+    for bit in range(BITS):
+        result |= ((value >> bit) & 1) << (2 * bit)
+    return result
+
+
+def _quantize(value, low, high):
+    scaled = int((value - low) / (high - low) * (1 << BITS))
+    return min(max(scaled, 0), (1 << BITS) - 1)
+
+
+def _interleave(x, y):
+    return (_spread(x) << 1) | _spread(y)
+
+
+def encode_geohash(latitude, longitude):
+    """Integer geohash of a coordinate"""
+    return _interleave(_quantize(longitude, -180.0, 180.0), _quantize(latitude, -90.0, 90.0))
+
+
+def cell_divisor(level):
+    """Integer dividing a geohash down to its level-`level` cell"""
+    return 1 << (2 * (BITS - level))
+
+
+def cluster_level(zoom):
+    """Cell level whose cells are roughly a quarter of a map tile wide at `zoom`"""
+    return min(BITS, max(1, int(zoom) + 2))
+
+
+def cover_ranges(west, south, east, north):
+    """Sorted, merged [low, high) geohash ranges whose cells cover the box"""
+    x0, x1 = _quantize(west, -180.0, 180.0), _quantize(east, -180.0, 180.0)
+    y0, y1 = _quantize(south, -90.0, 90.0), _quantize(north, -90.0, 90.0)
+
+    # Finest level at which the box needs at most MAX_COVER_CELLS cells
+    level = BITS
+    while level > 0:
+        shift = BITS - level
+        cells = ((x1 >> shift) - (x0 >> shift) + 1) * ((y1 >> shift) - (y0 >> shift) + 1)
+        if cells <= MAX_COVER_CELLS:
+            break
+        level -= 1
+    if level == 0:
+        return [(0, 1 << (2 * BITS))]
+
+    shift = BITS - level
+    size = cell_divisor(level)
+    starts = sorted(
+        _interleave(cx, cy) * size
+        for cx in range(x0 >> shift, (x1 >> shift) + 1)
+        for cy in range(y0 >> shift, (y1 >> shift) + 1)
+    )
+    ranges = []
+    for start in starts:
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], start + size)
+        else:
+            ranges.append((start, start + size))
+    return ranges
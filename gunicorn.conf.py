@@ -0,0 +1,61 @@
+"""Production gunicorn settings, all overridable from the environment.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Workers are threaded (gthread) by default so a request waiting on Cloudinary
+or the database does not hold up a whole process. Set GUNICORN_WORKER_CLASS=
+gevent (and `pip install gevent`) for many slow, mostly idle connections,
+such as the live notice streams at /events: on gthread each open stream
+holds one of the worker's threads (see EVENTS_MAX_STREAMS in config.py).
+
+Reloading: `kill -HUP <master>` restarts the workers gracefully. With
+preload_app the code is loaded once in the master, so deploying new code
+needs a full restart (or `kill -USR2` followed by `kill -QUIT` of the old
+master).
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS') or 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY') or min(multiprocessing.cpu_count() * 2 + 1, 8))
+# Request threads per worker; the database pool is sized from the same
+# variable (see config.engine_options)
+threads = int(os.environ.get('GUNICORN_THREADS') or 4)
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS') or 200)
+
+# Import the app once in the master and fork workers from it: faster, smaller
+# workers. gevent must patch the standard library before the app is
+# imported, so it loads the app in each worker instead.
+preload_app = (os.environ.get('GUNICORN_PRELOAD') or ('0' if worker_class == 'gevent' else '1')) in ('1', 'true', 'yes')
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT') or 30)
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT') or 30)
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE') or 5)
+
+# Recycle workers now and then to contain slow memory growth
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS') or 2000)
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER') or 200)
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL') or 'info'
+
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the master; each worker opens its own.
+
+    Only a preloaded app exists before the fork. Without preload the worker
+    has not imported it yet, and must not: gevent patches the standard
+    library after this hook, so importing here would load the app unpatched.
+    """
+    if not server.cfg.preload_app:
+        return
+    from models import db
+    app = worker.app.wsgi()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    for engine in app.extensions.get('replica_engines', []):
+        engine.dispose(close=False)
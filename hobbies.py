@@ -0,0 +1,144 @@
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import load_only
+from models import db, Hobby, User, user_hobbies
+from directory import CARD_COLUMNS
+from utils import fold_turkish
+
+HOBBY_MAX_LENGTH = 100
+
+
+def parse_hobbies(text):
+    """Tags in a comma-separated hobby string as {slug: display name}; the first spelling wins"""
+    tags = {}
+    for part in (text or '').split(','):
+        name = ' '.join(part.split())[:HOBBY_MAX_LENGTH]
+        slug = fold_turkish(name)
+        if slug and slug not in tags:
+            tags[slug] = name
+    return tags
+
+
+def _insert_missing(connection, table):
+    """INSERT that skips rows whose unique key already exists (created concurrently)"""
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(table)
+    return dialect_insert(table).on_conflict_do_nothing()
+
+
+def _hobby_ids(connection, tags):
+    """{slug: id} for the tags in `tags`, creating the ones that do not exist yet"""
+    if not tags:
+        return {}
+    hobbies = Hobby.__table__
+    lookup = select(hobbies.c.slug, hobbies.c.id).where(hobbies.c.slug.in_(list(tags)))
+    ids = dict(connection.execute(lookup).all())
+    missing = [{'slug': slug, 'name': name, 'user_count': 0} for slug, name in tags.items() if slug not in ids]
+    if missing:
+        connection.execute(_insert_missing(connection, hobbies), missing)
+        ids = dict(connection.execute(lookup).all())
+    return ids
+
+
+def sync_user_hobbies(user_id, hobbies_text):
+    """Make a member's tags match their hobby string, adjusting tag counts.
+
+    Runs in the current session transaction; only the tags that changed are
+    written, and the counters are bumped in place like the unread counter.
+    """
+    connection = db.session.connection()
+    wanted = set(_hobby_ids(connection, parse_hobbies(hobbies_text)).values())
+    current = set(connection.execute(
+        select(user_hobbies.c.hobby_id).where(user_hobbies.c.user_id == user_id)
+    ).scalars())
+    hobbies = Hobby.__table__
+
+    removed = current - wanted
+    if removed:
+        connection.execute(delete(user_hobbies).where(
+            user_hobbies.c.user_id == user_id, user_hobbies.c.hobby_id.in_(removed)
+        ))
+        connection.execute(update(hobbies).where(hobbies.c.id.in_(removed))
+                           .values(user_count=hobbies.c.user_count - 1))
+    added = wanted - current
+    if added:
+        connection.execute(insert(user_hobbies), [{'user_id': user_id, 'hobby_id': hobby_id} for hobby_id in added])
+        connection.execute(update(hobbies).where(hobbies.c.id.in_(added))
+                           .values(user_count=hobbies.c.user_count + 1))
+
+
+def rebuild_hobby_index(connection, batch_size=1000):
+    """Rebuild every member's tags and the tag counts from the hobby strings"""
+    users = User.__table__
+    hobbies = Hobby.__table__
+    connection.execute(delete(user_hobbies))
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(users.c.id, users.c.hobbies).where(users.c.id > last_id).order_by(users.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        tags = {row.id: parse_hobbies(row.hobbies) for row in rows}
+        ids = _hobby_ids(connection, {slug: name for user_tags in tags.values() for slug, name in user_tags.items()})
+        memberships = [{'user_id': user_id, 'hobby_id': ids[slug]}
+                       for user_id, user_tags in tags.items() for slug in user_tags]
+        if memberships:
+            connection.execute(insert(user_hobbies), memberships)
+        last_id = rows[-1].id
+
+    count = (select(func.count()).select_from(user_hobbies)
+             .where(user_hobbies.c.hobby_id == hobbies.c.id).scalar_subquery())
+    connection.execute(update(hobbies).values(user_count=count))
+
+
+def popular_hobbies(limit=50):
+    """Tags with members, most popular first (read from the precomputed counts)"""
+    return (Hobby.query.filter(Hobby.user_count > 0)
+            .order_by(Hobby.user_count.desc(), Hobby.slug).limit(limit).all())
+
+
+def similar_members(user_id, limit=6):
+    """Members whose hobby tags are most similar (Jaccard) to this member's.
+
+    Candidates come from the inverted index: only members sharing at least
+    one tag are read, one index range per tag the member has, so the cost
+    follows the popularity of their tags rather than the member count.
+    Returns (user, score, shared tag count) tuples, best first.
+    """
+    mine = select(user_hobbies.c.hobby_id).where(user_hobbies.c.user_id == user_id)
+    my_count = db.session.execute(select(func.count()).select_from(mine.subquery())).scalar()
+    if not my_count:
+        return []
+
+    other = user_hobbies.alias('other')
+    shared = (
+        select(other.c.user_id, func.count().label('shared'))
+        .where(other.c.hobby_id.in_(mine), other.c.user_id != user_id)
+        .group_by(other.c.user_id)
+        .subquery()
+    )
+    totals = (
+        select(user_hobbies.c.user_id, func.count().label('total'))
+        .where(user_hobbies.c.user_id.in_(select(shared.c.user_id)))
+        .group_by(user_hobbies.c.user_id)
+        .subquery()
+    )
+    # |A ∩ B| / |A ∪ B|
+    score = (shared.c.shared * 1.0 / (my_count + totals.c.total - shared.c.shared)).label('score')
+    rows = db.session.execute(
+        select(shared.c.user_id, shared.c.shared, score)
+        .join(totals, totals.c.user_id == shared.c.user_id)
+        .order_by(score.desc(), shared.c.shared.desc(), shared.c.user_id)
+        .limit(limit)
+    ).all()
+    if not rows:
+        return []
+
+    users = {user.id: user for user in User.query.options(load_only(*CARD_COLUMNS))
+             .filter(User.id.in_([row.user_id for row in rows]))}
+    return [(users[row.user_id], float(row.score), row.shared) for row in rows if row.user_id in users]
@@ -0,0 +1,115 @@
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import load_only
+from models import db, User, Message
+from pagination import KeysetPage, decode_cursor, encode_cursor, keyset_paginate
+
+
+class Thread:
+    """A conversation with one counterpart, summarized for the inbox list"""
+
+    def __init__(self, counterpart, last_message, message_count, unread_count):
+        self.counterpart = counterpart
+        self.last_message = last_message
+        self.message_count = message_count
+        self.unread_count = unread_count
+
+
+def increment_unread(user_id, amount=1):
+    """Bump a member's unread counter inside the current transaction"""
+    User.query.filter_by(id=user_id).update(
+        {User.unread_messages: User.unread_messages + amount},
+        synchronize_session=False
+    )
+
+
+def decrement_unread(user_id, amount=1):
+    """Lower a member's unread counter, never going below zero"""
+    User.query.filter_by(id=user_id).update(
+        {User.unread_messages: case(
+            (User.unread_messages > amount, User.unread_messages - amount),
+            else_=0
+        )},
+        synchronize_session=False
+    )
+
+
+def inbox_threads(user_id, cursor=None, per_page=20):
+    """One page of conversations, most recently active first.
+
+    Built from three queries whatever the mailbox size: one GROUP BY over the
+    member's messages (served by the sender/recipient indexes), one for the
+    newest message of each thread and one for the counterparts.
+    """
+    counterpart_id = case(
+        (Message.sender_id == user_id, Message.recipient_id),
+        else_=Message.sender_id
+    ).label('counterpart_id')
+    last_message_id = func.max(Message.id)
+
+    query = (
+        db.session.query(
+            counterpart_id,
+            last_message_id.label('last_message_id'),
+            func.count(Message.id).label('message_count'),
+            func.sum(case(
+                (and_(Message.recipient_id == user_id, Message.is_read == db.false()), 1),
+                else_=0
+            )).label('unread_count')
+        )
+        .filter(or_(Message.sender_id == user_id, Message.recipient_id == user_id))
+        .group_by(counterpart_id)
+    )
+
+    # Message ids grow with time, so the newest id orders threads by activity
+    values = decode_cursor(cursor, (last_message_id,))
+    if values:
+        query = query.having(last_message_id < values[0])
+    rows = query.order_by(last_message_id.desc()).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor([rows[-1].last_message_id])
+
+    if not rows:
+        return KeysetPage([], None)
+
+    last_messages = {
+        message.id: message
+        for message in Message.query.filter(Message.id.in_([row.last_message_id for row in rows]))
+    }
+    counterparts = {
+        user.id: user
+        for user in User.query.options(load_only(
+            User.id, User.username, User.first_name, User.last_name, User.profile_photo
+        )).filter(User.id.in_([row.counterpart_id for row in rows]))
+    }
+
+    threads = [
+        Thread(counterparts.get(row.counterpart_id), last_messages[row.last_message_id],
+               row.message_count, int(row.unread_count or 0))
+        for row in rows
+        if row.counterpart_id in counterparts
+    ]
+    return KeysetPage(threads, next_cursor)
+
+
+def conversation_messages(user_id, counterpart_id, cursor=None, per_page=30):
+    """One page of the messages exchanged with `counterpart_id`, newest first"""
+    query = Message.query.filter(or_(
+        and_(Message.sender_id == user_id, Message.recipient_id == counterpart_id),
+        and_(Message.sender_id == counterpart_id, Message.recipient_id == user_id)
+    ))
+    return keyset_paginate(query, (Message.created_at, Message.id), cursor=cursor, per_page=per_page)
+
+
+def mark_conversation_read(user_id, counterpart_id):
+    """Mark everything received from `counterpart_id` as read and fix the counter"""
+    marked = Message.query.filter(
+        Message.sender_id == counterpart_id,
+        Message.recipient_id == user_id,
+        Message.is_read == db.false()
+    ).update({Message.is_read: True}, synchronize_session=False)
+    if marked:
+        decrement_unread(user_id, marked)
+    return marked
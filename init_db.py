@@ -1,12 +1,16 @@
-from app import app, db
-from models import User
+from app import create_app
+from models import db, User
+from migrations import upgrade, current_version
+from hobbies import sync_user_hobbies
 
 def init_database():
     """Initialize database with tables"""
+    app = create_app()
     with app.app_context():
-        # Create all tables
-        db.create_all()
-        print("✅ Database tables created successfully!")
+        # Create tables and indexes through the versioned migrations
+        for version, description in upgrade():
+            print(f"✅ Migration {version} applied: {description}")
+        print(f"✅ Database schema is at version {current_version()}")
         
         # Check if admin user exists
         admin = User.query.filter_by(username='admin').first()
@@ -25,6 +29,8 @@ def init_database():
             )
             admin.set_password('admin123')
             db.session.add(admin)
+            db.session.flush()
+            sync_user_hobbies(admin.id, admin.hobbies)
             db.session.commit()
             print("✅ Admin user created (username: admin, password: admin123)")
         else:
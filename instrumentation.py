@@ -0,0 +1,118 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Every QueryStats collecting in this context (a request and any enclosing track_queries)
+_active = ContextVar('query_stats', default=())
+
+# Literals and expanded IN lists, stripped so queries differing only in them share a shape
+_SHAPE_PATTERNS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%\(\w+\)s|\$\d+|:\w+'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def statement_shape(statement):
+    """SQL text with parameters and literals collapsed"""
+    for pattern, replacement in _SHAPE_PATTERNS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request or block ran more statements than its budget allows"""
+
+
+class QueryStats:
+    """Statements run while these stats are active: count, time and shapes"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        """Shapes run at least `threshold` times (likely N+1 lazy loads)"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active.get():
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active.get() and conn.info.get('query_start'):
+        duration = time.perf_counter() - conn.info['query_start'].pop()
+        for stats in _active.get():
+            stats.record(statement, duration)
+
+
+@contextmanager
+def track_queries(budget=None):
+    """Collect QueryStats for the block; raise QueryBudgetExceeded past `budget` statements"""
+    stats = QueryStats()
+    token = _active.set(_active.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _active.reset(token)
+    if budget is not None and stats.count > budget:
+        raise QueryBudgetExceeded(f'{stats.count} queries (budget {budget})')
+
+
+def init_instrumentation(app):
+    """Count the SQL each request runs and report N+1 patterns and budget overruns.
+
+    SQL_QUERY_BUDGET caps statements per request (0 disables it); with
+    SQL_BUDGET_STRICT an overrun raises QueryBudgetExceeded, failing tests.
+    """
+    if not app.config['SQL_INSTRUMENTATION']:
+        return
+
+    @app.before_request
+    def _start_query_stats():
+        g.query_stats = QueryStats()
+        g.query_stats_token = _active.set(_active.get() + (g.query_stats,))
+
+    @app.after_request
+    def _report_query_stats(response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+        response.headers['X-Query-Count'] = str(stats.count)
+        response.headers['Server-Timing'] = f'db;desc="{stats.count} queries";dur={stats.duration * 1000:.1f}'
+        for shape, count in stats.repeated(app.config['SQL_N_PLUS_ONE_THRESHOLD']):
+            logger.warning('Possible N+1 in %s: %d x %s', request.endpoint, count, shape[:200])
+
+        budget = app.config['SQL_QUERY_BUDGET']
+        if budget and stats.count > budget:
+            message = f'{request.endpoint} ran {stats.count} queries (budget {budget})'
+            if app.config['SQL_BUDGET_STRICT']:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    @app.teardown_request
+    def _stop_query_stats(exc):
+        token = g.pop('query_stats_token', None)
+        if token is not None:
+            _active.reset(token)
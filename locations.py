@@ -0,0 +1,273 @@
+import atexit
+import math
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import load_only
+from geo import cell_divisor, cluster_level, cover_ranges, encode_geohash
+from config import Config
+from models import db, User, Location
+from activity import record_location_events
+
+
+def _split_bbox(west, south, east, north):
+    """Boxes to query; a viewport crossing the antimeridian becomes two"""
+    if east - west >= 360:
+        return [(-180.0, south, 180.0, north)]
+    west = (west + 180.0) % 360.0 - 180.0
+    east = (east + 180.0) % 360.0 - 180.0
+    if west <= east:
+        return [(west, south, east, north)]
+    return [(west, south, 180.0, north), (-180.0, south, east, north)]
+
+
+def _in_view(boxes):
+    """Geohash range predicates (index scans) plus the exact coordinate check"""
+    conditions = []
+    for west, south, east, north in boxes:
+        ranges = cover_ranges(west, south, east, north)
+        conditions.append(and_(
+            or_(*[and_(Location.geohash >= low, Location.geohash < high) for low, high in ranges]),
+            Location.latitude.between(south, north),
+            Location.longitude.between(west, east)
+        ))
+    return or_(*conditions)
+
+
+def map_points(west, south, east, north, zoom, cluster_max_zoom=15, limit=500):
+    """Members inside a viewport: clustered per grid cell below `cluster_max_zoom`.
+
+    The response stays bounded by the viewport's cell count (or `limit`)
+    however many members have a location.
+    """
+    south, north = max(south, -90.0), min(north, 90.0)
+    in_view = _in_view(_split_bbox(west, south, east, north))
+
+    if zoom >= cluster_max_zoom:
+        rows = (
+            db.session.query(Location.latitude, Location.longitude, User.id, User.first_name, User.last_name)
+            .join(User, User.id == Location.user_id)
+            .filter(in_view)
+            .limit(limit + 1)
+            .all()
+        )
+        return {
+            'clusters': [],
+            'points': [{
+                'lat': row.latitude,
+                'lng': row.longitude,
+                'user_id': row.id,
+                'name': f'{row.first_name} {row.last_name}'
+            } for row in rows[:limit]],
+            'truncated': len(rows) > limit
+        }
+
+    cell = (Location.geohash // cell_divisor(cluster_level(zoom))).label('cell')
+    rows = (
+        db.session.query(
+            cell,
+            func.count(Location.id).label('count'),
+            func.avg(Location.latitude).label('latitude'),
+            func.avg(Location.longitude).label('longitude'),
+            func.min(Location.user_id).label('user_id')
+        )
+        .filter(in_view)
+        .group_by(cell)
+        .limit(limit + 1)
+        .all()
+    )
+    truncated = len(rows) > limit
+    rows = rows[:limit]
+
+    # Cells holding a single member are shown as that member
+    single_ids = [row.user_id for row in rows if row.count == 1]
+    names = {}
+    if single_ids:
+        names = {
+            user.id: f'{user.first_name} {user.last_name}'
+            for user in User.query.options(load_only(User.id, User.first_name, User.last_name))
+            .filter(User.id.in_(single_ids))
+        }
+
+    clusters, points = [], []
+    for row in rows:
+        if row.count == 1 and row.user_id in names:
+            points.append({'lat': row.latitude, 'lng': row.longitude,
+                           'user_id': row.user_id, 'name': names[row.user_id]})
+        else:
+            clusters.append({'lat': row.latitude, 'lng': row.longitude, 'count': row.count})
+    return {'clusters': clusters, 'points': points, 'truncated': truncated}
+
+
+def distance_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in metres (haversine)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2 +
+         math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * 6371000 * math.asin(math.sqrt(a))
+
+
+class LocationBuffer:
+    """Coalesces location updates in memory and writes them in bulk upserts.
+
+    Only the newest position per member is kept until the next flush, which
+    runs every `flush_interval` seconds or once `flush_size` members are
+    waiting. Updates arriving sooner than `min_interval` seconds after the
+    last accepted one, or moving less than `min_distance` metres, are dropped.
+    Positions still buffered when a process dies are lost (at most one
+    flush interval's worth); a clean exit flushes them.
+    """
+
+    # Throttle state is kept for this many members at most (least recent dropped)
+    MAX_TRACKED = 100000
+
+    def __init__(self, flush_interval=1.0, flush_size=500, min_interval=5.0, min_distance=25.0):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.min_interval = min_interval
+        self.min_distance = min_distance
+        self._pending = {}
+        self._accepted = OrderedDict()   # user_id -> (latitude, longitude, monotonic time)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._app = None
+        self.stats_counters = {'accepted': 0, 'throttled': 0, 'unchanged': 0, 'flushes': 0, 'rows_written': 0}
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked child must not flush the parent's entries a second time
+            self._pending = {}
+            threading.Thread(target=self._run, name='location-flush', daemon=True).start()
+            atexit.register(self.flush)
+            self._pid = os.getpid()
+
+    def offer(self, user_id, latitude, longitude, address=''):
+        """Buffer a position; returns 'accepted', 'throttled' or 'unchanged'"""
+        self._app = current_app._get_current_object()
+        self._ensure_started()
+        now = time.monotonic()
+        with self._lock:
+            previous = self._accepted.get(user_id)
+            if previous:
+                if distance_m(previous[0], previous[1], latitude, longitude) < self.min_distance:
+                    self.stats_counters['unchanged'] += 1
+                    return 'unchanged'
+                if now - previous[2] < self.min_interval:
+                    self.stats_counters['throttled'] += 1
+                    return 'throttled'
+            self._accepted[user_id] = (latitude, longitude, now)
+            self._accepted.move_to_end(user_id)
+            if len(self._accepted) > self.MAX_TRACKED:
+                self._accepted.popitem(last=False)
+            self._pending[user_id] = {
+                'user_id': user_id,
+                'latitude': latitude,
+                'longitude': longitude,
+                'address': address,
+                'geohash': encode_geohash(latitude, longitude),
+                'updated_at': datetime.utcnow(),
+            }
+            self.stats_counters['accepted'] += 1
+            full = len(self._pending) >= self.flush_size
+        if full:
+            self._wakeup.set()
+        return 'accepted'
+
+    def forget(self, user_id):
+        """Drop buffered state for a member (e.g. when the account is deleted)"""
+        with self._lock:
+            self._pending.pop(user_id, None)
+            self._accepted.pop(user_id, None)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def flush(self):
+        """Write every buffered position in one bulk upsert; returns the row count"""
+        with self._lock:
+            rows, self._pending = list(self._pending.values()), {}
+        if not rows or self._app is None:
+            return 0
+        with self._app.app_context():
+            try:
+                written = upsert_locations(rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # Put the batch back unless newer positions arrived meanwhile
+                with self._lock:
+                    for row in rows:
+                        self._pending.setdefault(row['user_id'], row)
+                raise
+        with self._lock:
+            self.stats_counters['flushes'] += 1
+            self.stats_counters['rows_written'] += written
+        return written
+
+    def stats(self):
+        with self._lock:
+            return dict(self.stats_counters, pending=len(self._pending))
+
+
+def upsert_locations(rows):
+    """INSERT ... ON CONFLICT (user_id) DO UPDATE for a batch of positions.
+
+    Members deleted since their update was buffered are skipped, and an older
+    position (e.g. flushed late by another worker) never overwrites a newer one.
+    Throttled "location updated" feed events go into the same transaction.
+    """
+    existing = {user_id for user_id, in db.session.query(User.id).filter(User.id.in_([row['user_id'] for row in rows]))}
+    rows = [row for row in rows if row['user_id'] in existing]
+    if not rows:
+        return 0
+    record_location_events(rows)
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        for row in rows:
+            location = Location.query.filter_by(user_id=row['user_id']).first() or Location(user_id=row['user_id'])
+            for key, value in row.items():
+                setattr(location, key, value)
+            db.session.add(location)
+        return len(rows)
+
+    statement = insert(Location)
+    table = Location.__table__
+    db.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={column: statement.excluded[column]
+                  for column in ('latitude', 'longitude', 'address', 'geohash', 'updated_at')},
+            where=or_(table.c.updated_at.is_(None), table.c.updated_at < statement.excluded.updated_at)
+        ),
+        rows
+    )
+    return len(rows)
+
+
+location_buffer = LocationBuffer(
+    flush_interval=Config.LOCATION_FLUSH_INTERVAL_MS / 1000.0,
+    flush_size=Config.LOCATION_FLUSH_SIZE,
+    min_interval=Config.LOCATION_MIN_INTERVAL,
+    min_distance=Config.LOCATION_MIN_DISTANCE
+)
@@ -0,0 +1,397 @@
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from PIL import Image
+from sqlalchemy import insert, or_
+from config import Config
+from models import db, User, Photo, MediaDeletion
+from tasks import PermanentError, TaskQueue
+from media_urls import LOCAL_PREFIX
+from cache import invalidate_fragments
+from utils import allowed_file, process_image
+
+upload_queue = TaskQueue(
+    'media-upload',
+    workers=Config.UPLOAD_WORKERS,
+    maxsize=Config.UPLOAD_QUEUE_SIZE,
+    max_retries=Config.UPLOAD_MAX_RETRIES,
+    retry_delay=Config.UPLOAD_RETRY_DELAY
+)
+
+# One drainer per process is enough: each run fans out over a thread pool
+deletion_queue = TaskQueue(
+    'media-delete',
+    workers=1,
+    maxsize=Config.UPLOAD_QUEUE_SIZE,
+    max_retries=Config.UPLOAD_MAX_RETRIES,
+    retry_delay=Config.UPLOAD_RETRY_DELAY
+)
+
+# Cloudinary Admin API limit for one delete_resources call
+DELETE_BATCH_SIZE = 100
+
+
+class CloudinaryClient:
+    """Uploads to and deletes from Cloudinary"""
+
+    def upload(self, path, folder):
+        import cloudinary.uploader
+        result = cloudinary.uploader.upload(
+            path,
+            folder=folder,
+            transformation=[
+                {'width': 800, 'height': 800, 'crop': 'limit'},
+                {'quality': 'auto'}
+            ]
+        )
+        return result['public_id']
+
+    def destroy(self, public_id):
+        import cloudinary.uploader
+        cloudinary.uploader.destroy(public_id)
+
+    def delete_resources(self, public_ids):
+        """Delete up to 100 assets in one Admin API call; returns the ids not confirmed gone"""
+        import cloudinary.api
+        result = cloudinary.api.delete_resources(list(public_ids))
+        statuses = result.get('deleted', {})
+        return [public_id for public_id in public_ids
+                if statuses.get(public_id) not in ('deleted', 'not_found')]
+
+
+class LocalMediaClient:
+    """Offline stand-in for Cloudinary that stores files under UPLOAD_FOLDER"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def upload(self, path, folder):
+        extension = os.path.splitext(path)[1].lower()
+        relative = f'{folder}/{uuid.uuid4().hex}{extension}'
+        target = os.path.join(self.root, relative)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target)
+        return LOCAL_PREFIX + relative
+
+    def destroy(self, public_id):
+        if public_id.startswith(LOCAL_PREFIX):
+            try:
+                os.remove(os.path.join(self.root, public_id[len(LOCAL_PREFIX):]))
+            except FileNotFoundError:
+                pass
+
+    def delete_resources(self, public_ids):
+        for public_id in public_ids:
+            self.destroy(public_id)
+        return []
+
+
+def get_media_client():
+    """Media client selected by MEDIA_BACKEND ('cloudinary' or 'local')"""
+    backend = current_app.config['MEDIA_BACKEND']
+    if backend == 'local':
+        return LocalMediaClient(current_app.config['UPLOAD_FOLDER'])
+    return CloudinaryClient()
+
+
+def spool_upload(file):
+    """Save an uploaded file to the local spool folder; returns the path or None"""
+    if not file or not allowed_file(file.filename):
+        return None
+    folder = current_app.config['UPLOAD_SPOOL_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    extension = file.filename.rsplit('.', 1)[1].lower()
+    path = os.path.join(folder, f'{uuid.uuid4().hex}.{extension}')
+    file.save(path)
+    return path
+
+
+def _photo_spool_name(photo_id):
+    return f'photo-{photo_id}'
+
+
+def claim_photo_spool(path, photo_id):
+    """Rename a spooled file after its photo, so recover_uploads can find it; returns the new path"""
+    extension = os.path.splitext(path)[1]
+    target = os.path.join(os.path.dirname(path), _photo_spool_name(photo_id) + extension)
+    os.replace(path, target)
+    return target
+
+
+def _discard_spool(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _submit(task, *args, on_failure=None, task_queue=upload_queue):
+    # Run inline when TASKS_EAGER is set (tests, one-off scripts)
+    if current_app.config['TASKS_EAGER']:
+        task_queue.run(task, *args, on_failure=on_failure)
+        return True
+    return task_queue.submit(task, *args, on_failure=on_failure)
+
+
+def enqueue_photo_upload(photo_id, path):
+    """Upload a spooled gallery photo in the background; False (and the spool file dropped) if the queue is full"""
+    app = current_app._get_current_object()
+    if _submit(_upload_photo, app, photo_id, path, on_failure=_photo_upload_failed):
+        return True
+    _discard_spool(path)
+    return False
+
+
+def enqueue_profile_photo_upload(user_id, path):
+    """Upload a spooled profile photo in the background; the old photo stays until it is ready"""
+    app = current_app._get_current_object()
+    if _submit(_upload_profile_photo, app, user_id, path, on_failure=_profile_upload_failed):
+        return True
+    _discard_spool(path)
+    return False
+
+
+def _process(path, thumbnail_size=None):
+    """Resize/strip the spooled file; returns the result and every file to clean up"""
+    try:
+        image = process_image(path, max_size=current_app.config['IMAGE_MAX_SIZE'], thumbnail_size=thumbnail_size)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # A corrupt or unreadable file decodes no better on the next attempt
+        raise PermanentError(f'{os.path.basename(path)}: {e}') from e
+    return image, {path, image.path, image.thumbnail_path} - {None}
+
+
+def _discard_uploaded(public_ids):
+    """Queue assets an attempt uploaded but no row refers to; the retry uploads afresh"""
+    db.session.rollback()
+    if public_ids:
+        queue_media_deletion(public_ids)
+        db.session.commit()
+        schedule_media_deletions()
+
+
+def _upload_photo(app, photo_id, path):
+    with app.app_context():
+        files = {path}
+        uploaded = []
+        try:
+            image, files = _process(path, thumbnail_size=app.config['THUMBNAIL_SIZE'])
+            client = get_media_client()
+            uploaded.append(client.upload(image.path, 'photos'))
+            uploaded.append(client.upload(image.thumbnail_path, 'photos/thumbnails'))
+            public_id, thumbnail_id = uploaded
+            photo = db.session.get(Photo, photo_id)
+            if photo is None:
+                # Deleted while the upload was running
+                client.destroy(public_id)
+                client.destroy(thumbnail_id)
+            else:
+                photo.filename = public_id
+                photo.thumbnail = thumbnail_id
+                photo.width = image.width
+                photo.height = image.height
+                photo.status = 'ready'
+                invalidate_fragments(db.session, 'photos')
+                db.session.commit()
+        except Exception:
+            _discard_uploaded(uploaded)
+            raise
+        finally:
+            # The spooled original stays for a retry until the last attempt
+            for file in files - {path}:
+                _discard_spool(file)
+        _discard_spool(path)
+
+
+def _photo_upload_failed(app, photo_id, path):
+    with app.app_context():
+        Photo.query.filter_by(id=photo_id).update({Photo.status: 'failed'})
+        invalidate_fragments(db.session, 'photos')
+        db.session.commit()
+    _discard_spool(path)
+
+
+def _upload_profile_photo(app, user_id, path):
+    with app.app_context():
+        files = {path}
+        uploaded = []
+        replaced = None
+        try:
+            image, files = _process(path)
+            client = get_media_client()
+            uploaded.append(client.upload(image.path, 'profile_photos'))
+            public_id = uploaded[0]
+            user = db.session.get(User, user_id)
+            if user is None:
+                client.destroy(public_id)
+            else:
+                # The old photo is deleted only once the new one is stored
+                replaced = user.profile_photo
+                queue_media_deletion([replaced])
+                user.profile_photo = public_id
+                db.session.commit()
+        except Exception:
+            _discard_uploaded(uploaded)
+            raise
+        finally:
+            for file in files - {path}:
+                _discard_spool(file)
+        _discard_spool(path)
+        if replaced:
+            schedule_media_deletions()
+
+
+def _profile_upload_failed(app, user_id, path):
+    _discard_spool(path)
+
+
+def recover_uploads(app, older_than=1800):
+    """Finish photo uploads lost with the worker that queued them.
+
+    Queued and running uploads live in one worker's threads, so a restart
+    (deploys, max_requests recycling) drops them. Photos still pending after
+    `older_than` seconds are queued again when their spooled file is still
+    there and marked failed otherwise; spool files that old which no pending
+    photo owns are removed. Returns (requeued, failed, removed).
+    """
+    with app.app_context():
+        folder = app.config['UPLOAD_SPOOL_FOLDER']
+        try:
+            names = os.listdir(folder)
+        except FileNotFoundError:
+            names = []
+        originals = {os.path.splitext(name)[0]: name for name in names}
+
+        cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+        pending = Photo.query.filter(Photo.status == 'pending').all()
+        owned = {originals[_photo_spool_name(photo.id)] for photo in pending
+                 if _photo_spool_name(photo.id) in originals}
+        requeue, failed = [], []
+        for photo in pending:
+            if photo.uploaded_at >= cutoff:
+                continue
+            name = originals.get(_photo_spool_name(photo.id))
+            if name is None:
+                failed.append(photo.id)
+            else:
+                requeue.append((photo.id, os.path.join(folder, name)))
+        if failed:
+            Photo.query.filter(Photo.id.in_(failed)).update({Photo.status: 'failed'}, synchronize_session=False)
+            invalidate_fragments(db.session, 'photos')
+            db.session.commit()
+
+        # Leftovers: profile photos and processed copies of lost uploads
+        removed = 0
+        oldest = time.time() - older_than
+        for name in set(names) - owned:
+            path = os.path.join(folder, name)
+            try:
+                if os.path.getmtime(path) < oldest:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+
+        requeued = 0
+        for photo_id, path in requeue:
+            # A full queue leaves the photo pending for the next run
+            if _submit(_upload_photo, app, photo_id, path, on_failure=_photo_upload_failed):
+                requeued += 1
+        return requeued, len(failed), removed
+
+
+def queue_media_deletion(public_ids):
+    """Record assets to delete in the current transaction (the deletion outbox).
+
+    The rows commit or roll back together with the database delete, so the
+    media backend is only touched once the owning rows are really gone.
+    """
+    rows = [{'public_id': public_id} for public_id in public_ids if public_id]
+    if rows:
+        db.session.execute(insert(MediaDeletion), rows)
+
+
+def schedule_media_deletions():
+    """Drain the outbox in the background; call after the deleting transaction commits"""
+    app = current_app._get_current_object()
+    return _submit(process_media_deletions, app, task_queue=deletion_queue)
+
+
+def _delete_batch(client, public_ids):
+    """Public ids the backend did not confirm as deleted, and why"""
+    try:
+        remaining = client.delete_resources(public_ids)
+        return remaining, ('not deleted: ' + ', '.join(remaining) if remaining else None)
+    except Exception as e:
+        return public_ids, f'{type(e).__name__}: {e}'
+
+
+def _claim_deletions(app, include_exhausted, limit):
+    """Claim up to `limit` outbox rows for this drainer and commit; returns (id, public_id) pairs.
+
+    No transaction stays open while the media backend is called, so a slow
+    API cannot hold row locks or run into the idle-in-transaction timeout.
+    Each claim counts as an attempt.
+    """
+    now = datetime.utcnow()
+    query = MediaDeletion.query.filter(or_(MediaDeletion.claimed_until.is_(None), MediaDeletion.claimed_until < now))
+    if not include_exhausted:
+        query = query.filter(MediaDeletion.attempts < app.config['MEDIA_DELETE_MAX_ATTEMPTS'])
+    # SKIP LOCKED lets several processes claim side by side
+    rows = query.order_by(MediaDeletion.id).limit(limit).with_for_update(skip_locked=True).all()
+    claimed_until = now + timedelta(seconds=app.config['MEDIA_DELETE_CLAIM_SECONDS'])
+    claimed = []
+    for row in rows:
+        row.attempts += 1
+        row.claimed_until = claimed_until
+        claimed.append((row.id, row.public_id))
+    db.session.commit()
+    return claimed
+
+
+def process_media_deletions(app, include_exhausted=False, limit=1000):
+    """Delete outbox assets in batches of DELETE_BATCH_SIZE, several batches concurrently.
+
+    Rows are claimed first, deleted from the media backend outside any
+    transaction, and removed once the backend confirmed them. Deleting an
+    asset twice is harmless (Cloudinary reports 'not_found'), so assets that
+    were not confirmed are released and retried later. Raises when a batch
+    failed so the task queue retries with backoff. Returns the number deleted.
+    """
+    deleted = 0
+    with app.app_context():
+        client = get_media_client()
+        while True:
+            claimed = _claim_deletions(app, include_exhausted, limit)
+            if not claimed:
+                return deleted
+
+            batches = [claimed[start:start + DELETE_BATCH_SIZE] for start in range(0, len(claimed), DELETE_BATCH_SIZE)]
+            workers = min(app.config['MEDIA_DELETE_CONCURRENCY'], len(batches))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(
+                    lambda batch: _delete_batch(client, [public_id for _, public_id in batch]), batches
+                ))
+
+            done_ids = []
+            for batch, (remaining, error) in zip(batches, results):
+                remaining = set(remaining)
+                done_ids.extend(row_id for row_id, public_id in batch if public_id not in remaining)
+                failed_ids = [row_id for row_id, public_id in batch if public_id in remaining]
+                if failed_ids:
+                    MediaDeletion.query.filter(MediaDeletion.id.in_(failed_ids)).update(
+                        {MediaDeletion.last_error: error[:500], MediaDeletion.claimed_until: None},
+                        synchronize_session=False
+                    )
+            if done_ids:
+                MediaDeletion.query.filter(MediaDeletion.id.in_(done_ids)).delete(synchronize_session=False)
+            db.session.commit()
+            deleted += len(done_ids)
+
+            failures = [error for _, error in results if error]
+            if failures:
+                raise RuntimeError(f'{len(failures)} media deletion batch(es) failed: {failures[0]}')
@@ -0,0 +1,77 @@
+from functools import lru_cache
+from flask import current_app
+from markupsafe import Markup
+import cloudinary.utils
+from config import Config
+
+# Public id prefix of files kept by the offline media client (see media.py)
+LOCAL_PREFIX = 'local/'
+
+
+@lru_cache(maxsize=Config.CLOUDINARY_URL_CACHE_SIZE)
+def _build_url(public_id, options):
+    return cloudinary.utils.cloudinary_url(public_id, **dict(options))[0]
+
+
+def _preset(name):
+    presets = current_app.config['CLOUDINARY_PRESETS']
+    return presets.get(name) or presets['original']
+
+
+def _options(preset, width=None):
+    """Hashable Cloudinary options for a preset, optionally rescaled to `width`"""
+    options = dict(preset['options'])
+    if width:
+        if options.get('width') and options.get('height'):
+            # Keep the preset's aspect ratio for fixed-size crops
+            options['height'] = round(options['height'] * width / options['width'])
+        options['width'] = width
+    return tuple(sorted(options.items()))
+
+
+def media_url(public_id, preset=None, width=None):
+    """Delivery URL for `public_id`, memoized per (public_id, transformation)"""
+    if not public_id:
+        return None
+    if public_id.startswith(LOCAL_PREFIX):
+        # Stored by the offline media client: served as-is, no transformations
+        # (built without url_for so background workers can use it outside a request)
+        return f"{current_app.static_url_path}/uploads/{public_id[len(LOCAL_PREFIX):]}"
+    return _build_url(public_id, _options(_preset(preset), width))
+
+
+def media_srcset(public_id, preset=None):
+    """srcset value offering the configured widths (never upscaling a fixed-size preset)"""
+    if not public_id:
+        return ''
+    if public_id.startswith(LOCAL_PREFIX):
+        return ''
+    preset_options = _preset(preset)
+    max_width = preset_options['options'].get('width')
+    widths = [width for width in current_app.config['CLOUDINARY_SRCSET_WIDTHS']
+              if not max_width or width <= max_width * 2]
+    return ', '.join(f'{media_url(public_id, preset, width)} {width}w' for width in widths)
+
+
+def media_img_attrs(public_id, preset=None):
+    """src, srcset and sizes attributes for an <img> tag"""
+    if not public_id:
+        return Markup('')
+    return Markup('src="{}" srcset="{}" sizes="{}"').format(
+        media_url(public_id, preset),
+        media_srcset(public_id, preset),
+        _preset(preset)['sizes']
+    )
+
+
+def url_cache_stats():
+    """Hit/miss counters of the URL cache"""
+    info = _build_url.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize,
+        'hit_ratio': round(info.hits / lookups, 4) if lookups else None,
+    }
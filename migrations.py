@@ -0,0 +1,274 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, column, false, inspect, select, text
+from models import db
+
+# Applied versions are recorded here; kept out of db.metadata on purpose
+migration_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', migration_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False, default=datetime.utcnow),
+)
+
+MIGRATIONS = []
+
+# Arbitrary constant used to serialize concurrent upgrades on PostgreSQL
+ADVISORY_LOCK_ID = 724501
+
+
+def migration(version, description):
+    """Register a schema migration step; versions are applied in ascending order"""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return func
+    return decorator
+
+
+def create_missing_indexes(connection, table_name, indexes):
+    """Create the listed indexes that the database does not have yet.
+
+    Each entry is (name, column names) or (name, column names, dialect
+    options), spelled out in the migration step itself rather than read from
+    the model, so a step keeps doing what it did when it was written
+    whatever indexes the models declare later.
+    """
+    existing = {index['name'] for index in inspect(connection).get_indexes(table_name)}
+    for name, columns, *options in indexes:
+        if name in existing:
+            continue
+        table = Table(table_name, MetaData(), *(Column(column_name) for column_name in columns))
+        Index(name, *(table.c[column_name] for column_name in columns), **(options[0] if options else {})) \
+            .create(bind=connection)
+
+
+def add_missing_column(connection, table, column):
+    """ALTER TABLE ... ADD COLUMN for a column declared on the model but missing in the database"""
+    existing = {col['name'] for col in inspect(connection).get_columns(table.name)}
+    if column.name in existing:
+        return False
+    column_type = column.type.compile(dialect=connection.dialect)
+    ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+    if column.server_default is not None:
+        ddl += f' DEFAULT {column.server_default.arg}'
+        if not column.nullable:
+            ddl += ' NOT NULL'
+    connection.execute(text(ddl))
+    return True
+
+
+# Migration steps
+# Every step must be safe on a fresh database too: version 1 creates the
+# tables (and their indexes) from the current models, so later steps check
+# before altering. Only version 1 may read the models' index declarations.
+
+@migration(1, 'Create base tables')
+def create_base_tables(connection):
+    db.metadata.create_all(bind=connection)
+
+
+@migration(2, 'Indexes for hot filter and sort columns')
+def add_hot_path_indexes(connection):
+    unread = {'postgresql_where': column('is_read') == false(), 'sqlite_where': column('is_read') == false()}
+    for table_name, indexes in (
+        ('photos', [('ix_photos_user_uploaded', ('user_id', 'uploaded_at')),
+                    ('ix_photos_uploaded_id', ('uploaded_at', 'id'))]),
+        ('photo_tags', [('ix_photo_tags_photo', ('photo_id',)),
+                        ('ix_photo_tags_tagged_user', ('tagged_user_id',))]),
+        ('videos', [('ix_videos_user_uploaded', ('user_id', 'uploaded_at')),
+                    ('ix_videos_uploaded_id', ('uploaded_at', 'id'))]),
+        ('forum_posts', [('ix_forum_posts_created_id', ('created_at', 'id')),
+                         ('ix_forum_posts_user', ('user_id',))]),
+        ('forum_replies', [('ix_forum_replies_post_created', ('post_id', 'created_at', 'id')),
+                           ('ix_forum_replies_user', ('user_id',))]),
+        ('messages', [('ix_messages_recipient_created', ('recipient_id', 'created_at')),
+                      ('ix_messages_sender_created', ('sender_id', 'created_at')),
+                      ('ix_messages_recipient_unread', ('recipient_id',), unread)]),
+    ):
+        create_missing_indexes(connection, table_name, indexes)
+
+
+@migration(3, 'Per-user unread message counter')
+def add_unread_message_counter(connection):
+    from models import User, Message
+    add_missing_column(connection, User.__table__, User.__table__.c.unread_messages)
+    unread = (
+        select(db.func.count(Message.id))
+        .where(Message.recipient_id == User.id, Message.is_read == db.false())
+        .scalar_subquery()
+    )
+    connection.execute(db.update(User).values(unread_messages=unread))
+
+
+@migration(4, 'People directory search key and filter indexes')
+def add_people_search(connection):
+    from models import User, user_search_key
+    users = User.__table__
+    add_missing_column(connection, users, users.c.search_key)
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(users.c.id, users.c.first_name, users.c.last_name, users.c.username)
+            .where(users.c.id > last_id).order_by(users.c.id).limit(1000)
+        ).all()
+        if not rows:
+            break
+        connection.execute(
+            users.update().where(users.c.id == db.bindparam('user_id')).values(search_key=db.bindparam('key')),
+            [{'user_id': row.id, 'key': user_search_key(row.first_name, row.last_name, row.username)} for row in rows]
+        )
+        last_id = rows[-1].id
+
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    create_missing_indexes(connection, 'users', [
+        ('ix_users_name_order', ('first_name', 'last_name', 'id')),
+        ('ix_users_school', ('school',)),
+        ('ix_users_birth_place', ('birth_place',)),
+        ('ix_users_search_key', ('search_key',),
+         {'postgresql_using': 'gin', 'postgresql_ops': {'search_key': 'gin_trgm_ops'}}),
+    ])
+
+
+@migration(5, 'Full-text search index over forum, video and photo content')
+def add_search_index(connection):
+    from search import rebuild_index
+    rebuild_index(connection)
+
+
+@migration(6, 'Photo upload status for background uploads')
+def add_photo_status(connection):
+    from models import Photo
+    add_missing_column(connection, Photo.__table__, Photo.__table__.c.status)
+
+
+@migration(7, 'Photo dimensions recorded by local image processing')
+def add_photo_dimensions(connection):
+    from models import Photo
+    photos = Photo.__table__
+    add_missing_column(connection, photos, photos.c.width)
+    add_missing_column(connection, photos, photos.c.height)
+
+
+@migration(8, 'Outbox table for batched media deletions')
+def add_media_deletions(connection):
+    from models import MediaDeletion
+    MediaDeletion.__table__.create(bind=connection, checkfirst=True)
+
+
+@migration(9, 'Location geohash column and index for map viewport queries')
+def add_location_geohash(connection):
+    from geo import encode_geohash
+    from models import Location
+    locations = Location.__table__
+    add_missing_column(connection, locations, locations.c.geohash)
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(locations.c.id, locations.c.latitude, locations.c.longitude)
+            .where(locations.c.id > last_id).order_by(locations.c.id).limit(1000)
+        ).all()
+        if not rows:
+            break
+        connection.execute(
+            locations.update().where(locations.c.id == db.bindparam('location_id')).values(geohash=db.bindparam('hash')),
+            [{'location_id': row.id, 'hash': encode_geohash(row.latitude, row.longitude)} for row in rows]
+        )
+        last_id = rows[-1].id
+    create_missing_indexes(connection, 'locations', [('ix_locations_geohash', ('geohash',))])
+
+
+@migration(10, 'Cached YouTube metadata columns on videos')
+def add_video_metadata(connection):
+    from models import Video
+    videos = Video.__table__
+    for column_name in ('youtube_title', 'channel_name', 'thumbnail_url', 'duration_seconds', 'metadata_fetched_at'):
+        add_missing_column(connection, videos, videos.c[column_name])
+
+
+@migration(11, 'Hobby tags, member tag index and tag counts parsed from hobby strings')
+def add_hobby_tags(connection):
+    from hobbies import rebuild_hobby_index
+    from models import Hobby, user_hobbies
+    Hobby.__table__.create(bind=connection, checkfirst=True)
+    user_hobbies.create(bind=connection, checkfirst=True)
+    rebuild_hobby_index(connection)
+
+
+@migration(12, 'Denormalized reply count and last activity on forum posts')
+def add_post_reply_stats(connection):
+    from forum import refresh_reply_stats
+    from models import ForumPost
+    posts = ForumPost.__table__
+    for column_name in ('reply_count', 'last_reply_at', 'last_activity_at'):
+        add_missing_column(connection, posts, posts.c[column_name])
+
+    last_id = 0
+    while True:
+        post_ids = list(connection.execute(
+            select(posts.c.id).where(posts.c.id > last_id).order_by(posts.c.id).limit(1000)
+        ).scalars())
+        if not post_ids:
+            break
+        refresh_reply_stats(post_ids, connection=connection)
+        last_id = post_ids[-1]
+    # Only this step may build the index: earlier steps run before the column exists
+    create_missing_indexes(connection, 'forum_posts', [('ix_forum_posts_activity_id', ('last_activity_at', 'id'))])
+
+
+@migration(13, 'Activity feed events, backfilled from existing content')
+def add_activity_events(connection):
+    from activity import rebuild_activity
+    from models import ActivityEvent
+    ActivityEvent.__table__.create(bind=connection, checkfirst=True)
+    rebuild_activity(connection)
+
+
+@migration(14, 'Claim column on the media deletion outbox')
+def add_media_deletion_claims(connection):
+    from models import MediaDeletion
+    deletions = MediaDeletion.__table__
+    add_missing_column(connection, deletions, deletions.c.claimed_until)
+
+
+def applied_versions(connection):
+    """Return the set of migration versions already applied"""
+    migration_metadata.create_all(bind=connection)
+    return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+
+def upgrade(engine=None):
+    """Apply all pending migrations, each in its own transaction; returns the applied steps"""
+    engine = engine or db.engine
+    applied = []
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+
+    for version, description, func in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as connection:
+            if connection.dialect.name == 'postgresql':
+                # Index builds and backfills may outlast the request statement_timeout
+                connection.execute(text('SET LOCAL statement_timeout = 0'))
+                # Another process may be upgrading at the same time (e.g. two release jobs)
+                connection.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': ADVISORY_LOCK_ID})
+                if version in applied_versions(connection):
+                    continue
+            func(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()
+            ))
+        applied.append((version, description))
+    return applied
+
+
+def current_version(engine=None):
+    """Highest applied migration version, or 0 for an empty database"""
+    engine = engine or db.engine
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+    return max(done, default=0)
@@ -1,9 +1,19 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import DDL, event
 from werkzeug.security import generate_password_hash, check_password_hash
+from geo import encode_geohash
+from replicas import RoutingSession
+from utils import fold_turkish
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def user_search_key(first_name, last_name, username):
+    """Folded "first last username" string matched by the people search"""
+    return ' '.join(fold_turkish(part) for part in (first_name, last_name, username) if part)
 
-db = SQLAlchemy()
 
 class User(UserMixin, db.Model):
     """User model for authentication and profile"""
@@ -28,6 +38,12 @@ class User(UserMixin, db.Model):
     current_location = db.Column(db.String(100))
     current_activity = db.Column(db.String(200))
     
+    # Denormalized counter of unread received messages (shown in the navbar)
+    unread_messages = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    # Folded name/username for the people search, kept up to date on save
+    search_key = db.Column(db.String(300))
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -40,6 +56,20 @@ class User(UserMixin, db.Model):
     received_messages = db.relationship('Message', foreign_keys='Message.recipient_id', backref='recipient', lazy=True)
     location = db.relationship('Location', backref='user', uselist=False, cascade='all, delete-orphan')
     
+    __table_args__ = (
+        # Directory order and keyset pagination
+        db.Index('ix_users_name_order', 'first_name', 'last_name', 'id'),
+        db.Index('ix_users_school', 'school'),
+        db.Index('ix_users_birth_place', 'birth_place'),
+        # Trigram index for substring search on PostgreSQL (plain B-tree elsewhere)
+        db.Index('ix_users_search_key', 'search_key',
+                 postgresql_using='gin', postgresql_ops={'search_key': 'gin_trgm_ops'}),
+    )
+    
+    def refresh_search_key(self):
+        """Recompute the folded search key from the name fields"""
+        self.search_key = user_search_key(self.first_name, self.last_name, self.username)
+    
     def set_password(self, password):
         """Hash and set user password"""
         self.password_hash = generate_password_hash(password)
@@ -52,6 +82,49 @@ class User(UserMixin, db.Model):
         return f'<User {self.username}>'
 
 
+@event.listens_for(User, 'before_insert')
+@event.listens_for(User, 'before_update')
+def _update_user_search_key(mapper, connection, target):
+    target.refresh_search_key()
+
+
+# The trigram operator class lives in the pg_trgm extension
+event.listen(
+    User.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
+
+# Member <-> hobby tag association. The (hobby_id, user_id) index is the
+# inverted index: members per tag, as used by the hobby filter and matching
+user_hobbies = db.Table(
+    'user_hobbies',
+    db.Column('user_id', db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('hobby_id', db.Integer, db.ForeignKey('hobbies.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_user_hobbies_hobby_user', 'hobby_id', 'user_id'),
+)
+
+
+class Hobby(db.Model):
+    """Hobby tag parsed from members' hobby strings (see hobbies.py)"""
+    __tablename__ = 'hobbies'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Folded form ("kitap okuma"), so spelling and case variants share a tag
+    slug = db.Column(db.String(100), unique=True, nullable=False)
+    # Spelling shown to members, as first typed
+    name = db.Column(db.String(100), nullable=False)
+    # Denormalized number of members with the tag, kept current on every change
+    user_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    __table_args__ = (
+        db.Index('ix_hobbies_user_count', 'user_count'),
+    )
+    
+    def __repr__(self):
+        return f'<Hobby {self.slug}>'
+
+
 class Photo(db.Model):
     """Photo model for image uploads"""
     __tablename__ = 'photos'
@@ -62,10 +135,20 @@ class Photo(db.Model):
     thumbnail = db.Column(db.String(255))
     caption = db.Column(db.String(500))
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 'pending' while the background upload runs, then 'ready' or 'failed'
+    status = db.Column(db.String(10), nullable=False, default='ready', server_default='ready')
+    # Pixel size after local processing (at most IMAGE_MAX_SIZE on the long side)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
     
     # Relationships
     tags = db.relationship('PhotoTag', backref='photo', lazy=True, cascade='all, delete-orphan')
     
+    __table_args__ = (
+        db.Index('ix_photos_user_uploaded', 'user_id', 'uploaded_at'),
+        db.Index('ix_photos_uploaded_id', 'uploaded_at', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Photo {self.filename}>'
 
@@ -87,6 +170,11 @@ class PhotoTag(db.Model):
     # Relationship
     tagged_user = db.relationship('User', foreign_keys=[tagged_user_id])
     
+    __table_args__ = (
+        db.Index('ix_photo_tags_photo', 'photo_id'),
+        db.Index('ix_photo_tags_tagged_user', 'tagged_user_id'),
+    )
+    
     def __repr__(self):
         return f'<PhotoTag {self.shape} on Photo {self.photo_id}>'
 
@@ -102,6 +190,17 @@ class Video(db.Model):
     title = db.Column(db.String(200))
     description = db.Column(db.Text)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Cached YouTube metadata, filled in the background (see video_metadata.py)
+    youtube_title = db.Column(db.String(200))
+    channel_name = db.Column(db.String(200))
+    thumbnail_url = db.Column(db.String(255))
+    duration_seconds = db.Column(db.Integer)
+    metadata_fetched_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_videos_user_uploaded', 'user_id', 'uploaded_at'),
+        db.Index('ix_videos_uploaded_id', 'uploaded_at', 'id'),
+    )
     
     def __repr__(self):
         return f'<Video {self.title}>'
@@ -118,13 +217,34 @@ class ForumPost(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Denormalized reply summary, updated with every reply (see forum.py);
+    # last_activity_at is the later of created_at and last_reply_at
+    reply_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_reply_at = db.Column(db.DateTime)
+    last_activity_at = db.Column(db.DateTime)
+    
     # Relationships
     replies = db.relationship('ForumReply', backref='post', lazy=True, cascade='all, delete-orphan')
     
+    __table_args__ = (
+        db.Index('ix_forum_posts_created_id', 'created_at', 'id'),
+        db.Index('ix_forum_posts_user', 'user_id'),
+        # Forum sorted by latest activity ("bumped" threads)
+        db.Index('ix_forum_posts_activity_id', 'last_activity_at', 'id'),
+    )
+    
     def __repr__(self):
         return f'<ForumPost {self.title}>'
 
 
+@event.listens_for(ForumPost, 'before_insert')
+def _start_post_activity(mapper, connection, target):
+    if target.created_at is None:
+        target.created_at = datetime.utcnow()
+    if target.last_activity_at is None:
+        target.last_activity_at = target.created_at
+
+
 class ForumReply(db.Model):
     """Forum reply model for post responses"""
     __tablename__ = 'forum_replies'
@@ -138,10 +258,48 @@ class ForumReply(db.Model):
     # Relationship
     author = db.relationship('User', foreign_keys=[user_id])
     
+    __table_args__ = (
+        db.Index('ix_forum_replies_post_created', 'post_id', 'created_at', 'id'),
+        db.Index('ix_forum_replies_user', 'user_id'),
+    )
+    
     def __repr__(self):
         return f'<ForumReply on Post {self.post_id}>'
 
 
+class ActivityEvent(db.Model):
+    """Activity feed entry, written in the same transaction as the change it describes"""
+    __tablename__ = 'activity_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # post, reply, photo, video, tag, location or status (see activity.py)
+    event_type = db.Column(db.String(20), nullable=False)
+    actor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # The member tagged in a photo
+    target_user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    # The post, reply, photo, video or tag, and for replies and tags their post or photo
+    subject_id = db.Column(db.Integer)
+    parent_id = db.Column(db.Integer)
+    # Title, caption or status text as it was, so the feed needs no other table
+    summary = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    actor = db.relationship('User', foreign_keys=[actor_id])
+    target_user = db.relationship('User', foreign_keys=[target_user_id])
+    
+    __table_args__ = (
+        db.Index('ix_activity_events_created_id', 'created_at', 'id'),
+        db.Index('ix_activity_events_actor_created', 'actor_id', 'created_at'),
+        db.Index('ix_activity_events_target', 'target_user_id'),
+        db.Index('ix_activity_events_subject', 'event_type', 'subject_id'),
+        db.Index('ix_activity_events_parent', 'event_type', 'parent_id'),
+    )
+    
+    def __repr__(self):
+        return f'<ActivityEvent {self.event_type} by User {self.actor_id}>'
+
+
 class Message(db.Model):
     """Private message model for user-to-user messaging"""
     __tablename__ = 'messages'
@@ -154,6 +312,15 @@ class Message(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_messages_recipient_created', 'recipient_id', 'created_at'),
+        db.Index('ix_messages_sender_created', 'sender_id', 'created_at'),
+        # Partial index: only unread rows, so unread lookups stay tiny
+        db.Index('ix_messages_recipient_unread', 'recipient_id',
+                 postgresql_where=(is_read == db.false()),
+                 sqlite_where=(is_read == db.false())),
+    )
+    
     def __repr__(self):
         return f'<Message from {self.sender_id} to {self.recipient_id}>'
 
@@ -168,6 +335,34 @@ class Location(db.Model):
     longitude = db.Column(db.Float, nullable=False)
     address = db.Column(db.String(255))
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Integer geohash of (latitude, longitude), kept current by the events below
+    geohash = db.Column(db.BigInteger)
+    
+    __table_args__ = (
+        db.Index('ix_locations_geohash', 'geohash'),
+    )
     
     def __repr__(self):
         return f'<Location for User {self.user_id}>'
+
+
+@event.listens_for(Location, 'before_insert')
+@event.listens_for(Location, 'before_update')
+def _update_location_geohash(mapper, connection, target):
+    target.geohash = encode_geohash(target.latitude, target.longitude)
+
+
+class MediaDeletion(db.Model):
+    """Outbox of media assets to delete after the rows that used them are gone"""
+    __tablename__ = 'media_deletions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    public_id = db.Column(db.String(255), nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_error = db.Column(db.String(500))
+    # Set while a drainer is deleting the asset; an expired claim is free again
+    claimed_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<MediaDeletion {self.public_id}>'
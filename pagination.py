@@ -0,0 +1,108 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import tuple_
+
+
+def encode_cursor(values):
+    """Encode the sort key of the last row on a page as an opaque URL-safe cursor"""
+    payload = []
+    for value in values:
+        if isinstance(value, datetime):
+            payload.append({'dt': value.isoformat()})
+        else:
+            payload.append(value)
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _fits(value, column):
+    """Whether a decoded cursor value can be compared with `column`"""
+    try:
+        expected = column.type.python_type
+    except (AttributeError, NotImplementedError):
+        return isinstance(value, (str, int, float, datetime))
+    if isinstance(value, bool) and expected is not bool:
+        return False
+    if expected in (float, Decimal):
+        expected = (int, float)
+    return isinstance(value, expected)
+
+
+def decode_cursor(cursor, columns=None):
+    """Decode a cursor produced by encode_cursor, returning None if it is malformed.
+
+    With `columns`, a cursor whose values do not fit the sort columns (another
+    listing's cursor, or one edited by hand) is treated as malformed too.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, binascii.Error, UnicodeError):
+        return None
+    if not isinstance(payload, list):
+        return None
+
+    values = []
+    for value in payload:
+        if isinstance(value, dict):
+            try:
+                value = datetime.fromisoformat(value['dt'])
+            except (KeyError, TypeError, ValueError):
+                return None
+        values.append(value)
+    if columns is not None:
+        if len(values) != len(columns) or not all(_fits(value, column) for value, column in zip(values, columns)):
+            return None
+    return values
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query"""
+
+    def __init__(self, items, next_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_paginate(query, columns, cursor=None, per_page=20, descending=True, key=None):
+    """Fetch one page of `query` ordered by `columns`, starting after `cursor`.
+
+    `columns` must form a unique sort key (end it with the primary key) and
+    should be backed by an index in the same order, so every page is a single
+    index range scan no matter how deep the reader has scrolled. `key` extracts
+    the sort values from a result row; by default they are read as attributes.
+    """
+    if key is None:
+        key = lambda row: tuple(getattr(row, column.key) for column in columns)
+
+    # An unusable cursor starts over at the first page
+    values = decode_cursor(cursor, columns)
+    if values is not None:
+        if descending:
+            query = query.filter(tuple_(*columns) < tuple_(*values))
+        else:
+            query = query.filter(tuple_(*columns) > tuple_(*values))
+
+    ordering = [column.desc() if descending else column.asc() for column in columns]
+    rows = query.order_by(*ordering).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(key(rows[-1]))
+    return KeysetPage(rows, next_cursor)
@@ -0,0 +1,165 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import jsonify, render_template, request
+from flask_login import current_user
+
+# Methods a policy limits unless it names its own
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class MemoryBackend:
+    """Token buckets in this process, least recently used dropped past `maxsize`.
+
+    A dropped bucket starts full again, so the bound only costs precision
+    for clients that have not been seen for a while.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()   # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity):
+        """Take a token; seconds to wait for the next one when the bucket is empty, else 0"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def size(self):
+        with self._lock:
+            return len(self._buckets)
+
+
+# Refill and take in one round trip, atomically; the time comes from the
+# caller so every worker computes refills on the same clock
+_TAKE_SCRIPT = """
+local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = math.min(capacity, (tonumber(state[1]) or capacity) + math.max(0, now - (tonumber(state[2]) or now)) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBackend:
+    """Token buckets in Redis, shared by every worker (needs the optional `redis` package)"""
+
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+
+    def take(self, key, rate, capacity):
+        return float(self._take(keys=[f'ratelimit:{key}'], args=[capacity, rate, time.time()]))
+
+    def size(self):
+        return None
+
+
+def make_backend(name, url=None, maxsize=100000):
+    """Bucket store selected by RATE_LIMIT_BACKEND ('memory' or 'redis')"""
+    if name == 'memory':
+        return MemoryBackend(maxsize)
+    if name == 'redis':
+        return RedisBackend(url)
+    raise ValueError(f'Unknown rate limit backend: {name}')
+
+
+def _client_key(kind):
+    """Who a bucket belongs to: the member, the client IP or the login name tried from that IP"""
+    if kind == 'user' and current_user.is_authenticated:
+        return f'user:{current_user.id}'
+    if kind == 'ip_username':
+        # Never the login name alone: anyone could use up a member's bucket and lock them out
+        username = (request.form.get('username') or '').strip().lower()
+        return f'ip:{request.remote_addr}:username:{username}' if username else None
+    return f'ip:{request.remote_addr}'
+
+
+class RateLimiter:
+    """Token-bucket limits per endpoint: `rate` requests per `per` seconds, bursts up to `burst`.
+
+    Each check is one dictionary lookup for the policy and one bucket update
+    per key, whatever the traffic. A shared backend that fails lets requests
+    through: the limiter protects the site, it must not take it down.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.checked = 0
+        self.limited = 0
+        self.backend_errors = 0
+
+    def hit(self, endpoint, policy):
+        """Seconds the client must wait, or 0 when the request may go ahead"""
+        self.checked += 1
+        rate = policy['rate'] / policy['per']
+        capacity = policy.get('burst', policy['rate'])
+        wait = 0.0
+        for kind in policy.get('keys', ('user',)):
+            key = _client_key(kind)
+            if key is None:
+                continue
+            try:
+                wait = max(wait, self.backend.take(f'{endpoint}:{key}', rate, capacity))
+            except Exception:
+                self.backend_errors += 1
+        if wait:
+            self.limited += 1
+        return wait
+
+    def stats(self):
+        return {'backend': type(self.backend).__name__, 'buckets': self.backend.size(),
+                'checked': self.checked, 'limited': self.limited, 'backend_errors': self.backend_errors}
+
+
+def too_many_requests(retry_after):
+    """429 with Retry-After, as JSON for API calls and as a page for forms"""
+    message = 'Çok fazla istek gönderdiniz. Lütfen biraz bekleyip tekrar deneyin.'
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        response = jsonify({'success': False, 'message': message})
+    else:
+        response = render_template('rate_limited.html', message=message, retry_after=retry_after)
+    return response, 429, {'Retry-After': str(retry_after)}
+
+
+def init_rate_limits(app):
+    """Check the RATE_LIMITS policies of the endpoint before every request they cover.
+
+    The limiter is built from the app's own config and kept in
+    `app.extensions['rate_limiter']`. An endpoint may list several policies,
+    each with its own rate and keys; the longest wait wins.
+    """
+    if not app.config['RATE_LIMIT_ENABLED']:
+        return
+    limiter = RateLimiter(make_backend(app.config['RATE_LIMIT_BACKEND'], app.config['RATE_LIMIT_REDIS_URL'],
+                                       maxsize=app.config['RATE_LIMIT_MAX_BUCKETS']))
+    app.extensions['rate_limiter'] = limiter
+
+    @app.before_request
+    def _check_rate_limit():
+        policies = app.config['RATE_LIMITS'].get(request.endpoint)
+        if policies is None:
+            return None
+        if isinstance(policies, dict):
+            policies = (policies,)
+        wait = max((limiter.hit(request.endpoint, policy) for policy in policies
+                    if request.method in policy.get('methods', WRITE_METHODS)), default=0)
+        if wait:
+            return too_many_requests(math.ceil(wait))
+        return None
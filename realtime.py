@@ -0,0 +1,212 @@
+import json
+import os
+import queue
+import threading
+import time
+from config import Config
+from cache import on_commit
+
+
+def user_channel(user_id):
+    """Channel of one member's own notices (messages, tags, replies to their threads)"""
+    return f'user:{user_id}'
+
+
+def post_channel(post_id):
+    """Channel of the members reading a forum thread"""
+    return f'post:{post_id}'
+
+
+class Subscription:
+    """One open event stream: a bounded queue of (event type, JSON data) for its channels"""
+
+    def __init__(self, channels, maxsize=100):
+        self.channels = tuple(channels)
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, event_type, data):
+        try:
+            self._queue.put_nowait((event_type, data))
+        except queue.Full:
+            # A stalled client loses notices rather than holding memory
+            self.dropped += 1
+
+    def get(self, timeout):
+        """Next event, or None after `timeout` seconds without one"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LocalBroker:
+    """In-process stand-in for a message broker (development and tests).
+
+    Messages go through JSON and a listener thread like they would with
+    Redis, but only reach listeners in this process.
+    """
+
+    def __init__(self):
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def publish(self, message):
+        with self._lock:
+            listeners = list(self._listeners)
+        for inbox in listeners:
+            inbox.put(message)
+
+    def listen(self, callback):
+        inbox = queue.Queue()
+        with self._lock:
+            self._listeners.append(inbox)
+        while True:
+            callback(inbox.get())
+
+
+class RedisBroker:
+    """Redis pub/sub broker fanning events out to every worker (needs the optional `redis` package)"""
+
+    def __init__(self, url, channel='sabis:events'):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self.channel = channel
+
+    def publish(self, message):
+        self._client.publish(self.channel, message)
+
+    def listen(self, callback):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for item in pubsub.listen():
+            callback(item['data'].decode())
+
+
+def make_broker(name, url=None):
+    """Broker selected by EVENTS_BROKER ('', 'local' or 'redis')"""
+    if not name:
+        return None
+    if name == 'local':
+        return LocalBroker()
+    if name == 'redis':
+        return RedisBroker(url)
+    raise ValueError(f'Unknown event broker: {name}')
+
+
+class EventHub:
+    """Publish/subscribe between requests and the event streams open in this process.
+
+    Without a broker, events only reach streams in the publishing process.
+    With one, every event goes through the broker and each process's
+    listener thread (started lazily, once per process, so it survives
+    gunicorn forking workers) hands it to the local streams.
+    """
+
+    def __init__(self, broker=None, queue_size=100):
+        self.broker = broker
+        self.queue_size = queue_size
+        self._subscriptions = {}   # channel -> set of Subscription
+        self._lock = threading.Lock()
+        self._pid = None
+        self.published = 0
+        self.delivered = 0
+        self.broker_errors = 0
+
+    def _ensure_listening(self):
+        if self.broker is None or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._listen, name='event-broker', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _listen(self):
+        while True:
+            try:
+                self.broker.listen(self._receive)
+            except Exception:
+                # Broker outage: streams stay open, live notices resume on reconnect
+                self.broker_errors += 1
+                time.sleep(1)
+
+    def _receive(self, message):
+        self.deliver(*json.loads(message))
+
+    def subscribe(self, channels):
+        self._ensure_listening()
+        subscription = Subscription(channels, maxsize=self.queue_size)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+    def publish(self, channel, event_type, data):
+        """Send an event (`data` already JSON-encoded) to every stream on `channel`"""
+        self.published += 1
+        if self.broker is None:
+            self.deliver(channel, event_type, data)
+            return
+        try:
+            self.broker.publish(json.dumps([channel, event_type, data]))
+        except Exception:
+            # Live notices are best effort; the data is already committed
+            self.broker_errors += 1
+
+    def deliver(self, channel, event_type, data):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(event_type, data)
+        self.delivered += len(subscribers)
+
+    def stream_count(self):
+        with self._lock:
+            return len({subscription for subscribers in self._subscriptions.values() for subscription in subscribers})
+
+    def stats(self):
+        with self._lock:
+            channels = len(self._subscriptions)
+        return {'streams': self.stream_count(), 'channels': channels, 'published': self.published,
+                'delivered': self.delivered, 'broker': type(self.broker).__name__ if self.broker else None,
+                'broker_errors': self.broker_errors}
+
+
+event_hub = EventHub(make_broker(Config.EVENTS_BROKER, Config.EVENTS_REDIS_URL), queue_size=Config.EVENTS_QUEUE_SIZE)
+
+
+def publish_event(session, channel, event_type, data):
+    """Publish an event once `session` commits, so clients never hear of rolled back writes"""
+    data = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    on_commit(session, event_hub.publish, channel, event_type, data)
+
+
+def sse_stream(subscription, heartbeat=15.0, duration=300.0, retry_ms=3000):
+    """text/event-stream body for a subscription.
+
+    A comment line every `heartbeat` seconds keeps proxies from closing the
+    connection and lets the server notice clients that went away. After
+    `duration` seconds the stream ends and the browser reconnects, so a
+    stream never holds a worker thread indefinitely.
+    """
+    yield f'retry: {retry_ms}\n\n'
+    deadline = time.monotonic() + duration
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        event = subscription.get(timeout=min(heartbeat, remaining))
+        if event is None:
+            yield ': ping\n\n'
+        else:
+            yield f'event: {event[0]}\ndata: {event[1]}\n\n'
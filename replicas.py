@@ -0,0 +1,87 @@
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import g, has_app_context, has_request_context, request, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.sql import Select
+
+# Flask session key holding the time until which this browser reads from the primary
+STICKY_KEY = '_primary_until'
+
+
+class RoutingSession(Session):
+    """Session that sends plain SELECTs to a read replica when the request allows it.
+
+    A request opts in by putting a replica engine in `session.info['replica']`
+    (see init_replicas). Everything else goes to the primary: flushes, core
+    INSERT/UPDATE/DELETE, raw SQL, SELECT ... FOR UPDATE, and every statement
+    after the session's first write, so a request reads its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        if replica is not None and bind is None and not self.info.get('wrote'):
+            if isinstance(clause, Select) and clause._for_update_arg is None and not self._flushing:
+                return replica
+            if clause is not None or self._flushing:
+                self.info['wrote'] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_written(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(session):
+    # Replicas lag: keep this browser on the primary for a while after it wrote
+    if session.info.get('wrote') and has_request_context():
+        sticky = g.get('replica_sticky_seconds')
+        if sticky:
+            flask_session[STICKY_KEY] = time.time() + sticky
+
+
+def use_primary(view):
+    """Route every query of a GET view to the primary (views that write on GET)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from models import db
+        db.session.info.pop('replica', None)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def primary_reads():
+    """Send the queries inside the block to the primary, then restore the request's routing"""
+    if not has_app_context():
+        yield
+        return
+    from models import db
+    replica = db.session.info.pop('replica', None)
+    try:
+        yield
+    finally:
+        if replica is not None:
+            db.session.info['replica'] = replica
+
+
+def init_replicas(app, db, engine_options):
+    """Create replica engines from DATABASE_REPLICA_URLS and route safe requests to them"""
+    urls = app.config['DATABASE_REPLICA_URLS']
+    engines = [create_engine(url, **engine_options(url)) for url in urls]
+    app.extensions['replica_engines'] = engines
+    if not engines:
+        return
+
+    @app.before_request
+    def _choose_replica():
+        g.replica_sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+        if request.method not in ('GET', 'HEAD'):
+            return
+        if flask_session.get(STICKY_KEY, 0) > time.time():
+            return
+        db.session.info['replica'] = random.choice(engines)
@@ -0,0 +1,362 @@
+import bisect
+import math
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+from models import db, ForumPost, ForumReply, Video, Photo
+from utils import fold_turkish
+
+# Searchable document types; the code keeps SQLite FTS5 rowids unique per type
+DOC_TYPES = {'post': 1, 'reply': 2, 'video': 3, 'photo': 4}
+
+SNIPPET_LENGTH = 300
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(value):
+    """Fold Turkish letters and split into search tokens"""
+    return TOKEN_PATTERN.findall(fold_turkish(value))
+
+
+class SearchResult:
+    """One ranked hit, with enough stored data to render it without loading the source row"""
+
+    def __init__(self, doc_type, doc_id, parent_id, title, snippet, created_at, rank):
+        self.doc_type = doc_type
+        self.doc_id = doc_id
+        self.parent_id = parent_id
+        self.title = title
+        self.snippet = snippet
+        self.created_at = created_at
+        self.rank = rank
+
+
+class PostgresSearchBackend:
+    """tsvector documents with a GIN index; text is folded in Python and indexed with the 'simple' config"""
+
+    name = 'postgres'
+
+    def create_schema(self, connection):
+        connection.execute(text("""
+            CREATE TABLE IF NOT EXISTS search_documents (
+                doc_type VARCHAR(10) NOT NULL,
+                doc_id INTEGER NOT NULL,
+                parent_id INTEGER,
+                title VARCHAR(200),
+                snippet VARCHAR(300),
+                created_at TIMESTAMP,
+                tsv TSVECTOR NOT NULL,
+                PRIMARY KEY (doc_type, doc_id)
+            )
+        """))
+        connection.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_search_documents_tsv ON search_documents USING GIN (tsv)'
+        ))
+
+    def upsert(self, connection, documents):
+        connection.execute(text("""
+            INSERT INTO search_documents (doc_type, doc_id, parent_id, title, snippet, created_at, tsv)
+            VALUES (:doc_type, :doc_id, :parent_id, :title, :snippet, :created_at,
+                    setweight(to_tsvector('simple', :title_key), 'A') ||
+                    setweight(to_tsvector('simple', :body_key), 'B'))
+            ON CONFLICT (doc_type, doc_id) DO UPDATE SET
+                parent_id = EXCLUDED.parent_id, title = EXCLUDED.title, snippet = EXCLUDED.snippet,
+                created_at = EXCLUDED.created_at, tsv = EXCLUDED.tsv
+        """), documents)
+
+    def remove(self, connection, doc_type, doc_ids):
+        connection.execute(
+            text('DELETE FROM search_documents WHERE doc_type = :doc_type AND doc_id = ANY(:doc_ids)'),
+            {'doc_type': doc_type, 'doc_ids': list(doc_ids)}
+        )
+
+    def query(self, connection, tokens, doc_type, limit, offset):
+        # Every word must match; the last one also as a prefix (search-as-you-type)
+        terms = tokens[:-1] + [f"{tokens[-1]}:*"]
+        sql = """
+            SELECT doc_type, doc_id, parent_id, title, snippet, created_at, ts_rank_cd(tsv, query) AS rank
+            FROM search_documents, to_tsquery('simple', :query) AS query
+            WHERE tsv @@ query {type_filter}
+            ORDER BY rank DESC, created_at DESC
+            LIMIT :limit OFFSET :offset
+        """.format(type_filter='AND doc_type = :doc_type' if doc_type else '')
+        rows = connection.execute(text(sql), {
+            'query': ' & '.join(terms), 'doc_type': doc_type, 'limit': limit, 'offset': offset
+        })
+        return [SearchResult(*row) for row in rows]
+
+
+class SQLiteSearchBackend:
+    """SQLite FTS5 virtual table ranked with bm25(), for development databases"""
+
+    name = 'sqlite'
+
+    def create_schema(self, connection):
+        connection.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+                title_key, body_key,
+                doc_type UNINDEXED, doc_id UNINDEXED, parent_id UNINDEXED,
+                title UNINDEXED, snippet UNINDEXED, created_at UNINDEXED
+            )
+        """))
+
+    @staticmethod
+    def _rowid(doc_type, doc_id):
+        return doc_id * 8 + DOC_TYPES[doc_type]
+
+    def upsert(self, connection, documents):
+        for document in documents:
+            document = dict(document, rowid=self._rowid(document['doc_type'], document['doc_id']))
+            if isinstance(document['created_at'], datetime):
+                document['created_at'] = document['created_at'].isoformat()
+            connection.execute(text('DELETE FROM search_fts WHERE rowid = :rowid'), document)
+            connection.execute(text("""
+                INSERT INTO search_fts (rowid, title_key, body_key, doc_type, doc_id, parent_id, title, snippet, created_at)
+                VALUES (:rowid, :title_key, :body_key, :doc_type, :doc_id, :parent_id, :title, :snippet, :created_at)
+            """), document)
+
+    def remove(self, connection, doc_type, doc_ids):
+        for doc_id in doc_ids:
+            connection.execute(text('DELETE FROM search_fts WHERE rowid = :rowid'),
+                               {'rowid': self._rowid(doc_type, doc_id)})
+
+    def query(self, connection, tokens, doc_type, limit, offset):
+        match = ' '.join(f'"{token}"' for token in tokens[:-1]) + f' "{tokens[-1]}"*'
+        sql = """
+            SELECT doc_type, doc_id, parent_id, title, snippet, created_at, bm25(search_fts, 10.0, 1.0) AS rank
+            FROM search_fts
+            WHERE search_fts MATCH :match {type_filter}
+            ORDER BY rank, created_at DESC
+            LIMIT :limit OFFSET :offset
+        """.format(type_filter='AND doc_type = :doc_type' if doc_type else '')
+        rows = connection.execute(text(sql), {
+            'match': match.strip(), 'doc_type': doc_type, 'limit': limit, 'offset': offset
+        })
+        results = []
+        for row in rows:
+            created_at = datetime.fromisoformat(row.created_at) if row.created_at else None
+            results.append(SearchResult(row.doc_type, row.doc_id, row.parent_id, row.title,
+                                        row.snippet, created_at, -row.rank))
+        return results
+
+
+class MemorySearchBackend:
+    """Pure-Python inverted index, used when neither PostgreSQL nor FTS5 is available.
+
+    The index lives in process memory and is rebuilt from the database the
+    first time it is queried, so it only suits development and tests.
+    """
+
+    name = 'memory'
+    TITLE_WEIGHT = 3
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = defaultdict(dict)   # token -> {key: weighted term frequency}
+        self._documents = {}                 # key -> (SearchResult, tokens)
+        self._vocabulary = None              # sorted tokens, rebuilt lazily for prefix lookups
+        self.loaded = False
+
+    def create_schema(self, connection):
+        pass
+
+    def upsert(self, connection, documents):
+        with self._lock:
+            for document in documents:
+                key = (document['doc_type'], document['doc_id'])
+                self._discard(key)
+                weights = defaultdict(int)
+                for token in document['title_key'].split():
+                    weights[token] += self.TITLE_WEIGHT
+                for token in document['body_key'].split():
+                    weights[token] += 1
+                for token, weight in weights.items():
+                    self._postings[token][key] = weight
+                result = SearchResult(document['doc_type'], document['doc_id'], document['parent_id'],
+                                      document['title'], document['snippet'], document['created_at'], 0)
+                self._documents[key] = (result, list(weights))
+            self._vocabulary = None
+
+    def remove(self, connection, doc_type, doc_ids):
+        with self._lock:
+            for doc_id in doc_ids:
+                self._discard((doc_type, doc_id))
+            self._vocabulary = None
+
+    def _discard(self, key):
+        entry = self._documents.pop(key, None)
+        if entry:
+            for token in entry[1]:
+                self._postings[token].pop(key, None)
+                if not self._postings[token]:
+                    del self._postings[token]
+
+    def _prefix_tokens(self, prefix):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            yield token
+
+    def query(self, connection, tokens, doc_type, limit, offset):
+        with self._lock:
+            total = len(self._documents) or 1
+            scores = None
+            for position, token in enumerate(tokens):
+                is_last = position == len(tokens) - 1
+                matches = list(self._prefix_tokens(token)) if is_last else [token]
+                token_scores = defaultdict(float)
+                for match in matches:
+                    postings = self._postings.get(match, {})
+                    idf = math.log(1 + total / (1 + len(postings)))
+                    for key, weight in postings.items():
+                        token_scores[key] += weight * idf
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {key: score + token_scores[key] for key, score in scores.items() if key in token_scores}
+                if not scores:
+                    return []
+
+            ranked = []
+            for key, score in scores.items():
+                if doc_type and key[0] != doc_type:
+                    continue
+                result = self._documents[key][0]
+                ranked.append(SearchResult(result.doc_type, result.doc_id, result.parent_id, result.title,
+                                           result.snippet, result.created_at, score))
+        ranked.sort(key=lambda result: (result.rank, result.created_at or datetime.min), reverse=True)
+        return ranked[offset:offset + limit]
+
+
+_backends = {}
+
+
+def get_backend(engine=None):
+    """Search backend for the engine's dialect (or the SEARCH_BACKEND override)"""
+    engine = engine or db.engine
+    if engine in _backends:
+        return _backends[engine]
+
+    choice = current_app.config.get('SEARCH_BACKEND', 'auto')
+    if choice == 'auto':
+        choice = {'postgresql': 'postgres', 'sqlite': 'sqlite'}.get(engine.dialect.name, 'memory')
+    if choice == 'sqlite' and not _fts5_available(engine):
+        choice = 'memory'
+    backend = {
+        'postgres': PostgresSearchBackend,
+        'sqlite': SQLiteSearchBackend,
+        'memory': MemorySearchBackend,
+    }[choice]()
+    _backends[engine] = backend
+    return backend
+
+
+def _fts5_available(engine):
+    try:
+        with engine.connect() as connection:
+            connection.execute(text('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)'))
+            connection.execute(text('DROP TABLE temp.fts5_probe'))
+        return True
+    except OperationalError:
+        return False
+
+
+def _document(doc_type, doc_id, title, body, created_at, parent_id=None):
+    title = title or ''
+    body = body or ''
+    return {
+        'doc_type': doc_type,
+        'doc_id': doc_id,
+        'parent_id': parent_id,
+        'title': title[:200],
+        'snippet': body[:SNIPPET_LENGTH],
+        'created_at': created_at,
+        'title_key': ' '.join(tokenize(title)),
+        'body_key': ' '.join(tokenize(body)),
+    }
+
+
+def post_document(post):
+    return _document('post', post.id, post.title, post.content, post.created_at)
+
+
+def reply_document(reply, post_title=None):
+    return _document('reply', reply.id, post_title, reply.content, reply.created_at, parent_id=reply.post_id)
+
+
+def video_document(video):
+    return _document('video', video.id, video.title, video.description, video.uploaded_at)
+
+
+def photo_document(photo):
+    return _document('photo', photo.id, photo.caption, '', photo.uploaded_at)
+
+
+def index_documents(documents, connection=None):
+    """Add or replace documents inside the current transaction"""
+    if documents:
+        connection = connection or db.session.connection()
+        get_backend(connection.engine).upsert(connection, documents)
+
+
+def remove_documents(doc_type, doc_ids, connection=None):
+    """Drop documents of one type inside the current transaction"""
+    doc_ids = list(doc_ids)
+    if doc_ids:
+        connection = connection or db.session.connection()
+        get_backend(connection.engine).remove(connection, doc_type, doc_ids)
+
+
+def _rebuild_sources():
+    posts, replies, videos, photos = (model.__table__ for model in (ForumPost, ForumReply, Video, Photo))
+    return (
+        (posts, select(posts.c.id, posts.c.title, posts.c.content, posts.c.created_at),
+         lambda row: _document('post', row.id, row.title, row.content, row.created_at)),
+        (replies, select(replies.c.id, replies.c.post_id, replies.c.content, replies.c.created_at,
+                         posts.c.title).join(posts, posts.c.id == replies.c.post_id),
+         lambda row: _document('reply', row.id, row.title, row.content, row.created_at, parent_id=row.post_id)),
+        (videos, select(videos.c.id, videos.c.title, videos.c.description, videos.c.uploaded_at),
+         lambda row: _document('video', row.id, row.title, row.description, row.uploaded_at)),
+        (photos, select(photos.c.id, photos.c.caption, photos.c.uploaded_at),
+         lambda row: _document('photo', row.id, row.caption, '', row.uploaded_at)),
+    )
+
+
+def rebuild_index(connection, batch_size=500):
+    """(Re)index every searchable row, in primary-key batches"""
+    backend = get_backend(connection.engine)
+    backend.create_schema(connection)
+    for table, statement, to_document in _rebuild_sources():
+        last_id = 0
+        while True:
+            rows = connection.execute(
+                statement.where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            backend.upsert(connection, [to_document(row) for row in rows])
+            last_id = rows[-1].id
+    if isinstance(backend, MemorySearchBackend):
+        backend.loaded = True
+
+
+def search(q, doc_type=None, limit=20, offset=0):
+    """Ranked full-text hits for `q`, optionally limited to one document type"""
+    tokens = tokenize(q)
+    if not tokens:
+        return []
+    if doc_type not in DOC_TYPES:
+        doc_type = None
+
+    connection = db.session.connection()
+    backend = get_backend(connection.engine)
+    if isinstance(backend, MemorySearchBackend) and not backend.loaded:
+        rebuild_index(connection)
+    return backend.query(connection, tokens, doc_type, limit, offset)
@@ -0,0 +1,233 @@
+import itertools
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert, text
+from werkzeug.security import generate_password_hash
+from geo import encode_geohash
+from search import rebuild_index
+from hobbies import rebuild_hobby_index
+from forum import refresh_reply_stats
+from activity import rebuild_activity
+from models import db, user_search_key, User, Photo, PhotoTag, Video, ForumPost, ForumReply, Message, Location
+
+DEFAULT_SIZES = {
+    'users': 200,
+    'photos': 600,
+    'tags': 900,
+    'videos': 200,
+    'posts': 400,
+    'replies': 2000,
+    'messages': 3000,
+    'locations': 150,
+}
+
+FIRST_NAMES = ['Ahmet', 'Mehmet', 'Ayşe', 'Fatma', 'Emre', 'Zeynep', 'Can', 'Elif', 'Burak', 'Şule',
+               'İsmail', 'Gökçe', 'Oğuz', 'Ece', 'Çağrı', 'Irmak', 'Ilgın', 'Deniz', 'Barış', 'Özge']
+LAST_NAMES = ['Yılmaz', 'Kaya', 'Demir', 'Şahin', 'Çelik', 'Yıldız', 'Aydın', 'Öztürk', 'Arslan', 'Doğan',
+              'Kılıç', 'Aslan', 'Çetin', 'Koç', 'Kurt', 'Özdemir', 'Erdoğan', 'Güneş', 'Işık', 'Uğur']
+SCHOOLS = ['bogazici', 'metu', 'itu', 'hacettepe', 'bilkent', 'other']
+CITIES = ['istanbul', 'ankara', 'izmir', 'bursa', 'antalya', 'adana', 'other']
+HOBBIES = ['Kitap okuma', 'Spor', 'Müzik', 'Seyahat', 'Fotoğrafçılık', 'Satranç', 'Yüzme',
+           'Dağcılık', 'Sinema', 'Yemek', 'Bisiklet', 'Resim']
+# Map clusters: (latitude, longitude, weight) of the cities most members live in
+CITY_CENTERS = [(41.01, 28.98, 0.45), (39.93, 32.86, 0.2), (38.42, 27.14, 0.12), (40.19, 29.06, 0.08),
+                (36.90, 30.70, 0.08), (37.00, 35.32, 0.07)]
+WORDS = ['mezun', 'buluşma', 'ders', 'proje', 'kampüs', 'hoca', 'sınav', 'staj', 'iş', 'gezi',
+         'etkinlik', 'konser', 'kütüphane', 'yurt', 'kulüp', 'şenlik', 'ödev', 'tez', 'çay', 'kahve']
+
+
+def _sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def _timestamp(rng, start, span):
+    return start + timedelta(seconds=rng.randrange(int(span.total_seconds())))
+
+
+class _Skewed:
+    """Picks items with Zipf-like weights (weight of rank r is 1 / r**exponent).
+
+    Real communities are uneven: a few members post most of the content,
+    a few threads get most replies. Items are shuffled first so the popular
+    ones are not simply the lowest ids. An exponent of 0 picks uniformly.
+    """
+
+    def __init__(self, rng, items, exponent):
+        self.rng = rng
+        self.items = list(items)
+        rng.shuffle(self.items)
+        weights = [1.0 / (rank ** exponent) for rank in range(1, len(self.items) + 1)]
+        self.cum_weights = list(itertools.accumulate(weights))
+
+    def pick(self):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights)[0]
+
+
+def _bulk_insert(model, rows, chunk_size=1000):
+    for offset in range(0, len(rows), chunk_size):
+        db.session.execute(insert(model), rows[offset:offset + chunk_size])
+
+
+def _reset_sequences():
+    """Move PostgreSQL id sequences past the explicitly inserted ids"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for model in (User, Photo, PhotoTag, Video, ForumPost, ForumReply, Message, Location):
+        table = model.__tablename__
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+        ))
+
+
+def seed_database(sizes=None, seed=42, password='password', skew=1.0):
+    """Fill an empty database with synthetic members and content.
+
+    Rows are written with explicit ids through bulk inserts so large data sets
+    load in seconds. Every seeded user shares the same password. `skew` is the
+    Zipf exponent for who posts, which threads get replies and who writes to
+    whom (0 spreads everything uniformly).
+    """
+    sizes = {**DEFAULT_SIZES, **(sizes or {})}
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    year = timedelta(days=365)
+    start = now - year
+    password_hash = generate_password_hash(password)
+
+    user_ids = list(range(1, sizes['users'] + 1))
+    users = []
+    for user_id in user_ids:
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        created_at = _timestamp(rng, start, year)
+        users.append({
+            'id': user_id,
+            'username': f'user{user_id}',
+            'email': f'user{user_id}@example.com',
+            'password_hash': password_hash,
+            'first_name': first_name,
+            'last_name': last_name,
+            'search_key': user_search_key(first_name, last_name, f'user{user_id}'),
+            'gender': rng.choice(['male', 'female', 'other']),
+            'birth_place': rng.choice(CITIES),
+            'school': rng.choice(SCHOOLS),
+            'hobbies': ', '.join(rng.sample(HOBBIES, rng.randint(0, 4))),
+            'about': _sentence(rng, 30),
+            'current_location': rng.choice([None, 'Kampüs', 'Kütüphane', 'Kafe']),
+            'current_activity': rng.choice([None, 'Ders çalışıyor', 'Kahve içiyor']),
+            'created_at': created_at,
+            'updated_at': created_at,
+        })
+    _bulk_insert(User, users)
+    # Separate orders so heavy posters are not automatically heavy messagers
+    authors = _Skewed(rng, user_ids, skew)
+    correspondents = _Skewed(rng, user_ids, skew)
+
+    photos = [{
+        'id': photo_id,
+        'user_id': authors.pick(),
+        'filename': f'seed/photos/photo_{photo_id}',
+        'caption': _sentence(rng, 6),
+        'uploaded_at': _timestamp(rng, start, year),
+    } for photo_id in range(1, sizes['photos'] + 1)]
+    _bulk_insert(Photo, photos)
+
+    if photos:
+        tagged_photos = _Skewed(rng, range(1, len(photos) + 1), skew)
+        _bulk_insert(PhotoTag, [{
+            'id': tag_id,
+            'photo_id': tagged_photos.pick(),
+            'tagged_user_id': correspondents.pick(),
+            'shape': 'rect',
+            'coords': '10,10,30,30',
+            'created_at': _timestamp(rng, start, year),
+        } for tag_id in range(1, sizes['tags'] + 1)])
+
+    _bulk_insert(Video, [{
+        'id': video_id,
+        'user_id': authors.pick(),
+        'youtube_url': f'https://www.youtube.com/watch?v=seed{video_id:07d}',
+        'youtube_id': f'seed{video_id:07d}',
+        'title': _sentence(rng, 4),
+        'description': _sentence(rng, 15),
+        'uploaded_at': _timestamp(rng, start, year),
+    } for video_id in range(1, sizes['videos'] + 1)])
+
+    posts = []
+    for post_id in range(1, sizes['posts'] + 1):
+        created_at = _timestamp(rng, start, year)
+        posts.append({
+            'id': post_id,
+            'user_id': authors.pick(),
+            'title': _sentence(rng, 5),
+            'content': _sentence(rng, 80),
+            'created_at': created_at,
+            'updated_at': created_at,
+        })
+    _bulk_insert(ForumPost, posts)
+
+    if posts:
+        replies = []
+        hot_posts = _Skewed(rng, posts, skew)
+        for reply_id in range(1, sizes['replies'] + 1):
+            post = hot_posts.pick()
+            replies.append({
+                'id': reply_id,
+                'post_id': post['id'],
+                'user_id': authors.pick(),
+                'content': _sentence(rng, 25),
+                'created_at': _timestamp(rng, post['created_at'], max(now - post['created_at'], timedelta(seconds=1))),
+            })
+        _bulk_insert(ForumReply, replies)
+    refresh_reply_stats()
+
+    messages = []
+    for message_id in range(1, sizes['messages'] + 1):
+        sender_id = correspondents.pick()
+        recipient_id = correspondents.pick()
+        while recipient_id == sender_id and len(user_ids) > 1:
+            recipient_id = correspondents.pick()
+        messages.append({
+            'id': message_id,
+            'sender_id': sender_id,
+            'recipient_id': recipient_id,
+            'subject': _sentence(rng, 4),
+            'content': _sentence(rng, 40),
+            'is_read': rng.random() < 0.7,
+            'created_at': _timestamp(rng, start, year),
+        })
+    _bulk_insert(Message, messages)
+    unread = (
+        db.select(db.func.count(Message.id))
+        .where(Message.recipient_id == User.id, Message.is_read == db.false())
+        .scalar_subquery()
+    )
+    db.session.execute(db.update(User).values(unread_messages=unread))
+
+    locations = []
+    for index, user_id in enumerate(rng.sample(user_ids, min(sizes['locations'], len(user_ids))), start=1):
+        if rng.random() < 0.85:
+            # Most members sit in a few cities, the rest anywhere in the country
+            latitude, longitude, _ = rng.choices(CITY_CENTERS, weights=[city[2] for city in CITY_CENTERS])[0]
+            latitude, longitude = latitude + rng.gauss(0, 0.08), longitude + rng.gauss(0, 0.1)
+        else:
+            latitude, longitude = rng.uniform(36.0, 42.0), rng.uniform(26.0, 45.0)
+        locations.append({
+            'id': index,
+            'user_id': user_id,
+            'latitude': latitude,
+            'longitude': longitude,
+            'geohash': encode_geohash(latitude, longitude),
+            'address': '',
+            'updated_at': _timestamp(rng, start, year),
+        })
+    _bulk_insert(Location, locations)
+
+    _reset_sequences()
+    # Bulk inserts bypass the routes that index new content
+    rebuild_index(db.session.connection())
+    rebuild_hobby_index(db.session.connection())
+    rebuild_activity(db.session.connection())
+    db.session.commit()
+    return sizes
@@ -32,6 +32,26 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
     
+    // Video facades: load the YouTube player only for the video being played
+    document.querySelectorAll('.video-facade').forEach(facade => {
+        facade.addEventListener('click', function(e) {
+            e.preventDefault();
+            const iframe = document.createElement('iframe');
+            iframe.src = this.dataset.embedUrl;
+            iframe.title = this.getAttribute('aria-label');
+            iframe.allow = 'accelerometer; autoplay; encrypted-media; gyroscope; picture-in-picture';
+            iframe.allowFullscreen = true;
+            this.replaceWith(iframe);
+        });
+    });
+    
+    // Live notices (new messages, tags, replies) instead of reloading pages;
+    // only pages marked with data-events-url connect (see EVENTS_ON_EVERY_PAGE)
+    const liveEvents = document.querySelector('[data-events-url]');
+    if (liveEvents) {
+        startLiveUpdates(liveEvents.dataset.eventsUrl);
+    }
+    
     // Auto-dismiss alerts after 5 seconds
     const alerts = document.querySelectorAll('.alert');
     alerts.forEach(alert => {
@@ -99,6 +119,78 @@ function showNotification(message, type = 'info') {
             notification.remove();
         }, 500);
     }, 3000);
+    return notification;
+}
+
+// Server-Sent Events: small JSON notices pushed by /events
+function startLiveUpdates(url) {
+    const thread = document.querySelector('[data-live-post]');
+    const postId = thread ? Number(thread.dataset.livePost) : null;
+    if (postId) url += `?post=${postId}`;
+
+    function notify(message, link) {
+        const notification = showNotification(message, 'info');
+        if (link) {
+            notification.style.cursor = 'pointer';
+            notification.addEventListener('click', () => { window.location.href = link; });
+        }
+    }
+
+    function bumpUnreadBadge() {
+        const link = document.getElementById('nav-messages');
+        if (!link) return;
+        let badge = link.querySelector('.nav-badge');
+        if (!badge) {
+            badge = document.createElement('span');
+            badge.className = 'nav-badge';
+            badge.textContent = '0';
+            link.appendChild(badge);
+        }
+        badge.textContent = String(Number(badge.textContent) + 1);
+    }
+
+    let newReplies = 0;
+    function showNewReply(reply) {
+        const counter = document.getElementById('reply-count');
+        if (counter) counter.textContent = String(Number(counter.textContent) + 1);
+        const notice = document.getElementById('live-replies');
+        if (!notice) return;
+        newReplies += 1;
+        const link = notice.querySelector('a');
+        // Link to the first reply that arrived, so the page opens where reading stopped
+        if (newReplies === 1) link.href = reply.url;
+        link.textContent = newReplies === 1
+            ? `${reply.author} yeni bir yanıt yazdı — görüntüle`
+            : `${newReplies} yeni yanıt — görüntüle`;
+        notice.hidden = false;
+    }
+
+    function connect() {
+        const source = new EventSource(url);
+        source.addEventListener('new_message', e => {
+            const data = JSON.parse(e.data);
+            bumpUnreadBadge();
+            notify(`${data.sender} size mesaj gönderdi: ${data.subject}`, data.url);
+        });
+        source.addEventListener('tag', e => {
+            const data = JSON.parse(e.data);
+            notify(`${data.by} sizi bir fotoğrafta etiketledi`, data.url);
+        });
+        source.addEventListener('post_reply', e => {
+            const data = JSON.parse(e.data);
+            // Readers of the thread already see it through the 'reply' event
+            if (data.post_id !== postId) notify(`${data.author} "${data.title}" konunuza yanıt verdi`, data.url);
+        });
+        source.addEventListener('reply', e => showNewReply(JSON.parse(e.data)));
+        source.onerror = () => {
+            // The browser reconnects by itself, after the delay a busy worker
+            // asks for with `retry:`; an error response closes the stream for
+            // good, so then try again a minute later
+            if (source.readyState === EventSource.CLOSED) setTimeout(connect, 60000);
+        };
+    }
+
+    if (window.EventSource) connect();
 }
 
 // AJAX helper
@@ -117,3 +209,71 @@ async function fetchJSON(url, options = {}) {
         throw error;
     }
 }
+
+// User autocomplete (photo tagging, message recipients)
+function attachUserAutocomplete(input, list, onSelect, options = {}) {
+    let timer = null;
+    let lastTerm = null;
+
+    function render(users) {
+        list.innerHTML = '';
+        if (users.length === 0) {
+            const empty = document.createElement('li');
+            empty.className = 'user-select-item text-muted';
+            empty.textContent = 'Kullanıcı bulunamadı';
+            list.appendChild(empty);
+            return;
+        }
+        users.forEach(user => {
+            const item = document.createElement('li');
+            item.className = 'user-select-item';
+
+            const avatar = document.createElement('div');
+            avatar.className = 'user-avatar-small';
+            if (user.photo_url) {
+                const img = document.createElement('img');
+                img.src = user.photo_url;
+                img.alt = 'Avatar';
+                avatar.appendChild(img);
+            } else {
+                avatar.textContent = user.name.split(' ').map(part => part[0]).join('').slice(0, 2);
+            }
+
+            const label = document.createElement('span');
+            label.textContent = `${user.name} (@${user.username})`;
+
+            item.appendChild(avatar);
+            item.appendChild(label);
+            item.addEventListener('click', () => onSelect(user));
+            list.appendChild(item);
+        });
+    }
+
+    async function search() {
+        const term = input.value.trim();
+        if (term === lastTerm) return;
+        lastTerm = term;
+        if (!term) {
+            list.innerHTML = '';
+            return;
+        }
+        const params = new URLSearchParams({ q: term });
+        if (options.excludeSelf) params.set('exclude_self', '1');
+        const data = await fetchJSON(`/api/users/autocomplete?${params}`);
+        // Ignore answers to terms the user has already typed past
+        if (term === input.value.trim()) render(data.users);
+    }
+
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(search, 200);
+    });
+
+    return {
+        reset() {
+            input.value = '';
+            lastTerm = null;
+            list.innerHTML = '';
+        }
+    };
+}
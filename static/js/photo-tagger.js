@@ -4,6 +4,7 @@ let isTagging = false;
 let currentPhotoId;
 let tempMarker = null;
 let currentCoords = null;
+let userPicker = null;
 
 function initPhotoTagger(photoId) {
   currentPhotoId = photoId;
@@ -15,6 +16,12 @@ function initPhotoTagger(photoId) {
     return;
   }
 
+  userPicker = attachUserAutocomplete(
+    document.getElementById('userSearchInput'),
+    document.getElementById('userListSelect'),
+    user => selectUser(user.id, user.name)
+  );
+
   startButton.addEventListener('click', function () {
     isTagging = !isTagging;
     updateUIState();
@@ -36,11 +43,9 @@ function initPhotoTagger(photoId) {
     // Open modal
     document.getElementById('taggingModal').style.display = 'block';
 
-    // Focus search input and reset
-    const searchInput = document.getElementById('userSearchInput');
-    searchInput.value = '';
-    searchInput.focus();
-    filterUsers(); // Reset filter
+    // Reset the user search and focus it
+    userPicker.reset();
+    document.getElementById('userSearchInput').focus();
   });
 
   // The saveBtn.addEventListener is removed as selection from the list now triggers saving
@@ -103,23 +108,6 @@ function closeTaggingModal() {
   removeTempMarker();
 }
 
-function filterUsers() {
-  const input = document.getElementById('userSearchInput');
-  const filter = input.value.toLowerCase();
-  const ul = document.getElementById('userListSelect');
-  const li = ul.getElementsByTagName('li');
-
-  for (let i = 0; i < li.length; i++) {
-    const span = li[i].getElementsByTagName('span')[0];
-    const txtValue = span.textContent || span.innerText;
-    if (txtValue.toLowerCase().indexOf(filter) > -1) {
-      li[i].style.display = "";
-    } else {
-      li[i].style.display = "none";
-    }
-  }
-}
-
 function selectUser(userId, userName) {
   // Create coords string (x1,y1,x2,y2) - creating a small box around the point for compatibility
   // We will use the center point for rendering
@@ -0,0 +1,105 @@
+import os
+import queue
+import threading
+import time
+import traceback
+
+
+class PermanentError(Exception):
+    """A task failure that retrying cannot fix; the task fails at once"""
+
+
+class TaskQueue:
+    """Bounded in-process work queue served by a small pool of daemon threads.
+
+    Threads are started lazily, once per process, so the queue survives
+    gunicorn forking workers from a preloaded app. A failing task is retried
+    with exponential backoff; after the last attempt `on_failure` is called
+    with the task arguments. A task raising PermanentError skips the
+    remaining attempts.
+    """
+
+    def __init__(self, name, workers=2, maxsize=100, max_retries=3, retry_delay=2.0):
+        self.name = name
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._pid = None
+        self.submitted = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked child inherits the queue object but none of the threads
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            for index in range(self.workers):
+                threading.Thread(target=self._work, name=f'{self.name}-{index}', daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, func, *args, on_failure=None):
+        """Queue `func(*args)`; returns False when the queue is full"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((func, args, on_failure))
+        except queue.Full:
+            self.rejected += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def run(self, func, *args, on_failure=None):
+        """Run a task on the calling thread with the same retry policy"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                func(*args)
+                self.completed += 1
+                return True
+            except PermanentError:
+                traceback.print_exc()
+                break
+            except Exception:
+                traceback.print_exc()
+                if attempt < self.max_retries:
+                    self.retried += 1
+                    time.sleep(self.retry_delay * 2 ** attempt)
+        self.failed += 1
+        if on_failure:
+            try:
+                on_failure(*args)
+            except Exception:
+                traceback.print_exc()
+        return False
+
+    def _work(self):
+        while True:
+            func, args, on_failure = self._queue.get()
+            try:
+                self.run(func, *args, on_failure=on_failure)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Block until every queued task has finished"""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'queued': self._queue.qsize(),
+            'max_queued': self._queue.maxsize,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'retried': self.retried,
+            'failed': self.failed,
+            'rejected': self.rejected,
+        }
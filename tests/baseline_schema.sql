@@ -0,0 +1,106 @@
+-- Schema created by the first release (db.create_all, before versioned migrations)
+
+CREATE TABLE users (
+    id INTEGER NOT NULL,
+    username VARCHAR(80) NOT NULL,
+    email VARCHAR(120) NOT NULL,
+    password_hash VARCHAR(255) NOT NULL,
+    first_name VARCHAR(50) NOT NULL,
+    last_name VARCHAR(50) NOT NULL,
+    gender VARCHAR(10),
+    birth_place VARCHAR(100),
+    school VARCHAR(100),
+    hobbies VARCHAR(500),
+    about TEXT,
+    profile_photo VARCHAR(255),
+    current_location VARCHAR(100),
+    current_activity VARCHAR(200),
+    created_at DATETIME,
+    updated_at DATETIME,
+    PRIMARY KEY (id),
+    UNIQUE (username),
+    UNIQUE (email)
+);
+
+CREATE TABLE photos (
+    id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    thumbnail VARCHAR(255),
+    caption VARCHAR(500),
+    uploaded_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(user_id) REFERENCES users (id)
+);
+
+CREATE TABLE videos (
+    id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    youtube_url VARCHAR(255) NOT NULL,
+    youtube_id VARCHAR(50) NOT NULL,
+    title VARCHAR(200),
+    description TEXT,
+    uploaded_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(user_id) REFERENCES users (id)
+);
+
+CREATE TABLE forum_posts (
+    id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    title VARCHAR(200) NOT NULL,
+    content TEXT NOT NULL,
+    created_at DATETIME,
+    updated_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(user_id) REFERENCES users (id)
+);
+
+CREATE TABLE messages (
+    id INTEGER NOT NULL,
+    sender_id INTEGER NOT NULL,
+    recipient_id INTEGER NOT NULL,
+    subject VARCHAR(200),
+    content TEXT NOT NULL,
+    is_read BOOLEAN,
+    created_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(sender_id) REFERENCES users (id),
+    FOREIGN KEY(recipient_id) REFERENCES users (id)
+);
+
+CREATE TABLE locations (
+    id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    latitude FLOAT NOT NULL,
+    longitude FLOAT NOT NULL,
+    address VARCHAR(255),
+    updated_at DATETIME,
+    PRIMARY KEY (id),
+    UNIQUE (user_id),
+    FOREIGN KEY(user_id) REFERENCES users (id)
+);
+
+CREATE TABLE photo_tags (
+    id INTEGER NOT NULL,
+    photo_id INTEGER NOT NULL,
+    tagged_user_id INTEGER NOT NULL,
+    shape VARCHAR(20) NOT NULL,
+    coords VARCHAR(200) NOT NULL,
+    created_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(photo_id) REFERENCES photos (id),
+    FOREIGN KEY(tagged_user_id) REFERENCES users (id)
+);
+
+CREATE TABLE forum_replies (
+    id INTEGER NOT NULL,
+    post_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    created_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(post_id) REFERENCES forum_posts (id),
+    FOREIGN KEY(user_id) REFERENCES users (id)
+);
+
@@ -0,0 +1,78 @@
+"""Shared fixtures: an app on a throwaway SQLite database, migrated to the latest version.
+
+Config reads the environment when it is imported, so the offline settings
+are set here before the app is imported.
+"""
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix='sabis-tests-')
+os.environ.update({
+    'DATABASE_URL': 'sqlite:///' + os.path.join(_tmp, 'default.db'),
+    'MEDIA_BACKEND': 'local',
+    'UPLOAD_FOLDER': os.path.join(_tmp, 'uploads'),
+    'UPLOAD_SPOOL_FOLDER': os.path.join(_tmp, 'spool'),
+    'VIDEO_METADATA_BACKEND': 'stub',
+    'TASKS_EAGER': '1',
+    'RATE_LIMIT_ENABLED': '0',
+    'CACHE_SHARED_BACKEND': '',
+    # Image URLs are built offline; uploads still go to the local backend
+    'CLOUDINARY_CLOUD_NAME': 'demo',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from flask import g
+from config import Config
+from app import create_app
+from cache import fragment_cache, user_cache
+from migrations import upgrade
+from models import db, User
+
+PASSWORD = 'pw123456'
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'app.db')
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+
+    app = create_app(TestConfig)
+
+    @app.teardown_request
+    def _forget_login(exc):
+        # Requests share the fixture's app context, and with it `g`; without
+        # this every test client would stay logged in as the first member
+        g.pop('_login_user', None)
+
+    # Caches are per process and outlive a test's database
+    fragment_cache.cache.local.clear()
+    user_cache.local.clear()
+    with app.app_context():
+        upgrade()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def make_user(username, **values):
+    user = User(username=username, email=f'{username}@example.com', first_name=values.pop('first_name', 'Ayşe'),
+                last_name=values.pop('last_name', 'Yılmaz'), gender='female', school='itu', **values)
+    user.set_password(PASSWORD)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def login(client, username):
+    response = client.post('/login', data={'username': username, 'password': PASSWORD})
+    assert response.status_code == 302
+    return response
@@ -0,0 +1,69 @@
+import re
+from sqlalchemy import text
+from cache import FragmentCache, LocalSharedBackend, TieredCache, fragment_cache, load_cached_user, user_cache
+from config import Config
+from conftest import login, make_user
+from models import db, ForumPost, Photo, Video
+
+
+def _worker(shared, local_ttl=300):
+    """The fragment cache as one gunicorn worker process would build it"""
+    return FragmentCache(TieredCache('fragment', local_ttl=local_ttl, shared=shared), shared=shared)
+
+
+def test_version_bump_reaches_other_workers_through_the_shared_backend():
+    shared = LocalSharedBackend()
+    writer, reader = _worker(shared), _worker(shared)
+    assert reader.get_or_render('forum', 'recent', lambda: 'old') == 'old'
+    writer.bump('forum')
+    assert reader.get_or_render('forum', 'recent', lambda: 'new') == 'new'
+
+
+def test_unshared_fragments_expire_quickly():
+    # Another worker's bump cannot reach this process; only the TTL bounds staleness
+    assert fragment_cache.shared is None
+    assert fragment_cache.cache.local.ttl == Config.FRAGMENT_CACHE_UNSHARED_TTL <= 5
+
+    reader = _worker(None, local_ttl=0)
+    assert reader.get_or_render('forum', 'recent', lambda: 'old') == 'old'
+    assert reader.get_or_render('forum', 'recent', lambda: 'new') == 'new'
+
+
+def test_unread_count_is_read_fresh_while_the_identity_is_cached(app):
+    # Another worker's deletion reaches this process only when the local copy expires
+    assert user_cache.local.ttl == Config.USER_CACHE_LOCAL_TTL <= 5
+    user_id = make_user('ayse').id
+    assert load_cached_user(user_id).unread_messages == 0
+
+    # Another worker's write, whose invalidation never reaches this process
+    db.session.execute(text('UPDATE users SET unread_messages = 2 WHERE id = :id'), {'id': user_id})
+    db.session.commit()
+    assert user_cache.get(user_id) is not None
+    assert load_cached_user(user_id).unread_messages == 2
+
+
+def test_member_invalidation_reaches_other_workers_through_the_shared_backend():
+    shared = LocalSharedBackend()
+    writer, reader = (TieredCache('user', local_ttl=0, shared=shared) for _ in range(2))
+    writer.set(1, {'unread_messages': 0})
+    assert reader.get(1) == {'unread_messages': 0}
+    writer.delete(1)
+    assert reader.get(1) is None
+
+
+def test_only_first_pages_of_listings_are_cached(app, client):
+    user = make_user('ayse')
+    db.session.add_all([ForumPost(user_id=user.id, title=f'Konu {number}', content='İçerik') for number in range(3)])
+    db.session.add_all([Video(user_id=user.id, youtube_url=f'https://youtu.be/video{number:05d}',
+                              youtube_id=f'video{number:05d}', title=f'Video {number}') for number in range(3)])
+    db.session.add_all([Photo(user_id=user.id, filename=f'p{number}.jpg') for number in range(3)])
+    db.session.commit()
+    login(client, 'ayse')
+    app.config.update(FORUM_POSTS_PER_PAGE=1, VIDEOS_PER_PAGE=1, PHOTOS_PER_PAGE=1)
+    for url, params in (('/forum', {}), ('/forum', {'sort': 'active'}), ('/videos', {}), ('/photos', {})):
+        first = client.get(url, query_string=params).get_data(as_text=True)
+        cursor = re.search(r'cursor=([\w-]+)', first).group(1)
+        assert client.get(url, query_string=dict(params, cursor=cursor)).status_code == 200
+
+    keys = {tuple(key.split(':', 2)[::2]) for key in fragment_cache.cache.local._data}
+    assert keys == {('forum', 'first:new'), ('forum', 'first:active'), ('videos', 'first'), ('photos', 'first')}
@@ -0,0 +1,24 @@
+from conftest import login, make_user
+from models import db, ForumPost
+from realtime import event_hub
+
+
+def test_only_live_pages_open_the_stream_on_thread_workers(app, client):
+    assert not app.config['EVENTS_ON_EVERY_PAGE']
+    user = make_user('ayse')
+    db.session.add(ForumPost(user_id=user.id, title='Konu', content='İçerik'))
+    db.session.commit()
+    login(client, 'ayse')
+    assert 'data-events-url' not in client.get('/forum').get_data(as_text=True)
+    assert 'data-events-url="/events"' in client.get('/forum/1').get_data(as_text=True)
+
+
+def test_busy_worker_asks_the_browser_to_come_back_later(app, client, monkeypatch):
+    make_user('ayse')
+    login(client, 'ayse')
+    monkeypatch.setattr(event_hub, 'stream_count', lambda: app.config['EVENTS_MAX_STREAMS'])
+    response = client.get('/events')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Retry-After'] == str(app.config['EVENTS_BUSY_RETRY'])
+    assert response.get_data(as_text=True) == f"retry: {app.config['EVENTS_BUSY_RETRY'] * 1000}\n\n"
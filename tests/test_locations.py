@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+import locations
+from conftest import make_user
+from models import db, Location
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(locations, 'time', SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+@pytest.fixture
+def buffer(app, clock):
+    # The background flush never fires during a test; flushes are explicit
+    return locations.LocationBuffer(flush_interval=3600, flush_size=500, min_interval=5.0, min_distance=25.0)
+
+
+def _location(user_id):
+    db.session.remove()
+    return Location.query.filter_by(user_id=user_id).one_or_none()
+
+
+def test_updates_are_coalesced_to_the_newest_position(buffer, clock):
+    user_id = make_user('ayse').id
+    for latitude in (41.00, 41.01, 41.02):
+        assert buffer.offer(user_id, latitude, 29.0, f'adres {latitude}') == 'accepted'
+        clock.now += 10
+    assert buffer.stats()['pending'] == 1
+
+    assert buffer.flush() == 1
+    location = _location(user_id)
+    assert (location.latitude, location.longitude, location.address) == (41.02, 29.0, 'adres 41.02')
+    assert buffer.stats()['pending'] == 0
+    assert buffer.flush() == 0
+
+
+def test_small_moves_and_frequent_updates_are_dropped(buffer, clock):
+    user_id = make_user('ayse').id
+    assert buffer.offer(user_id, 41.0, 29.0) == 'accepted'
+
+    # ~1.1 km away but only 2 s after the last accepted update
+    clock.now += 2
+    assert buffer.offer(user_id, 41.01, 29.0) == 'throttled'
+
+    # ~11 m away: below min_distance however long it has been
+    clock.now += 60
+    assert buffer.offer(user_id, 41.0001, 29.0) == 'unchanged'
+
+    assert buffer.offer(user_id, 41.01, 29.0) == 'accepted'
+    assert {key: buffer.stats()[key] for key in ('accepted', 'unchanged', 'throttled')} == \
+        {'accepted': 2, 'unchanged': 1, 'throttled': 1}
+
+    buffer.flush()
+    assert _location(user_id).latitude == 41.01
+
+
+def test_an_older_position_never_overwrites_a_newer_one(app):
+    user_id = make_user('ayse').id
+    now = datetime.utcnow()
+    db.session.add(Location(user_id=user_id, latitude=41.0, longitude=29.0, address='yeni', updated_at=now))
+    db.session.commit()
+
+    def row(latitude, address, updated_at):
+        return {'user_id': user_id, 'latitude': latitude, 'longitude': 29.0, 'address': address,
+                'geohash': locations.encode_geohash(latitude, 29.0), 'updated_at': updated_at}
+
+    locations.upsert_locations([row(39.9, 'eski', now - timedelta(minutes=1))])
+    db.session.commit()
+    location = _location(user_id)
+    assert (location.latitude, location.address) == (41.0, 'yeni')
+
+    locations.upsert_locations([row(40.5, 'daha yeni', now + timedelta(minutes=1))])
+    db.session.commit()
+    location = _location(user_id)
+    assert (location.latitude, location.address) == (40.5, 'daha yeni')
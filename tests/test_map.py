@@ -0,0 +1,17 @@
+import pytest
+from conftest import login, make_user
+
+
+@pytest.mark.parametrize('bbox', ['', '1,2,3', 'a,b,c,d', 'nan,nan,nan,nan', 'inf,0,inf,1', '-inf,0,1,1'])
+def test_bad_bbox_is_a_client_error(client, bbox):
+    make_user('ayse')
+    login(client, 'ayse')
+    response = client.get('/map/points', query_string={'bbox': bbox, 'zoom': 6})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'bbox must be west,south,east,north'}
+
+
+def test_points_inside_a_bbox(client):
+    make_user('ayse')
+    login(client, 'ayse')
+    assert client.get('/map/points', query_string={'bbox': '26,36,45,42', 'zoom': 6}).status_code == 200
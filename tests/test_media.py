@@ -0,0 +1,192 @@
+import io
+import os
+import time
+from datetime import datetime, timedelta
+import pytest
+from PIL import Image
+import media
+from conftest import login, make_user
+from models import db, MediaDeletion, Photo
+
+
+class FlakyClient:
+    """Media client whose uploads fail at the given call numbers"""
+
+    def __init__(self, failing_calls=()):
+        self.failing_calls = set(failing_calls)
+        self.calls = 0
+        self.deleted = []
+
+    def upload(self, path, folder):
+        self.calls += 1
+        if self.calls in self.failing_calls:
+            raise ConnectionError('upload timed out')
+        return f'{folder}/asset{self.calls}'
+
+    def destroy(self, public_id):
+        self.deleted.append(public_id)
+
+    def delete_resources(self, public_ids):
+        self.deleted.extend(public_ids)
+        return []
+
+
+@pytest.fixture
+def client_stub(monkeypatch):
+    monkeypatch.setattr(media.upload_queue, 'retry_delay', 0)
+    monkeypatch.setattr(media.deletion_queue, 'retry_delay', 0)
+
+    def install(stub):
+        monkeypatch.setattr(media, 'get_media_client', lambda: stub)
+        return stub
+    return install
+
+
+def _pending_photo(app, tmp_path, content=None):
+    user = make_user('ayse')
+    photo = Photo(user_id=user.id, filename='', status='pending')
+    db.session.add(photo)
+    db.session.commit()
+    path = tmp_path / 'upload.jpg'
+    if content is None:
+        Image.new('RGB', (40, 30), 'red').save(path, 'JPEG')
+    else:
+        path.write_bytes(content)
+    return photo.id, str(path)
+
+
+def test_thumbnail_failure_deletes_the_orphaned_original(app, tmp_path, client_stub):
+    stub = client_stub(FlakyClient(failing_calls={2}))
+    photo_id, path = _pending_photo(app, tmp_path)
+
+    assert media.enqueue_photo_upload(photo_id, path)
+
+    photo = db.session.get(Photo, photo_id)
+    db.session.refresh(photo)
+    assert (photo.status, photo.filename, photo.thumbnail) == ('ready', 'photos/asset3', 'photos/thumbnails/asset4')
+    assert stub.deleted == ['photos/asset1']
+    assert MediaDeletion.query.count() == 0
+
+
+def test_corrupt_file_fails_without_retrying(app, tmp_path, client_stub):
+    stub = client_stub(FlakyClient())
+    photo_id, path = _pending_photo(app, tmp_path, content=b'not an image')
+    retried = media.upload_queue.retried
+
+    assert media.enqueue_photo_upload(photo_id, path)
+
+    photo = db.session.get(Photo, photo_id)
+    db.session.refresh(photo)
+    assert photo.status == 'failed'
+    assert media.upload_queue.retried == retried
+    assert stub.calls == 0
+
+
+def test_new_profile_photo_deletes_the_previous_one(app, tmp_path, client_stub):
+    stub = client_stub(FlakyClient())
+    user = make_user('ayse', profile_photo='profile_photos/old')
+    path = tmp_path / 'avatar.jpg'
+    Image.new('RGB', (40, 30), 'blue').save(path, 'JPEG')
+
+    assert media.enqueue_profile_photo_upload(user.id, str(path))
+
+    db.session.refresh(user)
+    assert user.profile_photo == 'profile_photos/asset1'
+    assert stub.deleted == ['profile_photos/old']
+    assert MediaDeletion.query.count() == 0
+
+
+def test_recover_uploads_lost_with_a_worker(app, tmp_path, client_stub):
+    client_stub(FlakyClient())
+    folder = tmp_path / 'spool'
+    folder.mkdir()
+    app.config['UPLOAD_SPOOL_FOLDER'] = str(folder)
+    user = make_user('ayse')
+    hour_ago = datetime.utcnow() - timedelta(hours=1)
+    lost, vanished, running = (Photo(user_id=user.id, filename='', status='pending', uploaded_at=uploaded_at)
+                               for uploaded_at in (hour_ago, hour_ago, datetime.utcnow()))
+    db.session.add_all([lost, vanished, running])
+    db.session.commit()
+
+    def spool(name, age=0):
+        path = folder / name
+        Image.new('RGB', (40, 30), 'red').save(path, 'JPEG')
+        os.utime(path, (time.time() - age, time.time() - age))
+        return path
+    spool(f'photo-{lost.id}.jpg', age=3600)
+    running_file = spool(f'photo-{running.id}.jpg')
+    orphan = spool('0a1b2c.jpg', age=3600)
+    recent = spool('3d4e5f.jpg')
+
+    assert media.recover_uploads(app, older_than=1800) == (1, 1, 1)
+
+    for photo in (lost, vanished, running):
+        db.session.refresh(photo)
+    assert (lost.status, vanished.status, running.status) == ('ready', 'failed', 'pending')
+    assert sorted(os.listdir(folder)) == sorted([running_file.name, recent.name])
+    assert not orphan.exists()
+
+
+def test_uploaded_photo_is_spooled_under_its_id(app, client, client_stub, monkeypatch):
+    client_stub(FlakyClient())
+    spooled = []
+    monkeypatch.setattr(media, '_upload_photo', lambda app, photo_id, path: spooled.append(os.path.basename(path)))
+    make_user('ayse')
+    login(client, 'ayse')
+    image = io.BytesIO()
+    Image.new('RGB', (40, 30), 'red').save(image, 'JPEG')
+    image.seek(0)
+    response = client.post('/photos/upload', data={'photo': (image, 'kampus.jpg'), 'caption': 'Kampüs'})
+    assert response.status_code == 302
+    assert spooled == [f'photo-{Photo.query.one().id}.jpg']
+
+
+class OutboxClient:
+    """Media client that refuses some ids and records the claims committed when it is called"""
+
+    def __init__(self, app, refused=(), fail=False):
+        self.app = app
+        self.refused = set(refused)
+        self.fail = fail
+        self.claimed = []
+
+    def delete_resources(self, public_ids):
+        # A fresh session only sees what the drainer committed
+        with self.app.app_context():
+            self.claimed.append(sorted(row.public_id for row in MediaDeletion.query.filter(
+                MediaDeletion.public_id.in_(public_ids), MediaDeletion.claimed_until.isnot(None))))
+            db.session.remove()
+        if self.fail:
+            raise ConnectionError('Admin API timed out')
+        return [public_id for public_id in public_ids if public_id in self.refused]
+
+
+def _outbox(*public_ids, **values):
+    db.session.add_all([MediaDeletion(public_id=public_id, **values) for public_id in public_ids])
+    db.session.commit()
+
+
+def test_deletions_are_claimed_before_the_api_call_and_only_confirmed_rows_removed(app, client_stub):
+    stub = client_stub(OutboxClient(app, refused={'b'}))
+    _outbox('a', 'b', 'c')
+
+    with pytest.raises(RuntimeError):
+        media.process_media_deletions(app)
+
+    assert stub.claimed == [['a', 'b', 'c']]
+    row = MediaDeletion.query.one()
+    assert (row.public_id, row.attempts, row.claimed_until, row.last_error) == ('b', 1, None, 'not deleted: b')
+
+
+def test_claimed_deletions_are_left_to_their_drainer(app, client_stub):
+    stub = client_stub(OutboxClient(app, fail=True))
+    _outbox('a', claimed_until=datetime.utcnow() + timedelta(minutes=5))
+    _outbox('b', claimed_until=datetime.utcnow() - timedelta(minutes=5))
+
+    with pytest.raises(RuntimeError):
+        media.process_media_deletions(app)
+
+    rows = {row.public_id: row for row in MediaDeletion.query}
+    assert (rows['a'].attempts, rows['b'].attempts) == (0, 1)
+    assert rows['b'].last_error == 'ConnectionError: Admin API timed out'
+    assert stub.claimed == [['b']]
@@ -0,0 +1,70 @@
+import os
+from sqlalchemy import create_engine, inspect
+from migrations import MIGRATIONS, current_version, upgrade
+from models import db
+
+
+def _index_names(engine):
+    inspector = inspect(engine)
+    return {index['name'] for table in inspector.get_table_names() for index in inspector.get_indexes(table)}
+
+
+def test_fresh_database_gets_every_declared_index(app):
+    declared = {index.name for table in db.metadata.tables.values() for index in table.indexes}
+    assert declared <= _index_names(db.engine)
+    assert current_version() == MIGRATIONS[-1][0]
+
+
+def test_later_steps_create_their_indexes_when_version_1_did_not(app, tmp_path):
+    # Tables as version 1 left them before later requests declared more indexes
+    engine = create_engine('sqlite:///' + str(tmp_path / 'old.db'))
+    upgrade(engine)
+    with engine.begin() as connection:
+        for name in ('ix_photos_uploaded_id', 'ix_users_search_key', 'ix_locations_geohash',
+                     'ix_forum_posts_activity_id'):
+            connection.exec_driver_sql(f'DROP INDEX {name}')
+        connection.exec_driver_sql('DELETE FROM schema_migrations WHERE version > 1')
+    upgrade(engine)
+    assert {'ix_photos_uploaded_id', 'ix_users_search_key', 'ix_locations_geohash',
+            'ix_forum_posts_activity_id'} <= _index_names(engine)
+    engine.dispose()
+
+
+def test_upgrade_from_the_baseline_schema(app, tmp_path):
+    engine = create_engine('sqlite:///' + str(tmp_path / 'baseline.db'))
+    with open(os.path.join(os.path.dirname(__file__), 'baseline_schema.sql')) as schema:
+        engine.raw_connection().executescript(schema.read())
+    with engine.begin() as connection:
+        for statement in (
+            "INSERT INTO users (id, username, email, password_hash, first_name, last_name, hobbies, created_at) "
+            "VALUES (1, 'ayse', 'ayse@example.com', 'x', 'Ayşe', 'Yılmaz', 'Kitap, Spor', '2024-01-01 10:00:00')",
+            "INSERT INTO users (id, username, email, password_hash, first_name, last_name, created_at) "
+            "VALUES (2, 'mehmet', 'mehmet@example.com', 'x', 'Mehmet', 'Kaya', '2024-01-01 10:00:00')",
+            "INSERT INTO forum_posts (id, user_id, title, content, created_at, updated_at) "
+            "VALUES (1, 1, 'Merhaba', 'İlk konu', '2024-01-02 10:00:00', '2024-01-02 10:00:00')",
+            "INSERT INTO forum_replies (post_id, user_id, content, created_at) VALUES (1, 2, 'Selam', '2024-01-03 10:00:00')",
+            "INSERT INTO messages (sender_id, recipient_id, subject, content, is_read, created_at) "
+            "VALUES (2, 1, 'Konu', 'Mesaj', 0, '2024-01-04 10:00:00')",
+            "INSERT INTO photos (id, user_id, filename, caption, uploaded_at) VALUES (1, 1, 'a.jpg', 'Kampüs', '2024-01-05 10:00:00')",
+            "INSERT INTO photo_tags (photo_id, tagged_user_id, shape, coords, created_at) "
+            "VALUES (1, 2, 'rect', '1,2,3,4', '2024-01-05 11:00:00')",
+            "INSERT INTO videos (user_id, youtube_url, youtube_id, title, uploaded_at) "
+            "VALUES (2, 'https://youtu.be/dQw4w9WgXcQ', 'dQw4w9WgXcQ', 'Video', '2024-01-06 10:00:00')",
+            "INSERT INTO locations (user_id, latitude, longitude, address, updated_at) "
+            "VALUES (1, 41.0, 29.0, 'Kütüphane', '2024-01-07 10:00:00')",
+        ):
+            connection.exec_driver_sql(statement)
+
+    upgrade(engine)
+
+    assert current_version(engine) == MIGRATIONS[-1][0]
+    declared = {index.name for table in db.metadata.tables.values() for index in table.indexes}
+    assert declared <= _index_names(engine)
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql('SELECT reply_count, last_activity_at FROM forum_posts').one() == \
+            (1, '2024-01-03 10:00:00')
+        assert connection.exec_driver_sql('SELECT unread_messages FROM users WHERE id = 1').scalar() == 1
+        assert connection.exec_driver_sql('SELECT geohash FROM locations').scalar()
+        assert connection.exec_driver_sql('SELECT COUNT(*) FROM user_hobbies').scalar() == 2
+        assert connection.exec_driver_sql('SELECT COUNT(*) FROM activity_events').scalar() == 6
+    engine.dispose()
@@ -0,0 +1,49 @@
+from datetime import datetime
+import pytest
+from conftest import login, make_user
+from models import db, Photo
+from pagination import decode_cursor, encode_cursor, keyset_paginate
+
+
+def _photos(cursor):
+    page = keyset_paginate(Photo.query, (Photo.uploaded_at, Photo.id), cursor=cursor, per_page=2)
+    return [photo.id for photo in page.items], page.next_cursor
+
+
+@pytest.fixture
+def photos(app):
+    user = make_user('ayse')
+    db.session.add_all([Photo(user_id=user.id, filename=f'p{number}.jpg') for number in range(3)])
+    db.session.commit()
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    encode_cursor(['yesterday', 3]),
+    encode_cursor([{'dt': 'yesterday'}, 3]),
+    encode_cursor([[1], 3]),
+    encode_cursor([None, 3]),
+    encode_cursor([1]),
+    encode_cursor(['Ayşe', 'Yılmaz', 3]),
+])
+def test_unusable_cursors_start_at_the_first_page(photos, cursor):
+    assert _photos(cursor) == _photos(None)
+
+
+def test_cursor_values_must_fit_the_sort_columns():
+    columns = (Photo.uploaded_at, Photo.id)
+    assert decode_cursor(encode_cursor([datetime(2025, 1, 1), 3]), columns) == [datetime(2025, 1, 1), 3]
+    assert decode_cursor(encode_cursor([datetime(2025, 1, 1), True]), columns) is None
+    assert decode_cursor(encode_cursor([3, datetime(2025, 1, 1)]), columns) is None
+
+
+def test_following_the_next_cursor(photos):
+    first, next_cursor = _photos(None)
+    assert _photos(next_cursor) == ([1], None)
+    assert first == [3, 2]
+
+
+def test_bad_cursor_in_a_url_is_not_an_error(photos, client):
+    login(client, 'ayse')
+    for url in ('/photos', '/forum', '/messages', '/people', '/activity', '/videos'):
+        assert client.get(url, query_string={'cursor': encode_cursor([{'dt': 'x'}, 'y'])}).status_code == 200
@@ -0,0 +1,23 @@
+import re
+from datetime import datetime, timedelta
+from conftest import login, make_user
+from models import db, Photo
+
+
+def test_gallery_is_paginated_newest_first(app, client):
+    user = make_user('ayse')
+    start = datetime(2025, 1, 1)
+    db.session.add_all([Photo(user_id=user.id, filename=f'p{i}.jpg', caption=f'Foto {i}',
+                              uploaded_at=start + timedelta(minutes=i)) for i in range(30)])
+    db.session.commit()
+    login(client, 'ayse')
+
+    first = client.get('/photos').get_data(as_text=True)
+    assert '30 fotoğraf' in first
+    captions = re.findall(r'alt="Foto (\d+)"', first)
+    assert captions == [str(i) for i in range(29, 5, -1)]
+
+    cursor = re.search(r'/photos\?cursor=([^"]+)"', first).group(1)
+    older = client.get(f'/photos?cursor={cursor}').get_data(as_text=True)
+    assert re.findall(r'alt="Foto (\d+)"', older) == [str(i) for i in range(5, -1, -1)]
+    assert 'Daha Eski Fotoğraflar' not in older
@@ -0,0 +1,86 @@
+from conftest import login, make_user
+from cache import fragment_cache, user_cache
+from instrumentation import track_queries
+from models import db, ForumPost, ForumReply, Message, Photo, PhotoTag, User
+
+# Most statements each hot page may run, whatever the amount of data
+BUDGETS = {
+    '/': 3,
+    '/forum': 3,
+    '/forum/1': 4,
+    '/photos': 4,
+    '/messages': 5,
+    '/people': 4,
+    '/search?q=kampus': 3,
+}
+
+
+def _add_members(app, numbers):
+    """Members who each post, reply to the first post, message ayse and share a photo tagging her"""
+    ayse = User.query.filter_by(username='ayse').one()
+    for number in numbers:
+        member = make_user(f'uye{number}', first_name=f'Üye{number}')
+        photo = Photo(user_id=member.id, filename=f'p{number}.jpg', caption=f'Kampus {number}')
+        db.session.add(photo)
+        db.session.flush()
+        db.session.add(PhotoTag(photo_id=photo.id, tagged_user_id=ayse.id, shape='rect', coords='1,2,3,4'))
+        db.session.commit()
+
+        client = app.test_client()
+        login(client, member.username)
+        client.post('/forum/post', data={'title': f'Konu {number}', 'content': 'Kampus hakkında'})
+        client.post('/forum/1', data={'content': f'Kampus yanıtı {number}'})
+        client.post('/messages/send', data={'recipient': ayse.id, 'subject': 'Merhaba', 'content': 'Kampusta görüşelim'})
+    db.session.remove()
+
+
+def _assert_seeded(members):
+    """Each member wrote as themself: a post, a reply and a message to ayse"""
+    ayse = User.query.filter_by(username='ayse').one()
+    authors = {user.id for user in User.query.filter(User.id != ayse.id)}
+    assert len(authors) == members
+    assert {post.user_id for post in ForumPost.query.filter(ForumPost.id > 1)} == authors
+    assert {reply.user_id for reply in ForumReply.query} == authors
+    assert {message.sender_id for message in Message.query.filter_by(recipient_id=ayse.id)} == authors
+    assert ayse.unread_messages == members
+
+
+def _query_counts(client):
+    counts = {}
+    for url in BUDGETS:
+        # Count what rendering the page costs, not what the caches saved
+        fragment_cache.cache.local.clear()
+        user_cache.local.clear()
+        # The fixture's app context outlives requests; start with an empty identity map
+        db.session.remove()
+        with track_queries() as stats:
+            response = client.get(url)
+        assert response.status_code == 200, url
+        counts[url] = stats.count
+    return counts
+
+
+def _ayse_client(app):
+    make_user('ayse')
+    client = app.test_client()
+    login(client, 'ayse')
+    client.post('/forum/post', data={'title': 'Kampüs duyurusu', 'content': 'Kampus etkinlikleri burada'})
+    return client
+
+
+def test_hot_routes_stay_within_their_query_budget(app):
+    client = _ayse_client(app)
+    _add_members(app, range(5))
+    _assert_seeded(5)
+    counts = _query_counts(client)
+    assert all(count <= BUDGETS[url] for url, count in counts.items()), counts
+
+
+def test_query_counts_do_not_grow_with_the_data(app):
+    client = _ayse_client(app)
+    _add_members(app, range(2))
+    _assert_seeded(2)
+    few = _query_counts(client)
+    _add_members(app, range(2, 8))
+    _assert_seeded(8)
+    assert _query_counts(client) == few
@@ -0,0 +1,61 @@
+import pytest
+from conftest import PASSWORD, make_user
+from app import create_app
+from config import Config
+from migrations import upgrade
+
+
+@pytest.fixture
+def limited(tmp_path):
+    """An app whose config class, not the environment, turns rate limits on"""
+    class LimitedConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'app.db')
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        RATE_LIMIT_ENABLED = True
+        RATE_LIMIT_BACKEND = 'memory'
+        RATE_LIMITS = dict(Config.RATE_LIMITS, **{'main.login': [
+            {'rate': 3, 'per': 60, 'burst': 3, 'keys': ('ip',)},
+            {'rate': 1, 'per': 60, 'burst': 2, 'keys': ('ip_username',)},
+        ]})
+
+    app = create_app(LimitedConfig)
+    with app.app_context():
+        upgrade()
+        make_user('ayse')
+        make_user('mehmet')
+    return app
+
+
+def _login(client, username, ip, password='yanlış'):
+    return client.post('/login', data={'username': username, 'password': password},
+                       environ_base={'REMOTE_ADDR': ip})
+
+
+def test_too_many_attempts_get_429_with_retry_after(limited):
+    client = limited.test_client()
+    assert [_login(client, 'ayse', '10.0.0.1').status_code for _ in range(2)] == [200, 200]
+    response = _login(client, 'ayse', '10.0.0.1')
+    assert response.status_code == 429
+    assert 50 <= int(response.headers['Retry-After']) <= 60
+    assert 'Çok Fazla İstek' in response.get_data(as_text=True)
+
+    # JSON clients get the same answer as JSON
+    response = client.post('/login', json={}, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    assert response.status_code == 429 and response.get_json()['success'] is False
+
+
+def test_guesses_from_elsewhere_do_not_lock_a_member_out(limited):
+    attacker, member = limited.test_client(), limited.test_client()
+    for _ in range(3):
+        _login(attacker, 'ayse', '10.0.0.1')
+    assert _login(attacker, 'ayse', '10.0.0.1').status_code == 429
+    assert _login(member, 'ayse', '10.0.0.2', password=PASSWORD).status_code == 302
+
+
+def test_one_address_is_capped_across_accounts(limited):
+    client = limited.test_client()
+    for username in ('ayse', 'mehmet', 'ayse'):
+        assert _login(client, username, '10.0.0.1').status_code == 200
+    assert _login(client, 'mehmet', '10.0.0.1').status_code == 429
+    assert limited.extensions['rate_limiter'].stats()['limited'] >= 1
@@ -0,0 +1,68 @@
+import shutil
+import time
+import pytest
+from sqlalchemy import create_engine
+from conftest import login, make_user
+from app import create_app
+from cache import fragment_cache, user_cache
+from config import Config
+from migrations import upgrade
+from models import db, ForumPost
+from replicas import STICKY_KEY
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    """An app on a primary SQLite file whose replica copy has a different post title"""
+    primary, replica = tmp_path / 'primary.db', tmp_path / 'replica.db'
+
+    class ReplicaConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(primary)
+        DATABASE_REPLICA_URLS = ['sqlite:///' + str(replica)]
+        REPLICA_STICKY_SECONDS = 60
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+
+    app = create_app(ReplicaConfig)
+    fragment_cache.cache.local.clear()
+    user_cache.local.clear()
+    with app.app_context():
+        upgrade()
+        user = make_user('ayse')
+        db.session.add(ForumPost(user_id=user.id, title='Birincil başlık', content='İçerik'))
+        db.session.commit()
+        db.engine.dispose()
+        shutil.copy(primary, replica)
+        engine = create_engine('sqlite:///' + str(replica))
+        with engine.begin() as connection:
+            connection.exec_driver_sql("UPDATE forum_posts SET title = 'Kopya başlık'")
+        engine.dispose()
+    # Requests must get their own app context, and with it a fresh session
+    yield app
+    with app.app_context():
+        for engine in [*db.engines.values(), *app.extensions['replica_engines']]:
+            engine.dispose()
+
+
+def test_reads_go_to_the_replica_until_the_browser_writes(replicated):
+    client = replicated.test_client()
+    login(client, 'ayse')
+    assert 'Kopya başlık' in client.get('/forum/1').get_data(as_text=True)
+
+    response = client.post('/forum/1', data={'content': 'Katılıyorum'})
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        assert session[STICKY_KEY] > time.time()
+    assert 'Birincil başlık' in client.get('/forum/1').get_data(as_text=True)
+
+    with client.session_transaction() as session:
+        session[STICKY_KEY] = time.time() - 1
+    assert 'Kopya başlık' in client.get('/forum/1').get_data(as_text=True)
+
+
+def test_cached_fragments_are_rendered_from_the_primary(replicated):
+    client = replicated.test_client()
+    login(client, 'ayse')
+    page = client.get('/forum').get_data(as_text=True)
+    assert 'Birincil başlık' in page
+    assert 'Kopya başlık' not in page
@@ -0,0 +1,79 @@
+import io
+import socket
+import urllib.error
+import pytest
+import video_metadata
+from conftest import make_user
+from models import db, Video
+from video_metadata import DATA_API_URL, YouTubeMetadataClient, schedule_metadata_refresh
+
+
+@pytest.fixture
+def youtube(app, monkeypatch):
+    """Route metadata through YouTubeMetadataClient with `responses` in place of the network"""
+    app.config.update(VIDEO_METADATA_BACKEND='youtube', YOUTUBE_API_KEY='key')
+    monkeypatch.setattr(video_metadata.metadata_queue, 'retry_delay', 0)
+    responses = {DATA_API_URL: {'items': []}}
+
+    def get_json(self, url, params):
+        response = responses[DATA_API_URL if url == DATA_API_URL else 'oembed']
+        if isinstance(response, Exception):
+            raise response
+        return response
+    monkeypatch.setattr(YouTubeMetadataClient, '_get_json', get_json)
+    return responses
+
+
+def _video(**values):
+    user = make_user('ayse')
+    video = Video(user_id=user.id, youtube_url='https://youtu.be/dQw4w9WgXcQ', youtube_id='dQw4w9WgXcQ',
+                  title='Üyenin başlığı', **values)
+    db.session.add(video)
+    db.session.commit()
+    return video
+
+
+def _refresh(video):
+    schedule_metadata_refresh([video])
+    db.session.refresh(video)
+    return video
+
+
+def test_fetched_metadata_is_stored_and_stamped(youtube):
+    youtube['oembed'] = {'title': 'Never Gonna Give You Up', 'author_name': 'Rick Astley',
+                         'thumbnail_url': 'https://i.ytimg.com/vi/dQw4w9WgXcQ/hqdefault.jpg'}
+    youtube[DATA_API_URL] = {'items': [{'id': 'dQw4w9WgXcQ', 'contentDetails': {'duration': 'PT3M33S'}}]}
+    video = _refresh(_video())
+    assert (video.youtube_title, video.channel_name, video.duration_seconds) == \
+        ('Never Gonna Give You Up', 'Rick Astley', 213)
+    assert video.title == 'Üyenin başlığı'
+    assert video.metadata_fetched_at is not None
+
+
+def test_missing_title_keeps_the_one_fetched_before(youtube):
+    youtube['oembed'] = {'title': '', 'author_name': 'Rick Astley'}
+    video = _refresh(_video(youtube_title='Önceki başlık'))
+    assert (video.youtube_title, video.channel_name) == ('Önceki başlık', 'Rick Astley')
+    assert video.metadata_fetched_at is not None
+
+
+def test_unavailable_video_is_stamped_and_left_as_it_was(youtube):
+    youtube['oembed'] = urllib.error.HTTPError('oembed', 404, 'Not Found', {}, io.BytesIO())
+    video = _refresh(_video())
+    assert video.youtube_title is None
+    assert video.metadata_fetched_at is not None
+
+
+@pytest.mark.parametrize('error', [
+    urllib.error.HTTPError('oembed', 503, 'Service Unavailable', {}, io.BytesIO()),
+    urllib.error.URLError(socket.timeout('timed out')),
+    socket.timeout('timed out'),
+])
+def test_failed_fetch_is_retried_on_a_later_render(youtube, error):
+    youtube['oembed'] = error
+    video = _refresh(_video())
+    assert video.youtube_title is None
+    assert video.metadata_fetched_at is None
+
+    youtube['oembed'] = {'title': 'Never Gonna Give You Up', 'author_name': 'Rick Astley'}
+    assert _refresh(video).youtube_title == 'Never Gonna Give You Up'
@@ -1,44 +1,76 @@
 import os
 import re
-import cloudinary
-import cloudinary.uploader
-from PIL import Image
+from PIL import Image, ImageOps
 from werkzeug.utils import secure_filename
 from config import Config
 
+# Fold Turkish letters to their ASCII base so "İsmail", "ismail" and "Ismail"
+# (or "Şahin" and "sahin") compare equal in search keys
+TURKISH_FOLD = str.maketrans({
+    'İ': 'i', 'I': 'i', 'ı': 'i', 'Ş': 's', 'ş': 's', 'Ğ': 'g', 'ğ': 'g',
+    'Ü': 'u', 'ü': 'u', 'Ö': 'o', 'ö': 'o', 'Ç': 'c', 'ç': 'c',
+    'Â': 'a', 'â': 'a', 'Î': 'i', 'î': 'i', 'Û': 'u', 'û': 'u',
+})
+
+def fold_turkish(text):
+    """Lowercase and strip Turkish diacritics for search matching"""
+    if not text:
+        return ''
+    return text.translate(TURKISH_FOLD).lower()
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
 
-def save_uploaded_file(file, folder="profile_photos"):
-    """Upload file to Cloudinary and return public_id"""
-    if not file:
-        print("Error: No file provided")
-        return None
-        
-    if not allowed_file(file.filename):
-        print(f"Error: File extension not allowed for {file.filename}")
-        return None
-        
-    try:
-        # Upload to Cloudinary
-        result = cloudinary.uploader.upload(
-            file,
-            folder=folder,
-            transformation=[
-                {'width': 800, 'height': 800, 'crop': 'limit'},
-                {'quality': 'auto'}
-            ]
-        )
-        # Return the public_id (Cloudinary's unique identifier)
-        print(f"Successfully uploaded to Cloudinary: {result['public_id']}")
-        return result['public_id']
-    except Exception as e:
-        print(f"Error uploading to Cloudinary: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return None
+class ProcessedImage:
+    """Result of process_image: file paths plus the final pixel size"""
+
+    def __init__(self, path, thumbnail_path, width, height):
+        self.path = path
+        self.thumbnail_path = thumbnail_path
+        self.width = width
+        self.height = height
+
+def process_image(path, max_size=800, thumbnail_size=None):
+    """Downscale, orient and strip metadata from an image file before upload.
+
+    The file is decoded once: for JPEGs draft() lets libjpeg decode straight
+    at a reduced scale, and thumbnail() with a reducing gap uses reduce()
+    before the final resample. New files are written next to `path`; the
+    WebP thumbnail is only made when `thumbnail_size` is given.
+    """
+    base = os.path.splitext(path)[0]
+    with Image.open(path) as image:
+        source_format = image.format
+        if getattr(image, 'is_animated', False):
+            # Keep animated GIFs as they are; only the first frame is thumbnailed
+            processed_path = path
+            image.seek(0)
+            frame = image.convert('RGBA')
+            width, height = image.size
+        else:
+            image.draft('RGB', (max_size, max_size))
+            frame = ImageOps.exif_transpose(image)
+            frame.thumbnail((max_size, max_size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            width, height = frame.size
+            
+            # Saving a fresh image without `exif`/`pnginfo` drops the metadata
+            if source_format == 'JPEG' or frame.mode not in ('RGBA', 'LA', 'P'):
+                processed_path = base + '_processed.jpg'
+                frame.convert('RGB').save(processed_path, 'JPEG', quality=85, optimize=True, progressive=True)
+            else:
+                processed_path = base + '_processed.png'
+                frame.save(processed_path, 'PNG', optimize=True)
+
+        thumbnail_path = None
+        if thumbnail_size:
+            thumbnail_path = base + '_thumb.webp'
+            ImageOps.fit(frame, tuple(thumbnail_size), Image.Resampling.LANCZOS).save(
+                thumbnail_path, 'WEBP', quality=80, method=4
+            )
+
+    return ProcessedImage(processed_path, thumbnail_path, width, height)
 
 def extract_youtube_id(url):
     """Extract YouTube video ID from URL"""
@@ -0,0 +1,172 @@
+import json
+import re
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from config import Config
+from models import db, Video
+from tasks import TaskQueue
+from cache import invalidate_fragments
+
+# One fetcher per process; each batch fans out over a small thread pool
+metadata_queue = TaskQueue(
+    'video-metadata',
+    workers=1,
+    maxsize=Config.UPLOAD_QUEUE_SIZE,
+    max_retries=2,
+    retry_delay=Config.UPLOAD_RETRY_DELAY
+)
+
+THUMBNAIL_URL = 'https://i.ytimg.com/vi/{}/hqdefault.jpg'
+DATA_API_URL = 'https://www.googleapis.com/youtube/v3/videos'
+# YouTube Data API limit for ids in one videos.list call
+API_BATCH_SIZE = 50
+OEMBED_CONCURRENCY = 4
+
+_ISO_DURATION = re.compile(r'^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+
+# Video ids queued or being fetched in this process, so concurrent page
+# renders do not queue the same videos twice
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def parse_duration(value):
+    """Seconds in an ISO 8601 duration such as PT1H2M3S, or None"""
+    match = _ISO_DURATION.match(value or '')
+    if not match:
+        return None
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+class YouTubeMetadataClient:
+    """Title, channel and thumbnail from oEmbed; durations from the Data API when a key is set"""
+
+    def __init__(self, oembed_url, api_key=None, timeout=5):
+        self.oembed_url = oembed_url
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def _get_json(self, url, params):
+        with urllib.request.urlopen(f'{url}?{urllib.parse.urlencode(params)}', timeout=self.timeout) as response:
+            return json.load(response)
+
+    def _oembed(self, youtube_id):
+        try:
+            data = self._get_json(self.oembed_url, {
+                'url': f'https://www.youtube.com/watch?v={youtube_id}', 'format': 'json'
+            })
+        except urllib.error.HTTPError as error:
+            # Removed, private or not embeddable: nothing to fetch, retrying will not help
+            if error.code in (401, 403, 404):
+                return None
+            raise
+        return {
+            'youtube_title': (data.get('title') or '')[:200] or None,
+            'channel_name': (data.get('author_name') or '')[:200] or None,
+            'thumbnail_url': data.get('thumbnail_url'),
+        }
+
+    def _durations(self, youtube_ids):
+        durations = {}
+        for start in range(0, len(youtube_ids), API_BATCH_SIZE):
+            data = self._get_json(DATA_API_URL, {
+                'part': 'contentDetails', 'id': ','.join(youtube_ids[start:start + API_BATCH_SIZE]), 'key': self.api_key
+            })
+            for item in data.get('items', []):
+                durations[item['id']] = parse_duration(item.get('contentDetails', {}).get('duration'))
+        return durations
+
+    def fetch(self, youtube_ids):
+        """Metadata dicts keyed by YouTube id; unavailable videos map to None"""
+        with ThreadPoolExecutor(max_workers=min(OEMBED_CONCURRENCY, len(youtube_ids))) as pool:
+            metadata = dict(zip(youtube_ids, pool.map(self._oembed, youtube_ids)))
+        if self.api_key:
+            for youtube_id, duration in self._durations(youtube_ids).items():
+                if metadata.get(youtube_id) is not None:
+                    metadata[youtube_id]['duration_seconds'] = duration
+        return metadata
+
+
+class StubMetadataClient:
+    """Offline stand-in for YouTube returning deterministic metadata"""
+
+    def fetch(self, youtube_ids):
+        return {
+            youtube_id: {
+                'youtube_title': f'YouTube {youtube_id}',
+                'channel_name': 'SABİS',
+                'thumbnail_url': THUMBNAIL_URL.format(youtube_id),
+                'duration_seconds': 30 + zlib.crc32(youtube_id.encode()) % 900,
+            }
+            for youtube_id in youtube_ids
+        }
+
+
+def get_metadata_client():
+    config = current_app.config
+    if config['VIDEO_METADATA_BACKEND'] == 'stub':
+        return StubMetadataClient()
+    return YouTubeMetadataClient(config['YOUTUBE_OEMBED_URL'], config['YOUTUBE_API_KEY'],
+                                 timeout=config['VIDEO_METADATA_TIMEOUT'])
+
+
+def _release(video_ids):
+    with _pending_lock:
+        _pending.difference_update(video_ids)
+
+
+def schedule_metadata_refresh(videos):
+    """Fetch metadata in the background for videos never enriched or older than VIDEO_METADATA_TTL.
+
+    Called while rendering a page of videos, so metadata is refreshed lazily,
+    only for videos someone looks at. Returns the number of videos queued.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['VIDEO_METADATA_TTL'])
+    with _pending_lock:
+        stale = [video.id for video in videos
+                 if (video.metadata_fetched_at is None or video.metadata_fetched_at < cutoff)
+                 and video.id not in _pending]
+        _pending.update(stale)
+
+    app = current_app._get_current_object()
+    size = app.config['VIDEO_METADATA_BATCH_SIZE']
+    queued = 0
+    for start in range(0, len(stale), size):
+        batch = stale[start:start + size]
+        if app.config['TASKS_EAGER']:
+            metadata_queue.run(_refresh_metadata, app, batch, on_failure=_refresh_failed)
+        elif not metadata_queue.submit(_refresh_metadata, app, batch, on_failure=_refresh_failed):
+            # Queue full: the next render of the page tries again
+            _release(batch)
+            continue
+        queued += len(batch)
+    return queued
+
+
+def _refresh_metadata(app, video_ids):
+    with app.app_context():
+        videos = Video.query.filter(Video.id.in_(video_ids)).all()
+        if videos:
+            metadata = get_metadata_client().fetch(sorted({video.youtube_id for video in videos}))
+            now = datetime.utcnow()
+            for video in videos:
+                for name, value in (metadata.get(video.youtube_id) or {}).items():
+                    if value is not None:
+                        setattr(video, name, value)
+                # Unavailable videos are stamped too and tried again after the TTL
+                video.metadata_fetched_at = now
+            invalidate_fragments(db.session, 'videos')
+            db.session.commit()
+    _release(video_ids)
+
+
+def _refresh_failed(app, video_ids):
+    # Left unstamped: the next render of the page queues them again
+    _release(video_ids)